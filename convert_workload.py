@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+
+'''
+Convert workload files between the JSON formats (indented or one request per
+line) and the compact binary format of sim.workload.write_binary_workload.
+The direction is chosen by the format of the input file.
+'''
+
+import argparse
+
+from sim.workload import binary_to_json_workload, is_binary_workload, \
+    json_to_binary_workload
+
+parser = argparse.ArgumentParser()
+parser.add_argument('input',
+                    help="input workload file")
+parser.add_argument('output',
+                    help="output workload file")
+parser.add_argument('--lines', '-l',
+                    help="write JSON output with one request per line",
+                    action="store_true",
+                    default=False,
+                    dest="lines")
+args = parser.parse_args()
+
+
+def main():
+    if is_binary_workload(args.input):
+        binary_to_json_workload(args.input, args.output, lines=args.lines)
+    else:
+        json_to_binary_workload(args.input, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,8 @@ Output: column-formatted text
 '''
 
 import argparse
-import json
+
+import plot_helper as ph
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--verbose', '-v',
@@ -44,10 +45,7 @@ args = parser.parse_args()
 def main():
     metrics = []
     for filename in args.files:
-        ff = open(filename, 'r')
-        j = json.loads("".join(ff.readlines()).strip())
-        metrics.append((filename,j))
-        ff.close()
+        metrics.append((filename, ph.load_metrics(filename)))
 
     if args.rmse:
         convert_rmse_to_columns(metrics)
@@ -108,12 +106,13 @@ def convert_pnview_to_columns(metrics):
         print "Error: PNView can only accept a single file as input"
         return
     for filename, m in metrics:
-        pn_view= [ i['pn_view'] for i in m["simulation_trace"]]
+        trace = m["simulation_trace"]
+        capacity = trace['header']['capacity']
         # handle the first row by putting titles in the columns
-        links = pn_view[0]
-        print "#"+" ".join(["-".join([str(v[1]),str(v[2])]) for v in links])
-        for links in pn_view:
-            print " ".join([str(v[0]) for v in links])
+        links = trace['header']['links']
+        print "#"+" ".join(["-".join([str(s),str(d)]) for (s,d) in links])
+        for used in trace['columns']['pn_view_raw']:
+            print " ".join([str(u/c) for (u,c) in zip(used, capacity)])
 
 if __name__ == '__main__':
     main()
@@ -10,7 +10,6 @@ Output: timeseries
 
 import plot_defaults
 import argparse
-import json
 import matplotlib.pyplot as plt
 import plot_helper as ph
 
@@ -40,10 +39,7 @@ def main():
     elif args.files:
         metrics = []
         for filename in args.files:
-            ff = open(filename, 'r')
-            j = json.loads("".join(ff.readlines()).strip())
-            metrics.append((filename,j))
-            ff.close()
+            metrics.append((filename, ph.load_metrics(filename)))
         plot_rmse_timeseries(metrics, saveplot=args.savefig)
         plot_state_distances_timeseries(metrics, saveplot=args.savefig)
         plot_rmse_boxplot(metrics, saveplot=args.savefig)
@@ -59,21 +55,7 @@ def plot_state_distances_timeseries(metrics, saveplot=False):
         d_c0_pn = [ b for (a,b,c) in m["state_distances"]]
         d_c1_pn = [ c for (a,b,c) in m["state_distances"]]
         trace = m["simulation_trace"]
-        ingress = [ i['ingress'] for i in trace ]
-        ingress_switches = {}
-        ingress_switch_vals = {}
-        # collect all switches which show ingress at some point
-        for i in ingress:
-            for k,v in i.iteritems():
-               ingress_switches.setdefault(k,[])
-
-        for i in ingress:
-            for switch in ingress_switches.keys():
-                if switch in i.keys():
-                    value = i[switch]
-                else:
-                    value = 0
-                ingress_switch_vals.setdefault(switch,[]).append(value)
+        ingress_switch_vals = ph.ingress_by_switch(trace)
 
         plt.plot(range(len(d_nos)), d_nos, fgen.next()+'-', label="d_nos"+str(filename), color=cgen.next())
 
@@ -112,21 +94,7 @@ def plot_rmse_timeseries(metrics, saveplot=False):
         d_nos = [ a for (a,b,c) in m["state_distances"]]
         rmsesrv = m["rmse_servers"]
         trace = m["simulation_trace"]
-        ingress = [ i['ingress'] for i in trace ]
-        ingress_switches = {}
-        ingress_switch_vals = {}
-        # collect all switches which show ingress at some point
-        for i in ingress:
-            for k,v in i.iteritems():
-               ingress_switches.setdefault(k,[])
-
-        for i in ingress:
-            for switch in ingress_switches.keys():
-                if switch in i.keys():
-                    value = i[switch]
-                else:
-                    value = 0
-                ingress_switch_vals.setdefault(switch,[]).append(value)
+        ingress_switch_vals = ph.ingress_by_switch(trace)
 
         for k, v in ingress_switch_vals.iteritems():
             plt.plot(range(len(v)), v, fgen.next()+'--', label="units wkload ingress at " + k, color=cgen.next())
@@ -150,21 +118,7 @@ def plot_rmse_boxplot(metrics, saveplot=False):
     for filename, m in metrics:
         data.append(m["rmse_servers"])
         trace = m["simulation_trace"]
-        ingress = [ i['ingress'] for i in trace ]
-        ingress_switches = {}
-        ingress_switch_vals = {}
-        # collect all switches which show ingress at some point
-        for i in ingress:
-            for k,v in i.iteritems():
-               ingress_switches.setdefault(k,[])
-
-        for i in ingress:
-            for switch in ingress_switches.keys():
-                if switch in i.keys():
-                    value = i[switch]
-                else:
-                    value = 0
-                ingress_switch_vals.setdefault(switch,[]).append(value)
+        ingress_switch_vals = ph.ingress_by_switch(trace)
 
 
     plt.boxplot(data)
@@ -187,21 +141,7 @@ def plot_rmse_boxplot(metrics, saveplot=False):
     for filename, m in metrics:
         data.append(m["rmse_servers"])
         trace = m["simulation_trace"]
-        ingress = [ i['ingress'] for i in trace ]
-        ingress_switches = {}
-        ingress_switch_vals = {}
-        # collect all switches which show ingress at some point
-        for i in ingress:
-            for k,v in i.iteritems():
-               ingress_switches.setdefault(k,[])
-
-        for i in ingress:
-            for switch in ingress_switches.keys():
-                if switch in i.keys():
-                    value = i[switch]
-                else:
-                    value = 0
-                ingress_switch_vals.setdefault(switch,[]).append(value)
+        ingress_switch_vals = ph.ingress_by_switch(trace)
 
 
     plt.boxplot(data)
@@ -7,6 +7,11 @@ import math
 import matplotlib as m
 import os
 import random
+import sys
+
+# The simulator package lives in the parent directory of the plot scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sim.metrics_writer import read_metrics
 
 if os.uname()[0] == "Darwin":
     m.use("MacOSX")
@@ -23,6 +28,13 @@ def write_dummy_data():
     print >>f, json.dumps(d)
     f.close()
 
+def load_metrics(filename):
+    """
+    Read a .metrics file as written by the simulator, see read_metrics, with
+    simulation_trace in its columnar JSON form
+    """
+    return read_metrics(filename, traces=False)
+
 def ewma(alpha, values):
     """Exponential Weighted Moving Average"""
     if alpha == 0:
@@ -98,6 +110,20 @@ def pc99(lst):
 def coeff_variation(lst):
     return stdev(lst) / avg(lst)
 
+def ingress_by_switch(trace):
+    """
+    Return a dict of each switch which shows ingress at some point to its
+    ingress timeseries, from a simulation_trace in columnar format
+    """
+    switches = trace['header']['switches']
+    ingress = trace['columns']['ingress']
+    ret = {}
+    for j, switch in enumerate(switches):
+        values = [row[j] for row in ingress]
+        if any(values):
+            ret[switch] = values
+    return ret
+
 def fmtGenerator():
     "Return cycling list of formats"
     colors = [ 'o', 'D', 'h', 'p', '^', 
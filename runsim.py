@@ -7,7 +7,11 @@ import logging
 import logging.config
 from math import log
 #import plot #automatically plot selected ouputs directly after running
-from sim.simulation import LinkBalancerSim
+from sim.log import TRACE_SUBSYSTEMS, setTracing
+from sim.simulation import LinkBalancerSim, METRICS
+from sim.sweep import SweepCache, config_hash, file_hash, is_shared, \
+    run_sweep, share, shared_value
+from sim.sync import SYNC_TOPOLOGIES
 from sim.workload import dual_offset_workload, sawtooth, wave, expo_workload
 import sys
 from test.test_helper import two_ctrls, two_separate_state_ctrls, two_random_ctrls, two_greedy_ctrls, two_switch_topo, strictly_local_ctrls
@@ -43,6 +47,81 @@ parser.add_argument('--alpha-sslbc', '-a',
                     type=float,
                     default=0.3,
                     dest="sslbc_alpha")
+parser.add_argument('--event-driven', '-e',
+                    help="use the discrete-event simulation engine",
+                    action="store_true",
+                    default=False,
+                    dest="event_driven")
+parser.add_argument('--batch', '-b',
+                    help="process the arrivals of each timestep as one batch "
+                         "against a single controller state refresh",
+                    action="store_true",
+                    default=False,
+                    dest="batch")
+parser.add_argument('--expiry-width',
+                    help="keep active flows in a calendar queue with buckets "
+                         "of this width instead of a heap",
+                    action="store",
+                    type=float,
+                    default=None,
+                    dest="expiry_width")
+parser.add_argument('--trace',
+                    help="enable debug traces of simulator subsystems (%s, or all)"
+                         % ", ".join(TRACE_SUBSYSTEMS),
+                    action="store",
+                    nargs='+',
+                    default=[],
+                    dest="trace")
+parser.add_argument('--metrics', '-m',
+                    help="metrics to collect (default: all of %s)"
+                         % ", ".join(METRICS),
+                    action="store",
+                    nargs='+',
+                    default=None,
+                    dest="metrics")
+parser.add_argument('--metric-interval', '-i',
+                    help="sample a metric only every k ticks, as metric=k",
+                    action="store",
+                    nargs='+',
+                    default=[],
+                    dest="metric_intervals")
+parser.add_argument('--processes', '-j',
+                    help="number of simulations run in parallel",
+                    action="store",
+                    type=int,
+                    default=1,
+                    dest="processes")
+parser.add_argument('--force', '-f',
+                    help="rerun simulations whose results are cached in logs/",
+                    action="store_true",
+                    default=False,
+                    dest="force")
+parser.add_argument('--sync-topology',
+                    help="which controllers push state to which in a sync",
+                    action="store",
+                    choices=SYNC_TOPOLOGIES,
+                    default='all',
+                    dest="sync_topology")
+parser.add_argument('--sync-fanout',
+                    help="children per node of the tree topology, peers per "
+                         "controller of the gossip topology",
+                    action="store",
+                    type=int,
+                    default=None,
+                    dest="sync_fanout")
+parser.add_argument('--pair-period',
+                    help="sync period of a pair of controllers of the pairwise "
+                         "topology, as src:dst=period (e.g. c0:c1=4)",
+                    action="store",
+                    nargs='+',
+                    default=[],
+                    dest="pair_periods")
+parser.add_argument('--seed',
+                    help="seed of generated workloads",
+                    action="store",
+                    type=int,
+                    default=0,
+                    dest="seed")
 
 #parser.add_argument('--workloads', '-w',
 
@@ -53,11 +132,35 @@ parser.add_argument('--alpha-sslbc', '-a',
 #                    dest="timesteps")
 args = parser.parse_args()
 
+metric_intervals = {}
+for interval in args.metric_intervals:
+    metric, k = interval.split('=')
+    metric_intervals[metric] = int(k)
+
+# Arguments of sim.sync.sync_scheduler, as stored in job configs
+sync = {'topology': args.sync_topology}
+if args.sync_fanout is not None:
+    sync['fanout'] = args.sync_fanout
+if args.sync_topology == 'gossip':
+    sync['seed'] = args.seed
+if args.pair_periods:
+    periods = []
+    for pair_period in args.pair_periods:
+        pair, period = pair_period.split('=')
+        src, dst = pair.split(':')
+        periods.append([src, dst, float(period)])
+    sync['periods'] = periods
+
 
 
 
 logging.config.fileConfig('setup.cfg')
 logger= logging.getLogger(__name__)
+if args.trace:
+    setTracing(args.trace)
+    # Traces are logged at DEBUG level
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.DEBUG)
 
 def main():
     sp = args.syncperiods
@@ -66,14 +169,16 @@ def main():
     print "Timesteps = %d" % (timesteps)
     print "Sync Periods = %s" % (str(sp))
     print "SSLBC Alpha = %f\n" % (sa)
+    cache = SweepCache('logs', force=args.force)
+    jobs = []
     for demand in args.demands:
         demand = int(demand)
         for staleness in args.stalenesses:
             staleness = float(staleness)
-            sync_improves_metric(max_demand=demand, sa=sa, sync_periods=sp, timesteps=timesteps, workload_name='expo', ctrl_name='separate', staleness=staleness)
-            sync_improves_metric(max_demand=demand, sa=sa, sync_periods=sp, timesteps=timesteps, workload_name='expo', ctrl_name='lbc', staleness=staleness)
-            sync_improves_metric(max_demand=demand, sa=sa, sync_periods=sp, timesteps=timesteps, workload_name='wave', ctrl_name='lbc', staleness=staleness)
-            sync_improves_metric(max_demand=demand, sa=sa, sync_periods=sp, timesteps=timesteps, workload_name='wave', ctrl_name='separate', staleness=staleness)
+            for workload_name, ctrl_name in [('expo', 'separate'), ('expo', 'lbc'),
+                                             ('wave', 'lbc'), ('wave', 'separate')]:
+                jobs.extend(sync_improves_metric_jobs(max_demand=demand, sa=sa, sync_periods=sp, timesteps=timesteps, workload_name=workload_name, ctrl_name=ctrl_name, staleness=staleness, event_driven=args.event_driven, seed=args.seed, metrics=args.metrics, metric_intervals=metric_intervals, sync=sync, batch=args.batch, expiry_width=args.expiry_width))
+    run_sweep(jobs, run_sync_job, processes=args.processes, cache=cache)
 #        for greedylimit in [0,0.25,0.5,0.75,1]:
 #            compare_greedy_dist_to_centralized(max_demand=demand, greedylimit=greedylimit)
 #    synced_dist_equals_central()
@@ -82,7 +187,10 @@ def main():
 
 
 def sync_improves_metric(max_demand, sync_periods, timesteps, workload_name,
-        ctrl_name, name=None, sa=0.3, ia=10, shape=0.5,  show_graph=False, staleness=0):
+        ctrl_name, name=None, sa=0.3, ia=10, shape=0.5,  show_graph=False, staleness=0,
+        event_driven=False, seed=None, metrics=None, metric_intervals=None,
+        processes=None, cache=None, sync=None, batch=False,
+        expiry_width=None):
     """Evalute the value of synchronization for a LinkBalanerCtrl by showing
     its effect on performance metric. We expect that for a workload which
     imparts server link imbalance across multiple domains, syncing will help
@@ -96,11 +204,89 @@ def sync_improves_metric(max_demand, sync_periods, timesteps, workload_name,
     random.expovariate(ia)
 
     shape: the weibull distribution shape parameter for flow duration
+
+    event_driven: use the discrete-event engine (LinkBalancerSim.run_events)
+
+    seed: seed of the expo workload if it has to be generated
+
+    metrics, metric_intervals: metrics to collect and their sampling
+    intervals, see LinkBalancerSim.select_metrics
+
+    sync: dict of arguments of sim.sync.sync_scheduler choosing which
+    controllers push state to which in a sync (default: all-to-all)
+
+    batch: process the arrivals of each timestep as one batch, see
+    LinkBalancerSim.run
+
+    expiry_width: keep active flows in a calendar queue with buckets of this
+    width, see ResourceAllocator.use_flow_calendar
+
+    processes: number of sync periods simulated in parallel, see run_sweep
+
+    cache: SweepCache skipping the sync periods whose results are cached
+    """
+    jobs = sync_improves_metric_jobs(max_demand, sync_periods, timesteps,
+                                     workload_name, ctrl_name, name=name,
+                                     sa=sa, ia=ia, shape=shape,
+                                     show_graph=show_graph,
+                                     staleness=staleness,
+                                     event_driven=event_driven, seed=seed,
+                                     metrics=metrics,
+                                     metric_intervals=metric_intervals,
+                                     sync=sync, batch=batch,
+                                     expiry_width=expiry_width)
+    run_sweep(jobs, run_sync_job, processes=processes, cache=cache)
+
+
+def sync_improves_metric_jobs(max_demand, sync_periods, timesteps,
+        workload_name, ctrl_name, name=None, sa=0.3, ia=10, shape=0.5,
+        show_graph=False, staleness=0, event_driven=False, seed=None,
+        metrics=None, metric_intervals=None, sync=None, batch=False,
+        expiry_width=None):
+    """Return the jobs of sync_improves_metric, one per sync period, for
+    run_sync_job. The workload is built here and shared with the jobs (see
+    sim.sweep.share), so every job and worker process replays the same one.
     """
 
     if name == None:
-        name = sys._getframe().f_code.co_name + "_" + ctrl_name + "_" + workload_name
-
+        name = "sync_improves_metric_" + ctrl_name + "_" + workload_name
+        if sync and sync.get('topology', 'all') != 'all':
+            name += "_" + sync['topology']
+
+    # The simulation reads the workload without modifying it, so one workload
+    # is replayed for every sync period
+    if workload_name == 'expo':
+        wave_period = timesteps/4
+        old_style=False
+        filename = 'expo.workload'
+        workload_args = {'switches': ['sw1', 'sw2'], 'period': wave_period,
+                         'interarrival_alpha': ia, 'duration_shape': shape,
+                         'timesteps': timesteps, 'seed': seed,
+                         'filename': filename}
+        workload_key = ('expo', config_hash(workload_args))
+        if not is_shared(workload_key):
+            share(workload_key, expo_workload(columnar=True, **workload_args))
+        # Describe the workload actually replayed, so a cached result is only
+        # reused for the same workload: expo_workload may read an existing
+        # file, e.g. for seed None one generated with any seed
+        workload_desc = {'filename': filename, 'sha1': file_hash(filename)}
+    elif workload_name == 'wave':
+        old_style=True
+        wave_period = timesteps/4
+        workload_args = {'switches': ['sw1', 'sw2'], 'period': wave_period,
+                         'offset': wave_period/2.0, 'max_demand': max_demand,
+                         'size': 1, 'duration': 2, 'timesteps': timesteps,
+                         'y_shift': (1.0/3)}
+        workload_desc = workload_args
+        workload_key = ('wave', max_demand, timesteps)
+        if not is_shared(workload_key):
+            share(workload_key, dual_offset_workload(workload_fcn=wave,
+                                                     **workload_args))
+    else: 
+        assert "No Valid Workload Specified"
+
+    topo = two_switch_topo()
+    jobs = []
     #for sync_period in [0] + [2**(x) for x in range(0, int(log(timesteps,2)))]:
     for sync_period in sync_periods:
 
@@ -109,38 +295,76 @@ def sync_improves_metric(max_demand, sync_periods, timesteps, workload_name,
                                                "b": max_demand,
                                                "c": sync_period,
                                                "d": staleness}
-
-        logger.info("starting %s", myname)
-
-        if workload_name == 'expo':
-            wave_period = timesteps/4
-            old_style=False
-            workload = expo_workload(switches=['sw1', 'sw2'],
-                                     period=wave_period, interarrival_alpha=ia,
-                                     duration_shape=shape, timesteps=timesteps)
-        elif workload_name == 'wave':
-            old_style=True
-            wave_period = timesteps/4
-            workload = dual_offset_workload(switches=['sw1', 'sw2'],
-                                            period=wave_period, offset=wave_period/2.0,
-                                            max_demand=max_demand, size=1,
-                                            duration=2, timesteps=timesteps,
-                                            workload_fcn=wave, y_shift=(1.0/3))
-        else: 
-            assert "No Valid Workload Specified"
-
-        if ctrl_name == 'separate':
-            ctrls = two_separate_state_ctrls(alpha=sa)
-        elif ctrl_name == 'lbc':
-            ctrls = two_ctrls()
-        else:
-            assert "No Valid Controller Specified"
-
-        sim = LinkBalancerSim(two_switch_topo(), ctrls)
-        sim.run_and_trace(myname, workload, old=old_style, sync_period=sync_period,
-                          show_graph=show_graph, staleness=staleness,
-                          ignore_remaining=True)
-        logger.info("ending %s", myname)
+        job = {'name': myname, 'workload': workload_key,
+               'old': old_style, 'ctrl_name': ctrl_name, 'sa': sa,
+               'sync_period': sync_period, 'staleness': staleness,
+               'show_graph': show_graph, 'event_driven': event_driven,
+               'metrics': metrics, 'metric_intervals': metric_intervals,
+               'sync': sync, 'batch': batch, 'expiry_width': expiry_width}
+        # Everything that determines the results of the job, see SweepCache
+        job['config'] = {
+            'topology': {'nodes': sorted(topo.nodes(data=True)),
+                         'edges': sorted(topo.edges(data=True))},
+            'ctrls': describe_ctrls(sync_job_ctrls(job)),
+            'workload': {'name': workload_name, 'args': workload_desc},
+            'sync_period': sync_period, 'staleness': staleness,
+            'timesteps': timesteps, 'old': old_style,
+            'event_driven': event_driven, 'metrics': metrics,
+            'metric_intervals': metric_intervals, 'sync': sync,
+            'batch': batch, 'expiry_width': expiry_width}
+        jobs.append(job)
+    return jobs
+
+
+def sync_job_ctrls(job):
+    """Return the controllers of a job of sync_improves_metric_jobs"""
+    ctrl_name = job['ctrl_name']
+    if ctrl_name == 'separate':
+        return two_separate_state_ctrls(alpha=job['sa'])
+    elif ctrl_name == 'lbc':
+        return two_ctrls()
+    else:
+        assert "No Valid Controller Specified"
+
+
+def describe_ctrls(ctrls):
+    """Return the class and parameters of each controller, for job configs"""
+    params = ['switches', 'servers', 'alpha', 'greedylimit']
+    return [dict([('class', ctrl.__class__.__name__)] +
+                 [(p, getattr(ctrl, p)) for p in params if hasattr(ctrl, p)])
+            for ctrl in ctrls]
+
+
+def job_sync(job):
+    """
+    Return the arguments of sim.sync.sync_scheduler for a job of
+    sync_improves_metric_jobs, or None for the default all-to-all sync
+    """
+    sync = job.get('sync')
+    if not sync:
+        return None
+    sync = dict(sync)
+    if 'periods' in sync:
+        sync['periods'] = dict(((src, dst), period)
+                               for src, dst, period in sync['periods'])
+    return sync
+
+
+def run_sync_job(job):
+    """Simulate a single job of sync_improves_metric_jobs"""
+    myname = job['name']
+    logger.info("starting %s", myname)
+
+    sim = LinkBalancerSim(two_switch_topo(), sync_job_ctrls(job),
+                          expiry_width=job.get('expiry_width'))
+    sim.run_and_trace(myname, shared_value(job['workload']), old=job['old'],
+                      sync_period=job['sync_period'],
+                      show_graph=job['show_graph'], staleness=job['staleness'],
+                      ignore_remaining=True, event_driven=job['event_driven'],
+                      return_metrics=False, metrics=job['metrics'],
+                      metric_intervals=job['metric_intervals'],
+                      sync=job_sync(job), batch=job.get('batch', False))
+    logger.info("ending %s", myname)
 
 
 
@@ -288,7 +512,7 @@ def synced_dist_equals_central(period=64, max_demand=4, show_graph=False):
         ctrls = two_ctrls()
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         sim.run_and_trace(myname+str(sync_period), workload, old=True, sync_period=sync_period,
-                          show_graph=show_graph)
+                          show_graph=show_graph, return_metrics=False)
         logger.info("ending %s", myname)
 
 def compare_random_dist_to_centralized(period=64, max_demand=8, show_graph=False):
@@ -306,7 +530,7 @@ def compare_random_dist_to_centralized(period=64, max_demand=8, show_graph=False
         ctrls = two_random_ctrls()
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         sim.run_and_trace(myname, workload, old=True, sync_period=sync_period,
-                          show_graph=show_graph)
+                          show_graph=show_graph, return_metrics=False)
         logger.info("ending %s", myname)
 
    
@@ -334,7 +558,7 @@ def compare_greedy_dist_to_centralized(period=64, max_demand=30,
         ctrls = two_greedy_ctrls(greedylimit=greedylimit)
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         sim.run_and_trace(myname, workload, old=True, sync_period=sync_period,
-                          show_graph=show_graph)
+                          show_graph=show_graph, return_metrics=False)
         logger.info("ending %s", myname)
 
 
@@ -364,7 +588,7 @@ def demo_strictly_local_ctrls(max_demand=8, show_graph=False):
         ctrls = strictly_local_ctrls()
         sim = LinkBalancerSim(two_switch_topo(), ctrls)
         sim.run_and_trace(myname, workload, old=True, sync_period=sync_period,
-                          show_graph=show_graph)
+                          show_graph=show_graph, return_metrics=False)
         logger.info("ending %s", myname)
 
 
@@ -5,14 +5,19 @@
 
 import logging
 from random import choice
-import sys
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 
+from link_table import LinkHistory, remove_dirty_set
+from log import getTracer
 from resource_allocator import ResourceAllocator
 
 logger = logging.getLogger(__name__)
+trace = getTracer('controller')
+sync_trace = getTracer('sync')
+ss_trace = getTracer('separate')
 
 class Controller(ResourceAllocator):
     """
@@ -29,6 +34,13 @@ class Controller(ResourceAllocator):
         mylinks: a list of links in the self.graph which are goverend by
         this controller, inferred from switches
         active_flows: used to track the (timeout, path) of all active flows
+        srv_paths: cache of server paths per (ingress switch, local), see
+        get_srv_paths
+        path_batches: compiled link matrices of the cached server paths per
+        (ingress switch, local), see get_path_batch
+        sync_state: links changed since the last sync toward each other
+        controller, see links_to_sync
+        poll_state: links changed since the last poll, see update_my_state
         """
         self.switches = sw
         self.servers = srv
@@ -39,6 +51,9 @@ class Controller(ResourceAllocator):
         # Inferred from graph
         self.localservers = []
         self.mylinks = []
+        self.sync_state = {}
+        self.poll_state = None
+        self.invalidate_srv_paths()
 
     def __str__(self):
         return "Controller %s of: %s" % (self.name, str(self.switches))
@@ -47,7 +62,19 @@ class Controller(ResourceAllocator):
         self.name = name
 
     def set_graph(self, graph):
-        self.name = graph
+        self.graph = graph
+        self.invalidate_srv_paths()
+
+    def invalidate_srv_paths(self):
+        """
+        Drop all cached server paths and the link table of self.graph. Must be
+        called whenever the topology of self.graph (its nodes or links) or the
+        set of servers changes.
+        """
+        self.srv_paths = {}
+        self.srv_paths_graph = self.graph
+        self.path_batches = {}
+        self.drop_link_table()
 
     def get_switches(self):
         return self.switches
@@ -58,6 +85,66 @@ class Controller(ResourceAllocator):
     def sync_toward(self, ctrl=None):
         raise NotImplementedError("Controller does not implement __name__")
 
+    def relay_toward(self, dstctrl, links):
+        raise NotImplementedError("Controller does not implement relay_toward")
+
+    def links_to_sync(self, dstctrl, timestep=None, received=True):
+        """
+        Return the links of self.mylinks to push to dstctrl such that it ends
+        up in the same state as after pushing all of them.
+
+        The first sync toward dstctrl pushes all links. Afterwards, the link
+        tables of both graphs collect the links written to, and only those
+        of my links written since the last sync are pushed: written by me,
+        or (if received) by anyone in the graph of dstctrl. A sync with a
+        timestep pushes all links, as it stamps every one of them.
+
+        sync_done must be called once the links are pushed.
+        """
+        table = self.link_table()
+        dsttable = dstctrl.link_table()
+        state = self.sync_state.get(dstctrl)
+        if (state is not None and state[0] is table and state[1] is dsttable
+                and timestep is None):
+            mine, sent, recvd = state[2:]
+            links = [table.links[i] for i in sent if i in mine]
+            if recvd is not None:
+                for i in recvd:
+                    link = dsttable.links[i]
+                    mylink = table.ids[link]
+                    if mylink in mine and mylink not in sent:
+                        links.append(link)
+            return links
+
+        self.drop_sync_state(dstctrl)
+        mine = set(table.ids_for(self.mylinks).tolist())
+        sent = set()
+        table.dirty_sets.append(sent)
+        recvd = None
+        if received:
+            recvd = set()
+            dsttable.dirty_sets.append(recvd)
+        self.sync_state[dstctrl] = (table, dsttable, mine, sent, recvd)
+        return self.mylinks
+
+    def sync_done(self, dstctrl):
+        """Start collecting the links written until the next sync"""
+        state = self.sync_state.get(dstctrl)
+        if state is not None:
+            state[3].clear()
+            if state[4] is not None:
+                state[4].clear()
+
+    def drop_sync_state(self, dstctrl):
+        """Forget the links changed since the last sync toward dstctrl"""
+        state = self.sync_state.pop(dstctrl, None)
+        if state is None:
+            return
+        table, dsttable, mine, sent, recvd = state
+        remove_dirty_set(table.dirty_sets, sent)
+        if recvd is not None:
+            remove_dirty_set(dsttable.dirty_sets, recvd)
+
 
 class LinkBalancerCtrl(Controller):
     """
@@ -91,6 +178,7 @@ class LinkBalancerCtrl(Controller):
 
         # remove duplicates
         self.localservers = list(set(localservers))
+        self.invalidate_srv_paths()
 
     def learn_my_links(self):
         """
@@ -110,17 +198,90 @@ class LinkBalancerCtrl(Controller):
 
         # remove duplicates
         self.mylinks = list(set(mylinks))
+        for dstctrl in self.sync_state.keys():
+            self.drop_sync_state(dstctrl)
+        self.drop_poll_state()
 
-    def update_my_state(self, simgraph):
+    def update_my_state(self, simgraph, used=None, source=None):
         """
         This action is akin to when a controller polls the switchport counters
         of its switches: The controller will update the 'used' values each
         link in the simulation graph which it governs
+        used: utilization of the links of simgraph by link id of source,
+        polled instead of the current state of simgraph (e.g. a stale state,
+        see LinkHistory)
+        source: publisher of the links whose polled utilization changes, by
+        link id of simgraph in its dirty_sets (the link table of simgraph, or
+        the LinkHistory providing used). After a first full poll from the
+        same source, only those of my links are compared which it changed or
+        which were written in self.graph since the last poll. Without a
+        source, all of my links are read from simgraph.
         """
-        for link in self.mylinks:
-            u, v = link
-            if not (self.graph[u][v]['used'] == simgraph[u][v]['used']):
-                self.graph[u][v]['used'] = simgraph[u][v]['used']
+        table = self.link_table()
+        if source is None:
+            assert used is None, "polled utilization needs its source"
+            links = table.ids_for(self.mylinks)
+            polled = np.array([simgraph[u][v]['used']
+                               for u, v in self.mylinks], dtype=float)
+            differ = polled != table.used[links]
+            if differ.any():
+                table.set_used(links[differ], polled[differ])
+            return
+
+        if isinstance(source, LinkHistory):
+            simtable = source.table
+        else:
+            simtable = source
+        if used is None:
+            used = simtable.used
+        state = self.poll_state
+        if (state is None or state[0] is not source or
+                state[1] is not table or state[2] is not simtable):
+            links = table.ids_for(self.mylinks)
+            simlinks = simtable.ids_for(self.mylinks)
+            self.watch_poll_source(source, table, simtable)
+        else:
+            sim_to_mine, mine_to_sim, changed, written = state[3:]
+            pairs = {}
+            for i in changed:
+                if i in sim_to_mine:
+                    pairs[sim_to_mine[i]] = i
+            for i in written:
+                if i in mine_to_sim:
+                    pairs[i] = mine_to_sim[i]
+            links = np.array(pairs.keys(), dtype=int)
+            simlinks = np.array(pairs.values(), dtype=int)
+
+        polled = used[simlinks]
+        differ = polled != table.used[links]
+        if differ.any():
+            table.set_used(links[differ], polled[differ])
+        self.poll_state[5].clear()
+        self.poll_state[6].clear()
+
+    def watch_poll_source(self, source, table, simtable):
+        """Start collecting the links changed by source and in table"""
+        self.drop_poll_state()
+        mylinks = table.ids_for(self.mylinks).tolist()
+        simlinks = simtable.ids_for(self.mylinks).tolist()
+        changed = set()
+        written = set()
+        source.dirty_sets.append(changed)
+        table.dirty_sets.append(written)
+        self.poll_state = (source, table, simtable,
+                           dict(zip(simlinks, mylinks)),
+                           dict(zip(mylinks, simlinks)), changed, written)
+
+    def drop_poll_state(self):
+        """Stop collecting the links changed since the last poll"""
+        state = self.poll_state
+        if state is None:
+            return
+        self.poll_state = None
+        source, table, changed, written = (state[0], state[1], state[5],
+                                           state[6])
+        remove_dirty_set(source.dirty_sets, changed)
+        remove_dirty_set(table.dirty_sets, written)
 
     def sync_toward(self, dstctrl, specificedges=None, timestep=None):
         """
@@ -135,11 +296,14 @@ class LinkBalancerCtrl(Controller):
         simulation, this scenario will never emerge as long as controllers
         learn their link state (learn_my_state) from the simulation graph
         before handling requests.
+
+        Without specificedges, only the links changed since the last sync
+        toward dstctrl are pushed, see links_to_sync.
         """
         if (specificedges):
             mylinks = specificedges
         else:
-            mylinks = self.mylinks
+            mylinks = self.links_to_sync(dstctrl, timestep)
 
         for link in mylinks:
             u, v = link
@@ -149,7 +313,22 @@ class LinkBalancerCtrl(Controller):
                 dstctrl.graph[u][v]['used'] = self.graph[u][v]['used']
                 dstctrl.graph[u][v]['timestamp'] = timestep
 
-        logging.debug("%s syncs toward %s" % (self.name, dstctrl.name))
+        if not specificedges:
+            self.sync_done(dstctrl)
+        sync_trace("%s syncs toward %s", self.name, dstctrl.name)
+
+    def relay_toward(self, dstctrl, links):
+        """
+        Forward the state of links of another domain, as learned by this
+        controller from their owner, toward dstctrl, as if the owner had
+        pushed it. Used by sync topologies that relay state, see sim.sync.
+        """
+        for u, v in links:
+            if not (dstctrl.graph[u][v].get('mylink')):
+                dstctrl.graph[u][v]['used'] = self.graph[u][v]['used']
+                dstctrl.graph[u][v]['timestamp'] = \
+                    self.graph[u][v].get('timestamp')
+        sync_trace("%s relays toward %s", self.name, dstctrl.name)
 
 
     def get_srv_paths(self, sw, graph=None, local=False):
@@ -159,10 +338,27 @@ class LinkBalancerCtrl(Controller):
         (routing) is known and static 
 
         If local , Return only paths to servers within this controller's domain
+
+        Paths in self.graph are computed once per ingress switch (separately
+        for local and all servers) and cached until invalidate_srv_paths is
+        called or self.graph is replaced. The returned list must not be
+        modified.
         """
         if graph == None:
             graph = self.graph
+        if graph is not self.graph:
+            return self.compute_srv_paths(sw, graph, local)
+
+        if self.srv_paths_graph is not self.graph:
+            self.invalidate_srv_paths()
+        paths = self.srv_paths.get((sw, local))
+        if paths is None:
+            paths = self.compute_srv_paths(sw, graph, local)
+            self.srv_paths[(sw, local)] = paths
+        return paths
 
+    def compute_srv_paths(self, sw, graph, local=False):
+        """Compute the uncached server paths of get_srv_paths in graph"""
         paths = []
 
         if local:
@@ -187,63 +383,94 @@ class LinkBalancerCtrl(Controller):
         links in the path 
         """
         pathmetric = 1
-        linkmetrics = []
-        links = zip(path[:-1], path[1:])
+        table = self.link_table()
+        links = table.path_links(path)
         # calculate available capacity for each link in path
-        for link in links:
-            u, v = link
-            #DESIGN CHOICE: Should we 1) always include extra-domain state, 2)
-            #only include extra-domain state when not stale (timestamp), 3) always exclude
-            #extra-domain state when calculating the path metric? Here we do (1)
-            used = self.graph[u][v]['used'] + util
-            capacity = self.graph[u][v]['capacity']
-            linkmetric = float(used) / capacity
+        #DESIGN CHOICE: Should we 1) always include extra-domain state, 2)
+        #only include extra-domain state when not stale (timestamp), 3) always exclude
+        #extra-domain state when calculating the path metric? Here we do (1)
+        linkmetrics = ((table.used[links] + util) /
+                       table.capacity[links]).tolist()
+        for i, linkmetric in enumerate(linkmetrics):
             # If the controller estimates it would oversubscribe this link
             if linkmetric > 1:
-                logging.info("[%s] MAY be OVERSUBSCRIBED [%f] at switch [%s]", str(time_now), linkmetric,  str(sw))
+                logging.info("[%s] MAY be OVERSUBSCRIBED [%f] at switch [%s]", time_now, linkmetric, sw)
+                del linkmetrics[i:]
                 break
-            else:
-                linkmetrics.append(linkmetric)
 
         # We define pathmetric to be the worst link metric in path
         if len(linkmetrics) > 0:
             pathmetric = max(linkmetrics)
 
-        funname = sys._getframe().f_code.co_name
-        logging.debug("[%s] [%s] [%s] [%s]", funname, str(time_now), str(self),
-                     str((path, linkmetrics)))
+        if trace.enabled:
+            trace("[%s] [%s] [%s] [%s]", "compute_path_metric", time_now, self,
+                  (path, linkmetrics))
         return (pathmetric, len(links))
 
+    def get_path_batch(self, paths, sw=None):
+        """
+        Return the (links, mask) matrices of paths in the link table of
+        self.graph (see LinkTable.path_matrix). If paths is a list cached by
+        get_srv_paths for ingress switch sw, they are compiled once and kept
+        with it until invalidate_srv_paths; other lists are compiled on every
+        call.
+        """
+        table = self.link_table()
+        key = None
+        for local in (False, True):
+            if sw is not None and self.srv_paths.get((sw, local)) is paths:
+                key = (sw, local)
+        if key is None:
+            return table.path_matrix(paths)
+        entry = self.path_batches.get(key)
+        if entry is None or entry[0] is not paths or entry[1] is not table:
+            entry = (paths, table) + table.path_matrix(paths)
+            self.path_batches[key] = entry
+        return entry[2:]
+
+    def compute_path_metrics(self, sw, paths, util, time_now):
+        """
+        Batched compute_path_metric: rate all paths at once from the link
+        table of self.graph
+
+        returns: (pathmetrics, pathlens) numpy arrays
+        """
+        table = self.link_table()
+        links, mask = self.get_path_batch(paths, sw)
+        linkmetrics = (table.used[links] + util) / table.capacity[links]
+        # As in compute_path_metric, only the links before the first link the
+        # controller estimates it would oversubscribe are rated
+        oversubscribed = mask & (linkmetrics > 1)
+        rated = mask & (np.cumsum(oversubscribed, axis=1) == 0)
+        pathmetrics = np.where(rated, linkmetrics, -np.inf).max(axis=1)
+        # We define pathmetric to be the worst link metric in path, or 1
+        pathmetrics[~rated.any(axis=1)] = 1
+
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            for i in np.flatnonzero(oversubscribed.any(axis=1)):
+                logging.info("[%s] MAY be OVERSUBSCRIBED [%f] at switch [%s]", time_now, linkmetrics[i][oversubscribed[i]][0], sw)
+        return (pathmetrics, mask.sum(axis=1))
+
     def find_best_path(self, paths, sw, util, duration, time_now):
-        bestpath = None
-        bestpathmetric = None # [0,1] lower -> better path
-        bestpathlen = None # lower -> better path
-        for path in paths:
-            pathmetric, pathlen = self.compute_path_metric(sw, path, util, time_now)
-
-            #DESIGN CHOICE: We pick the path with the best pathmetric.
-            # If multiple path metrics tie, we pick the path with the shortest
-            # length
-            if (bestpathmetric == None):
-                    bestpath = path
-                    bestpathmetric = pathmetric
-                    bestpathlen = pathlen
-            elif (pathmetric < bestpathmetric):
-                    bestpath = path
-                    bestpathmetric = pathmetric
-                    bestpathlen = pathlen
-            elif (pathmetric == bestpathmetric and pathlen < bestpathlen):
-                    bestpath = path
-                    bestpathmetric = pathmetric
-                    bestpathlen = pathlen
-
-        if (bestpath == None):
+        if len(paths) == 0:
             return None
 
-        funname = sys._getframe().f_code.co_name
-        logging.debug("[%s] [%s] [%s] [%s] [%s] [%s]", 
-                     funname, str(time_now), str(self), str(bestpath),
-                     str(bestpathlen), str(bestpathmetric))
+        pathmetrics, pathlens = self.compute_path_metrics(sw, paths, util,
+                                                          time_now)
+
+        #DESIGN CHOICE: We pick the path with the best pathmetric.
+        # If multiple path metrics tie, we pick the path with the shortest
+        # length, and the first of those
+        bestpathmetric = pathmetrics.min()
+        best = np.argmin(np.where(pathmetrics == bestpathmetric, pathlens,
+                                  pathlens.max() + 1))
+        bestpath = paths[best]
+        bestpathmetric = float(bestpathmetric)
+        bestpathlen = pathlens[best]
+
+        if trace.enabled:
+            trace("[%s] [%s] [%s] [%s] [%s] [%s]", "find_best_path", time_now,
+                  self, bestpath, bestpathlen, bestpathmetric)
 
         return (bestpath, bestpathmetric)
 
@@ -314,7 +541,7 @@ class GreedyLinkBalancerCtrl(LinkBalancerCtrl):
         else:
             logging.warn("[%s] No best path found at switch [%s]", str(time_now), str(sw))
 
-        logging.debug(str(bestpath))
+        trace("%s", bestpath)
         return bestpath
 
 class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
@@ -335,11 +562,15 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
         Share the utilization state of links goverend by this controller with
         another controller in a "push" fashion Optionally specify only specific
         links (edges) to share with the other dstctrl
+
+        Without specificedges, only the links changed since the last sync
+        toward dstctrl are pushed, see links_to_sync. Writes of dstctrl do
+        not touch 'sync_learned', so they need not be pushed back.
         """
         if (specificedges):
             mylinks = specificedges
         else:
-            mylinks = self.mylinks
+            mylinks = self.links_to_sync(dstctrl, timestep, received=False)
 
         for link in mylinks:
             u, v = link
@@ -349,7 +580,23 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
                 dstctrl.graph[u][v]['sync_learned'] = self.graph[u][v]['used']
                 dstctrl.graph[u][v]['timestamp'] = timestep
 
-        logging.debug("%s syncs toward %s" % (self.name, dstctrl.name))
+        if not specificedges:
+            self.sync_done(dstctrl)
+        sync_trace("%s syncs toward %s", self.name, dstctrl.name)
+
+    def relay_toward(self, dstctrl, links):
+        """
+        Forward the 'sync_learned' state of links of another domain toward
+        dstctrl. The 'used' values of this controller's view of those links
+        only hold its own contributions, not the state of their owner.
+        """
+        for u, v in links:
+            attrs = self.graph[u][v]
+            if ('sync_learned' in attrs and
+                    not (dstctrl.graph[u][v].get('mylink'))):
+                dstctrl.graph[u][v]['sync_learned'] = attrs['sync_learned']
+                dstctrl.graph[u][v]['timestamp'] = attrs.get('timestamp')
+        sync_trace("%s relays toward %s", self.name, dstctrl.name)
 
 
     def compute_path_metric(self, sw, path, util, time_now, local_contrib):
@@ -371,19 +618,19 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
                 # ['used'] is a strict lower bound for ['sync_learned']
                 if used1 > used2: 
                     used = used1
-                    logging.debug("CS [%s] using sync_learned value 1 [%f]", str(self.name), used1)
+                    ss_trace("CS [%s] using sync_learned value 1 [%f]", self.name, used1)
                 else:
                     used = used2
-                    logging.debug("CS [%s] using sync_learned value 2 [%f]", str(self.name), used2)
+                    ss_trace("CS [%s] using sync_learned value 2 [%f]", self.name, used2)
             else:
-                logging.debug("CS [%s] using tracking value", str(self.name))
+                ss_trace("CS [%s] using tracking value", self.name)
                 used = self.graph[u][v]['used'] + util
 
             capacity = self.graph[u][v]['capacity']
             linkmetric = float(used) / capacity
             # If the controller estimates it would oversubscribe this link
             if linkmetric > 1:
-                logging.info("[%s] MAY be OVERSUBSCRIBED [%f] at switch [%s]", str(time_now), linkmetric,  str(sw))
+                logging.info("[%s] MAY be OVERSUBSCRIBED [%f] at switch [%s]", time_now, linkmetric, sw)
                 break
             else:
                 linkmetrics.append(linkmetric)
@@ -392,9 +639,9 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
         if len(linkmetrics) > 0:
             pathmetric = max(linkmetrics)
 
-        funname = sys._getframe().f_code.co_name
-        logging.debug("[%s] [%s] [%s] [%s]", funname, str(time_now), str(self),
-                     str((path, linkmetrics)))
+        if ss_trace.enabled:
+            ss_trace("[%s] [%s] [%s] [%s]", "compute_path_metric", time_now,
+                     self, (path, linkmetrics))
         return (pathmetric, len(links))
 
 
@@ -411,20 +658,20 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
             pathmetrics[metric] = path
 
         metrics = pathmetrics.keys() 
-        logging.debug("SS CWTS PATH METRICS:, %s", str(pathmetrics))
+        ss_trace("SS CWTS PATH METRICS:, %s", pathmetrics)
         balanced_metric = sum(metrics)/len(metrics)
         if max(metrics) == 0:
-            logging.debug("SS CWTS MAX METRIC is 0")
+            ss_trace("SS CWTS MAX METRIC is 0")
             shift_by = 0
             shift_from_path = None
         else:
-            logging.debug("SS max(metrics) is %s", str(max(metrics)))
-            logging.debug("SS balanced metrics is %s", str(balanced_metric))
+            ss_trace("SS max(metrics) is %s", max(metrics))
+            ss_trace("SS balanced metrics is %s", balanced_metric)
             shift_by = (max(metrics) - balanced_metric)/max(metrics)
             shift_from_path = pathmetrics[max(metrics)]
 
-        logging.debug("SS CWTS SHIFT FROM: %s", str(shift_from_path))
-        logging.debug("SS CWTS SHIFT BY: %s", str(shift_by))
+        ss_trace("SS CWTS SHIFT FROM: %s", shift_from_path)
+        ss_trace("SS CWTS SHIFT BY: %s", shift_by)
         return(shift_from_path, shift_by)
 
 
@@ -454,24 +701,24 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
             pathmetrics[" ".join(path)] = metric
             metricpaths[metric] = path
 
-        logging.debug("SS FBP PATH METRICS:, %s", str(metricpaths))
+        ss_trace("SS FBP PATH METRICS:, %s", metricpaths)
         if path_to_shift == None:
             # return shortest path
-            logging.debug("SS FBP Returning LOCAL: %s", str((paths_by_length[min(paths_by_length.keys())],0)))
+            ss_trace("SS FBP Returning LOCAL: %s", (paths_by_length[min(paths_by_length.keys())],0))
             return (paths_by_length[min(paths_by_length.keys())], 0)
        
         
         path_to_shift_metric = pathmetrics.pop(" ".join(path_to_shift))
         path_to_receive_metric = pathmetrics.pop(pathmetrics.keys()[0])
-        logging.debug("SS FBP Path to Recv: %s", str(metricpaths[path_to_receive_metric]))
+        ss_trace("SS FBP Path to Recv: %s", metricpaths[path_to_receive_metric])
 
         if (path_to_receive_metric == 0):
-            logging.debug("SS FBP EARLY Returning : %s", str((metricpaths[min(metrics)], 0)))
+            ss_trace("SS FBP EARLY Returning : %s", (metricpaths[min(metrics)], 0))
             return (metricpaths[min(metrics)], 0)
         else:
             current_ratio = path_to_shift_metric * 1.0 / path_to_receive_metric
 
-        logging.debug("SS FBP CURRENT RATIO: %s", str(current_ratio))
+        ss_trace("SS FBP CURRENT RATIO: %s", current_ratio)
 
 
         goal_path_to_shift_metric = path_to_shift_metric * (1 - (shift_by * self.alpha))
@@ -483,23 +730,22 @@ class SeparateStateLinkBalancerCtrl(LinkBalancerCtrl):
         else:
             goal_ratio = goal_path_to_shift_metric * 1.0 / goal_path_to_receive_metric
 
-        logging.debug("SS FBP GOAL RATIO: %s", str(goal_ratio))
+        ss_trace("SS FBP GOAL RATIO: %s", goal_ratio)
 
         # FINALLY DECIDE WHICH PATH TO RETURN BASED ON GOAL-Current RATIO
         if goal_ratio - current_ratio < 0:
             # return path with lower utiliztion
-            logging.debug("SS FBP LOWER Returning : %s", str((metricpaths[min(metrics)], 0)))
+            ss_trace("SS FBP LOWER Returning : %s", (metricpaths[min(metrics)], 0))
             return (metricpaths[min(metrics)], 0)
     
         if goal_ratio - current_ratio > 0:
             # return path with higher utilization
-            logging.debug("SS FBP HIGHER Returning : %s", str((metricpaths[max(metrics)], 0)))
+            ss_trace("SS FBP HIGHER Returning : %s", (metricpaths[max(metrics)], 0))
             return (metricpaths[max(metrics)], 0)
 
         if goal_ratio - current_ratio == 0:
             # return shortest path
-            logging.debug("SS FBP Returning LOCAL: %s",
-                    str((paths_by_length[min(paths_by_length.keys())], 0)))
+            ss_trace("SS FBP Returning LOCAL: %s", (paths_by_length[min(paths_by_length.keys())], 0))
             return (paths_by_length[min(paths_by_length.keys())], 0)
 
 
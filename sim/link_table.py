@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+from collections import deque
+from copy import deepcopy
+from math import sqrt
+from operator import truediv
+
+import numpy as np
+
+def remove_dirty_set(dirty_sets, dirty):
+    """
+    Remove the set dirty from the list dirty_sets, if present. Sets are
+    compared by identity, as sets of different users are equal while empty.
+    """
+    for i, other in enumerate(dirty_sets):
+        if other is dirty:
+            del dirty_sets[i]
+            return
+
+
+class LinkAttrs(dict):
+    """
+    Edge attribute dict of a graph with a LinkTable. Writes to 'used' and
+    'capacity' are forwarded to the table, so code reading or writing the
+    edge attributes of the graph stays consistent with it, including writes
+    through update and setdefault (as by add_edge on an existing edge).
+    Removing 'used' or 'capacity' raises an Exception. Copies (including
+    those made by graph.copy()) are plain dicts.
+    """
+    __slots__ = ('table', 'link')
+
+    # Attributes mirrored by the table
+    mirrored = ('used', 'capacity')
+
+    def __setitem__(self, key, value):
+        if key == 'used':
+            self.table.update(self.link, used=value)
+        elif key == 'capacity':
+            self.table.update(self.link, capacity=value)
+        else:
+            dict.__setitem__(self, key, value)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def check_removable(self, keys):
+        """Raise an Exception if keys include an attribute of self.mirrored"""
+        for key in self.mirrored:
+            if key in keys:
+                raise Exception("Link attribute %s is kept in a LinkTable "
+                                "and cannot be removed" % key)
+
+    def __delitem__(self, key):
+        self.check_removable([key])
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.check_removable([key])
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self.check_removable(self)
+        return dict.popitem(self)
+
+    def clear(self):
+        self.check_removable(self)
+        dict.clear(self)
+
+    def copy(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class LinkSums(object):
+    """
+    Running totals over a set of links of a LinkTable: capacity, used,
+    used^2, used*capacity and capacity^2. The table updates them on every
+    change of used or capacity, so imbalance() costs O(1) instead of a pass
+    over the links.
+    """
+
+    def __init__(self, table, links):
+        self.table = table
+        self.links = links
+        self.resum()
+
+    def resum(self):
+        """Recompute the totals from the table"""
+        used = self.table.used[self.links].tolist()
+        capacity = self.table.capacity[self.links].tolist()
+        self.capacity = sum(capacity)
+        self.used = sum(used)
+        self.used_sq = sum(u * u for u in used)
+        self.used_cap = sum(u * c for u, c in zip(used, capacity))
+        self.cap_sq = sum(c * c for c in capacity)
+
+    def update(self, old_used, used, old_capacity, capacity):
+        """Account for a link changing from (old_used, old_capacity)"""
+        self.capacity += capacity - old_capacity
+        self.used += used - old_used
+        self.used_sq += used * used - old_used * old_used
+        self.used_cap += used * capacity - old_used * old_capacity
+        self.cap_sq += capacity * capacity - old_capacity * old_capacity
+
+    def imbalance(self):
+        """
+        Return sqrt(sum((used - (U / C) * capacity)^2)) over the links, where
+        U and C are the total used and capacity, i.e. the distance of the
+        utilization from a split proportional to capacity.
+
+        Expanding the square gives (C^2 uu - 2 U C uc + U^2 cc) / C^2. While
+        the totals are integral (as with integral demands and capacities),
+        this is evaluated exactly, otherwise in floating point, with an
+        exact recomputation if cancellation leaves a result in the noise.
+        """
+        if len(self.links) == 0:
+            return 0.0
+        totals = (self.capacity, self.used, self.used_sq, self.used_cap,
+                  self.cap_sq)
+        if all(float(t).is_integer() and abs(t) < 2 ** 53 for t in totals):
+            cap, used, used_sq, used_cap, cap_sq = [int(t) for t in totals]
+            num = (cap * cap * used_sq - 2 * used * cap * used_cap +
+                   used * used * cap_sq)
+            return sqrt(truediv(num, cap * cap))
+
+        share = self.used / self.capacity
+        value = (self.used_sq - 2 * share * self.used_cap +
+                 share * share * self.cap_sq)
+        if value < 1e-9 * self.used_sq:
+            # Rounding noise may dominate: recompute, and drop the
+            # error accumulated in the totals.
+            self.resum()
+            used = self.table.used[self.links]
+            capacity = self.table.capacity[self.links]
+            share = self.used / self.capacity
+            value = ((used - share * capacity) ** 2).sum()
+        return sqrt(value)
+
+
+class LinkTable(object):
+    """
+    Integer-indexed view of the links of a graph: link i is links[i], its
+    utilization and capacity are used[i] and capacity[i]. Paths (lists of
+    nodes) are compiled to arrays of link ids, so that allocating, freeing
+    and rating a path are array operations.
+
+    The graph remains the description of the topology. Its edge attribute
+    dicts are replaced by LinkAttrs mirroring used and capacity, so a graph
+    has a single table in use at a time. The table is owned by the user of
+    the graph, see ResourceAllocator.link_table, which builds a new one
+    after a topology change.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.links = graph.edges()
+        self.ids = {}
+        self.attrs = []
+        self.used = np.zeros(len(self.links))
+        self.capacity = np.zeros(len(self.links))
+        # Compiled paths, see path_links, and link lists, see ids_for
+        self.paths = {}
+        self.id_arrays = {}
+        # Running totals by name, and those each link contributes to,
+        # see link_sums
+        self.sums = {}
+        self.link_sums_of = [[] for link in self.links]
+        # Sets collecting the ids of links whose utilization is written,
+        # see LinkDivergence and Controller.update_my_state
+        self.dirty_sets = []
+
+        for i, (u, v) in enumerate(self.links):
+            attrs = LinkAttrs(graph.edge[u][v])
+            attrs.table = self
+            attrs.link = i
+            graph.succ[u][v] = attrs
+            if graph.is_directed():
+                graph.pred[v][u] = attrs
+            else:
+                graph.adj[v][u] = attrs
+                self.ids[(v, u)] = i
+            self.ids[(u, v)] = i
+            self.attrs.append(attrs)
+            self.used[i] = attrs.get('used', 0.0)
+            self.capacity[i] = attrs.get('capacity', np.inf)
+
+    def path_links(self, path):
+        """Return the array of link ids along path (a list of nodes)"""
+        key = tuple(path)
+        links = self.paths.get(key)
+        if links is None:
+            links = np.array([self.ids[link] for link in zip(key[:-1], key[1:])],
+                             dtype=int)
+            self.paths[key] = links
+        return links
+
+    def ids_for(self, links):
+        """
+        Return the array of ids of links, a list of (u, v) pairs. The result
+        is cached for as long as the same list is passed.
+        """
+        entry = self.id_arrays.get(id(links))
+        if entry is None or entry[0] is not links:
+            entry = (links, np.array([self.ids[link] for link in links],
+                                     dtype=int))
+            self.id_arrays[id(links)] = entry
+        return entry[1]
+
+    def path_matrix(self, paths):
+        """
+        Compile a list of paths to a (paths x longest path) matrix of link
+        ids, in path order and padded with link 0, and a boolean mask of the
+        same shape which is False for the padding
+
+        returns: (links, mask)
+        """
+        compiled = [self.path_links(path) for path in paths]
+        lengths = np.array([len(links) for links in compiled], dtype=int)
+        width = lengths.max() if len(compiled) > 0 else 0
+        mask = np.arange(width) < lengths[:, np.newaxis]
+        links = np.zeros(mask.shape, dtype=int)
+        links[mask] = np.concatenate(compiled) if len(compiled) > 0 else []
+        return (links, mask)
+
+    def link_sums(self, name, links=None):
+        """
+        Return the LinkSums called name, kept over the links with ids links
+        (all links if None), creating it on first use
+        """
+        sums = self.sums.get(name)
+        if sums is None:
+            if links is None:
+                links = range(len(self.links))
+            sums = LinkSums(self, np.array(links, dtype=int))
+            self.sums[name] = sums
+            for i in sums.links.tolist():
+                self.link_sums_of[i].append(sums)
+        return sums
+
+    def update(self, link, used=None, capacity=None):
+        """Set the utilization and/or capacity of the link with id link"""
+        attrs = self.attrs[link]
+        old_used = self.used[link].item()
+        old_capacity = self.capacity[link].item()
+        if used is not None:
+            dict.__setitem__(attrs, 'used', used)
+            self.used[link] = used
+        if capacity is not None:
+            dict.__setitem__(attrs, 'capacity', capacity)
+            self.capacity[link] = capacity
+        used = self.used[link].item()
+        capacity = self.capacity[link].item()
+        for sums in self.link_sums_of[link]:
+            sums.update(old_used, used, old_capacity, capacity)
+        for dirty in self.dirty_sets:
+            dirty.add(link)
+
+    def set_used(self, links, values):
+        """Set the utilization of the links with ids links to values"""
+        attrs = self.attrs
+        link_sums_of = self.link_sums_of
+        olds = self.used[links].tolist()
+        self.used[links] = values
+        ids = links.tolist()
+        for dirty in self.dirty_sets:
+            dirty.update(ids)
+        for i, old, value in zip(ids, olds, self.used[links].tolist()):
+            dict.__setitem__(attrs[i], 'used', value)
+            if link_sums_of[i]:
+                capacity = self.capacity[i].item()
+                for sums in link_sums_of[i]:
+                    sums.update(old, value, capacity, capacity)
+
+
+class LinkDivergence(object):
+    """
+    Pairwise Euclidean distances between the link utilizations in several
+    link tables over the same links, e.g. of the NIB of each controller and
+    the physical network.
+
+    The squared distance of each pair is kept as a running sum. The tables
+    collect the links written to, and distances() only revisits those, so
+    its cost follows the number of changed links rather than the size of
+    the graphs.
+    """
+
+    # Upper bound on the entries of the (graphs x graphs x links) blocks of
+    # differences computed at once
+    blocksize = 1 << 20
+
+    def __init__(self, tables):
+        self.tables = list(tables)
+        links = self.tables[-1].links
+        # Link ids of each table in the link order of the last one, and
+        # the inverse mapping
+        self.index = [np.array([table.ids[link] for link in links], dtype=int)
+                      for table in self.tables]
+        self.common = []
+        for index in self.index:
+            common = np.zeros(len(index), dtype=int)
+            common[index] = np.arange(len(index))
+            self.common.append(common)
+        self.dirty = [set() for table in self.tables]
+        for table, dirty in zip(self.tables, self.dirty):
+            table.dirty_sets.append(dirty)
+
+        self.used = self.current(np.arange(len(links)))
+        (self.sqdist, self.ndiff) = self.pairwise(self.used)
+
+    def valid_for(self, tables):
+        """Return True if this tracks the link tables tables"""
+        return (len(tables) == len(self.tables) and
+                all(table is mine for table, mine in
+                    zip(tables, self.tables)))
+
+    def close(self):
+        """Stop collecting written links"""
+        for table, dirty in zip(self.tables, self.dirty):
+            remove_dirty_set(table.dirty_sets, dirty)
+
+    def current(self, links):
+        """Return the (tables x links) utilization of links in each table"""
+        return np.array([table.used[index[links]]
+                         for table, index in zip(self.tables, self.index)])
+
+    def pairwise(self, used):
+        """
+        Return the squared distances and the number of differing links for
+        each pair of rows of used (graphs x links)
+        """
+        count = used.shape[0]
+        sqdist = np.zeros((count, count))
+        ndiff = np.zeros((count, count), dtype=int)
+        step = max(1, self.blocksize // max(1, count * count))
+        for start in range(0, used.shape[1], step):
+            block = used[:, start:start + step]
+            diff = block[:, np.newaxis, :] - block[np.newaxis, :, :]
+            sqdist += (diff ** 2).sum(axis=2)
+            ndiff += (diff != 0).sum(axis=2)
+        return (sqdist, ndiff)
+
+    def distances(self):
+        """
+        Return the distance between each pair of tables, in the order of
+        itertools.combinations(tables, 2)
+        """
+        changed = set()
+        for common, dirty in zip(self.common, self.dirty):
+            if dirty:
+                changed.update(common[list(dirty)].tolist())
+                dirty.clear()
+        if changed:
+            links = np.array(sorted(changed), dtype=int)
+            old = self.used[:, links]
+            new = self.current(links)
+            (old_sqdist, old_ndiff) = self.pairwise(old)
+            (new_sqdist, new_ndiff) = self.pairwise(new)
+            self.sqdist += new_sqdist - old_sqdist
+            self.ndiff += new_ndiff - old_ndiff
+            self.used[:, links] = new
+
+        # Tables which agree on every link are exactly 0 apart, regardless
+        # of rounding in the running sums
+        sqdist = np.where(self.ndiff > 0, np.maximum(self.sqdist, 0.0), 0.0)
+        rows, cols = np.triu_indices(len(self.tables), 1)
+        return tuple(np.sqrt(sqdist[rows, cols]).tolist())
+
+
+class LinkHistory(object):
+    """
+    Past utilization of the links of a LinkTable, recorded as a queue of
+    states like a list of graph copies, e.g. to present stale views of the
+    physical network to controllers.
+
+    Only the oldest state is materialized, as an array in the link order of
+    the table. Each later state is kept as the ids and
+    utilizations of the links written since the state before it, so
+    recording and dropping a state costs O(changed links) rather than a
+    copy of the graph.
+
+    Like a LinkTable, it collects the ids of the links whose utilization
+    changes in the oldest state in each of its dirty_sets.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.used = self.table.used.copy()
+        self.deltas = deque()
+        # Number of dropped states not yet applied to self.used, see pop
+        self.dropped = 0
+        self.dirty = set()
+        self.table.dirty_sets.append(self.dirty)
+        self.dirty_sets = []
+
+    def __len__(self):
+        return len(self.deltas) + 1 - self.dropped
+
+    def close(self):
+        """Stop collecting written links"""
+        remove_dirty_set(self.table.dirty_sets, self.dirty)
+
+    def record(self):
+        """Append the current state of the graph (like graph.copy())"""
+        links = np.array(sorted(self.dirty), dtype=int)
+        self.dirty.clear()
+        self.deltas.append((links, self.table.used[links]))
+
+    def oldest(self):
+        """
+        Return the utilization of each link in the oldest state. The array
+        is only valid until the next call of oldest or pop.
+        """
+        if len(self) <= 0:
+            raise IndexError("oldest of an empty LinkHistory")
+        while self.dropped > 0:
+            links, used = self.deltas.popleft()
+            self.used[links] = used
+            self.dropped -= 1
+            if self.dirty_sets:
+                ids = links.tolist()
+                for dirty in self.dirty_sets:
+                    dirty.update(ids)
+        return self.used
+
+    def pop(self):
+        """Return the oldest state as oldest() does, and drop it"""
+        used = self.oldest()
+        self.dropped += 1
+        return used
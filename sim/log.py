@@ -114,3 +114,54 @@ lg = SimLogger()
 info, warn, error, debug = (
     lg.info, lg.warn, lg.error, lg.debug)
 setLogLevel = lg.setLogLevel
+
+
+# Simulator subsystems with hot-path debug traces, see Tracer
+TRACE_SUBSYSTEMS = ( 'simulation', 'controller', 'separate', 'sync' )
+
+class Tracer( object ):
+    """Debug trace of one simulator subsystem, logged at DEBUG level to the
+       logger sdnctrlsim.<subsystem>.
+
+       Traces are off by default, regardless of the logging configuration.
+       Hot paths test the enabled flag before building any arguments, so a
+       disabled trace costs a single attribute lookup:
+
+           if trace.enabled:
+               trace( 'Freed! %s', self.graph.edges( data=True ) )
+
+       Arguments are formatted only if the message is emitted."""
+
+    def __init__( self, subsystem ):
+        self.subsystem = subsystem
+        self.logger = logging.getLogger( 'sdnctrlsim.' + subsystem )
+        self.enabled = False
+
+    def __call__( self, msg, *args ):
+        if self.enabled:
+            self.logger.debug( msg, *args )
+
+    def setEnabled( self, enabled=True ):
+        self.enabled = enabled
+        if enabled:
+            # logging.config.fileConfig disables loggers created before it
+            self.logger.disabled = False
+            self.logger.setLevel( logging.DEBUG )
+
+
+tracers = dict( ( subsystem, Tracer( subsystem ) )
+                for subsystem in TRACE_SUBSYSTEMS )
+
+def getTracer( subsystem ):
+    """Return the Tracer of a subsystem from TRACE_SUBSYSTEMS"""
+    return tracers[ subsystem ]
+
+def setTracing( subsystems, enabled=True ):
+    """Enable (or disable) the traces of the given subsystems.
+       subsystems: list of names from TRACE_SUBSYSTEMS, or 'all'"""
+    if subsystems == 'all' or 'all' in subsystems:
+        subsystems = TRACE_SUBSYSTEMS
+    for subsystem in subsystems:
+        if subsystem not in tracers:
+            raise Exception( 'unknown subsystem seen in setTracing' )
+        tracers[ subsystem ].setEnabled( enabled )
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import json
+
+from sim.simulation_trace import SimulationTrace
+
+class MetricsWriter(object):
+    """
+    Stream the metrics of a simulation run to a file as they are collected,
+    so that memory use does not grow with the length of the run and a run
+    that fails keeps the metrics written so far.
+
+    The file holds one JSON object per line, each a chunk of consecutive
+    samples: metric names to lists of values, and for simulation_trace the
+    columns of its samples (see SimulationTrace.to_json), with the trace
+    header in the first chunk only. read_metrics joins the chunks again.
+    """
+
+    def __init__(self, filename, chunk=1000):
+        """
+        filename: file to write, replaced if it exists
+        chunk: number of samples written at once
+        """
+        self.f = open(filename, 'w')
+        self.chunk = chunk
+        self.metrics = None
+        self.header_written = False
+
+    def attach(self, all_metrics):
+        """Write the samples collected into all_metrics from now on"""
+        self.metrics = all_metrics
+
+    def sampled(self):
+        """
+        Called after each sample: write a chunk once a metric has more than
+        chunk samples pending. The latest sample of each metric stays in
+        memory, as the discrete-event engine repeats it for idle ticks.
+        """
+        if any(len(values) > self.chunk for values in self.metrics.values()):
+            self.write(keep=1)
+
+    def write(self, keep=0):
+        """Write and drop all but the last keep pending samples of each metric"""
+        if self.metrics is None:
+            return
+        chunk = {}
+        for name, values in self.metrics.items():
+            count = len(values) - keep
+            if count <= 0:
+                continue
+            if isinstance(values, SimulationTrace):
+                chunk[name] = values.to_json(count,
+                                             header=not self.header_written)
+                self.header_written = True
+                values.discard(count)
+            else:
+                chunk[name] = values[:count]
+                del values[:count]
+        if chunk:
+            self.f.write(json.dumps(chunk, sort_keys=True) + '\n')
+            self.f.flush()
+
+    def close(self):
+        """Write all pending samples and close the file"""
+        self.write()
+        self.f.close()
+
+
+def read_metrics(filename, traces=True):
+    """
+    Return the metrics stored in filename by a MetricsWriter, or by json.dump
+    of a dict of metrics (the former .metrics format). A truncated chunk, as
+    left by a run that was killed, ends the metrics read: they are those of
+    the chunks before it, and empty for an empty file.
+
+    traces: return simulation_trace as a SimulationTrace, or as its JSON
+        form (header and columns, see SimulationTrace.to_json) if False
+    returns: dict of metric names to lists of samples, with
+        simulation_trace as a SimulationTrace
+    """
+    f = open(filename, 'r')
+    first = f.readline()
+    try:
+        chunks = [json.loads(first)]
+    except ValueError:
+        # A single, indented JSON document, or a truncated first chunk
+        f.seek(0)
+        try:
+            chunks = [json.load(f)]
+        except ValueError:
+            chunks = []
+    else:
+        for line in f:
+            try:
+                chunks.append(json.loads(line))
+            except ValueError:
+                break
+    f.close()
+
+    metrics = {}
+    for chunk in chunks:
+        for name, values in chunk.items():
+            if isinstance(values, dict) and 'columns' in values:
+                trace = metrics.setdefault(name, {'columns': {}})
+                if 'header' in values:
+                    trace['header'] = values['header']
+                for column, rows in values['columns'].items():
+                    trace['columns'].setdefault(column, []).extend(rows)
+            else:
+                metrics.setdefault(name, []).extend(values)
+
+    if traces:
+        for name, values in metrics.items():
+            if isinstance(values, dict):
+                metrics[name] = SimulationTrace.from_json(values)
+    return metrics
@@ -5,10 +5,159 @@
 
 import heapq
 import logging
+from math import floor
+
+import numpy as np
+
+from link_table import LinkTable
 
 logger = logging.getLogger(__name__)
 
+class FlowCalendar(object):
+    """
+    Calendar queue of active flows, an alternative to the heapq of
+    ResourceAllocator.active_flows: flows are kept in buckets of expiry
+    times [i * width, (i + 1) * width), and buckets are visited in order as
+    time progresses. The indices of the buckets holding flows are kept in a
+    heapq, so adding and expiring a flow costs O(1) amortized plus
+    O(log buckets) per bucket, however far apart buckets are, and flows are
+    never compared with each other.
+
+    Each flow is a record (whenfree, path, resources, links), links being
+    the link ids of path in self.table, the link table of the allocator's
+    graph (see relink). Like
+    the (whenfree, path, resources) entries of the heapq, records are
+    indexed by whenfree, path and resources.
+
+    The bucket of the current time is searched on every expiry, so width
+    should be in the order of the time between calls of expire.
+    """
+
+    def __init__(self, width=1.0, table=None):
+        assert width > 0
+        self.width = float(width)
+        self.table = table
+        self.buckets = {}
+        # heapq of the indices of self.buckets
+        self.indices = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for bucket in self.buckets.itervalues():
+            for record in bucket:
+                yield record
+
+    def relink(self, table):
+        """Recompile the links of every flow for the LinkTable table"""
+        for index, bucket in self.buckets.iteritems():
+            self.buckets[index] = [(whenfree, path, resources,
+                                    table.path_links(path))
+                                   for whenfree, path, resources, links
+                                   in bucket]
+        self.table = table
+
+    def bucket_of(self, whenfree):
+        return int(floor(whenfree / self.width))
+
+    def push(self, whenfree, path, resources, links):
+        """Add a flow whose resources are freed at time whenfree"""
+        index = self.bucket_of(whenfree)
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = self.buckets[index] = []
+            heapq.heappush(self.indices, index)
+        bucket.append((whenfree, path, resources, links))
+        self.count += 1
+
+    def first_bucket(self):
+        """Return the index of the first bucket holding flows, or None"""
+        if self.indices:
+            return self.indices[0]
+        return None
+
+    def next_expiry(self):
+        """Return the earliest time at which a flow expires, or None"""
+        index = self.first_bucket()
+        if index is None:
+            return None
+        return min(record[0] for record in self.buckets[index])
+
+    def expire(self, now):
+        """
+        Remove and return the flows expiring before or at now, ordered by
+        whenfree (flows expiring at the same time in order of addition)
+        """
+        expired = []
+        upto = self.bucket_of(now)
+        while self.indices and self.indices[0] < upto:
+            expired.extend(self.buckets.pop(heapq.heappop(self.indices)))
+        if self.indices and self.indices[0] == upto:
+            # The bucket of now may also hold flows expiring later
+            bucket = self.buckets[upto]
+            keep = [record for record in bucket if record[0] > now]
+            if keep:
+                self.buckets[upto] = keep
+            else:
+                del self.buckets[upto]
+                heapq.heappop(self.indices)
+            expired.extend(record for record in bucket if record[0] <= now)
+        self.count -= len(expired)
+        expired.sort(key=lambda record: record[0])
+        return expired
+
+
 class ResourceAllocator(object):
+    """
+    Allocates and frees the resources of flows along paths of self.graph.
+    Active flows are kept in self.active_flows, a list used as a heapq of
+    (whenfree, path, resources), or a FlowCalendar, see use_flow_calendar.
+    Link utilization is kept in the LinkTable of self.graph, see link_table.
+    """
+
+    # LinkTable of self.graph, see link_table
+    _table = None
+
+    def link_table(self):
+        """
+        Return the LinkTable of self.graph, building it on first use and
+        whenever self.graph was replaced
+        """
+        table = self._table
+        if table is None or table.graph is not self.graph:
+            table = LinkTable(self.graph)
+            self._table = table
+        return table
+
+    def drop_link_table(self):
+        """
+        Forget the LinkTable of self.graph, e.g. after its topology changed.
+        A new table is built on the next call of link_table.
+        """
+        self._table = None
+
+    def use_flow_calendar(self, width=1.0):
+        """
+        Keep the active flows in a FlowCalendar with buckets of width
+        instead of a heapq
+        """
+        table = self.link_table()
+        calendar = FlowCalendar(width, table)
+        for flow in self.active_flows:
+            whenfree, path, resources = flow[:3]
+            calendar.push(whenfree, path, resources, table.path_links(path))
+        self.active_flows = calendar
+
+    def next_expiry(self):
+        """Return the earliest time at which an active flow expires, or None"""
+        flowlist = self.active_flows
+        if isinstance(flowlist, FlowCalendar):
+            return flowlist.next_expiry()
+        if len(flowlist) > 0:
+            return flowlist[0][0]
+        return None
 
     def _update_last_now(self, now):
         if hasattr(self, 'last_now'):
@@ -26,7 +175,7 @@ class ResourceAllocator(object):
         Detect if any link in a path is fully utilized, do not oversubscribe
         Record the resources for link to be freed at time <whenfree>
         """
-        graph = self.graph
+        table = self.link_table()
         flowlist = self.active_flows
 
         assert (len(path) > 0)
@@ -34,19 +183,21 @@ class ResourceAllocator(object):
         self._update_last_now(now)
         whenfree = now + duration
 
-        links = zip(path[:-1], path[1:])
-        for src, dst in links:
-            edge = graph.edge[src][dst]
-            if (edge['used'] + resources > edge['capacity']):
-                logging.info("Not allocating [%d] at time [%d]", resources,
-                             now)
-                return
+        links = table.path_links(path)
+        used = table.used[links] + resources
+        if (used > table.capacity[links]).any():
+            logging.info("Not allocating [%d] at time [%d]", resources,
+                         now)
+            return
 
-        for src, dst in links:
-            edge = graph.edge[src][dst]
-            edge['used'] += resources
+        table.set_used(links, used)
 
-        heapq.heappush(flowlist, (whenfree, path, resources))
+        if isinstance(flowlist, FlowCalendar):
+            if flowlist.table is not table:
+                flowlist.relink(table)
+            flowlist.push(whenfree, path, resources, links)
+        else:
+            heapq.heappush(flowlist, (whenfree, path, resources))
 
 
     def free_resources(self, now):
@@ -56,25 +207,38 @@ class ResourceAllocator(object):
         graph: by default, free resources from the simulation graph
         flowlist: a list of active flows in the graph
         """
-        graph = self.graph
         flowlist = self.active_flows
 
-        if hasattr(self, "last_now") and self.last_now >= now and (len(flowlist) > 0 and flowlist[0][0] <= now):
-            raise AssertionError("flowlist[0][0]: %d now: %d" % (flowlist[0][0], now))
+        if hasattr(self, "last_now") and self.last_now >= now and len(flowlist) > 0:
+            first = self.next_expiry()
+            if first <= now:
+                raise AssertionError("flowlist[0][0]: %d now: %d" % (first, now))
 
         self._update_last_now(now)
 
-        while (len(flowlist) > 0 and flowlist[0][0] <= now):
-            time, path, resources = heapq.heappop(flowlist)
-            links = zip(path[:-1], path[1:])
-            for src, dst in links:
-                newutil = graph.edge[src][dst]['used'] - resources
-                # If we are properly allocating resources, we should never free
-                # more resources than were ever used
-                #assert (newutil >= 0)
-                if newutil < 0:
-                    logging.warn("[%s] Over-freeing path [%s] to [%d] at time [%d]", 
-                                 str(self), str(path), newutil, now)
-
-                graph.edge[src][dst]['used'] = max(0.0, newutil)
+        table = self.link_table()
+        if isinstance(flowlist, FlowCalendar):
+            if flowlist.table is not table:
+                flowlist.relink(table)
+            expired = flowlist.expire(now)
+        else:
+            expired = []
+            while (len(flowlist) > 0 and flowlist[0][0] <= now):
+                expired.append(heapq.heappop(flowlist))
+
+        for flow in expired:
+            time, path, resources = flow[:3]
+            if len(flow) > 3:
+                links = flow[3]
+            else:
+                links = table.path_links(path)
+            newutil = table.used[links] - resources
+            # If we are properly allocating resources, we should never free
+            # more resources than were ever used
+            #assert (newutil >= 0).all()
+            if (newutil < 0).any():
+                logging.warn("[%s] Over-freeing path [%s] to [%d] at time [%d]", 
+                             str(self), str(path), newutil.min(), now)
+
+            table.set_used(links, np.maximum(0.0, newutil))
 
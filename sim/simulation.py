@@ -4,10 +4,12 @@
 # Brandon Heller <brandonh@stanford.edu>
 
 # Python std lib imports
-from itertools import product
+import errno
+import heapq
+from itertools import count
 import json
 import logging
-from math import sqrt
+from math import ceil
 try:
     # OrderedDict for python>=2.7
     from collections import OrderedDict
@@ -25,10 +27,19 @@ import sys
 # 3rd party libs
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 
 # sim modules
+from sim.link_table import LinkDivergence, LinkHistory, LinkTable
+from sim.log import getTracer
+from sim.metrics_writer import MetricsWriter, read_metrics
 from sim.resource_allocator import ResourceAllocator
-from sim.workload import old_to_new
+from sim.simulation_trace import SimulationTrace
+from sim.sync import AllToAllSync, SyncScheduler, sync_scheduler
+from sim.workload import Workload, WorkloadCursor, binary_to_json_workload, \
+    old_to_new, write_binary_workload
+
+trace = getTracer('simulation')
 
 def sum_grouped_by(fnc, iterable):
     res = {}
@@ -37,18 +48,37 @@ def sum_grouped_by(fnc, iterable):
         res[key] = res.get(key, 0) + val
     return res
 
+# Metrics registered by every LinkBalancerSim, in the order they are collected
+METRICS = ('rmse_links', 'rmse_servers', 'state_distances', 'simulation_trace')
+
+# Event kinds of LinkBalancerSim.run_events, in the order in which events
+# scheduled for the same time are processed
+EXPIRY, ARRIVAL, SAMPLE = range(3)
+
+def _tick_of(time, step_size):
+    """Return the index of the first tick at or after time"""
+    tick = int(ceil(time / float(step_size)))
+    if tick > 0 and (tick - 1) * step_size >= time:
+        tick -= 1
+    elif tick * step_size < time:
+        tick += 1
+    return max(tick, 0)
+
 class Simulation(ResourceAllocator):
     """
     Assign switches to controllers in the graph, and run the workload through
     the switches, controllers
     """
 
-    def __init__(self, graph=None, ctrls=[]):
+    def __init__(self, graph=None, ctrls=[], expiry_width=None):
         """
         graph: topology annotated with capacity and utilization per edge
         ctrls: list of controller objects
         switches: list of switch names
         servers: list of server names
+        expiry_width: if given, the simulation and its controllers keep
+            their active flows in a FlowCalendar with buckets of this width
+            instead of a heapq, see ResourceAllocator.use_flow_calendar
         """
         self.active_flows = []
         self.graph = graph
@@ -83,6 +113,10 @@ class Simulation(ResourceAllocator):
 
         self.switches = self.sw_to_ctrl.keys()
 
+        if expiry_width is not None:
+            for allocator in [self] + self.ctrls:
+                allocator.use_flow_calendar(expiry_width)
+
     def __str__(self):
         return "Simulation: " + str([str(c) for c in self.ctrls])
 
@@ -131,16 +165,70 @@ class LinkBalancerSim(Simulation):
     """
     def __init__(self, *args, **kwargs):
         super(LinkBalancerSim, self).__init__(*args, **kwargs)
-        self.metric_fcns = [self.rmse_links, self.rmse_servers,
-                            self.state_distances, self.simulation_trace]
+        # Metrics which can be collected, by name, see register_metric
+        self.metric_registry = OrderedDict()
+        for name in METRICS:
+            self.register_metric(getattr(self, name))
+        # Metrics collected by a run unless it selects others, and the
+        # sampling interval of each by name, see select_metrics
+        self.metric_fcns = self.metric_registry.values()
+        self.metric_intervals = {}
+        # Metrics of the current run as (fcn, interval) pairs, and the number
+        # of samples taken so far, see _new_metrics
+        self.run_metrics = []
+        self.sample_count = 0
+        # Tracks the NIB and physical network distances, see state_distances
+        self.divergence = None
+        # Receives the samples of the current run, see _new_metrics
+        self.metrics_writer = None
+        # Links sampled by simulation_trace, see new_trace
+        self.trace_links = None
+        # Past states of the physical network polled by controllers when
+        # staleness > 0, see _handle_arrival
+        self.stale_states = None
+        # Decides which controllers push state to which in sync_ctrls, and
+        # the one used by the current run, see _begin_run
+        self.sync_scheduler = AllToAllSync()
+        self.run_sync = self.sync_scheduler
 
     def metrics(self, graph=None):
         """Return dict of metric names to values"""
         m = {}
-        for fcn in self.metric_fcns():
-            m[fcn.__name__] = fcn(self, graph)
+        for fcn in self.metric_fcns:
+            m[fcn.__name__] = fcn(graph, time_step=None, new_reqs=None)
         return m
 
+    def register_metric(self, fcn):
+        """
+        Make fcn(graph, time_step, new_reqs) available as a metric named
+        fcn.__name__. It is not collected until selected, see select_metrics.
+        """
+        self.metric_registry[fcn.__name__] = fcn
+
+    def _metric_fcns(self, names):
+        """Return the registered metrics called names"""
+        for name in names:
+            if name not in self.metric_registry:
+                raise Exception("Unknown metric %s, choose from %s" %
+                                (name, ", ".join(self.metric_registry)))
+        return [self.metric_registry[name] for name in names]
+
+    def select_metrics(self, names=None, intervals=None):
+        """
+        Choose the metrics collected by subsequent runs.
+
+        names: metric names, in order (all registered metrics if None)
+        intervals: dict of metric name to sampling interval k: the metric
+            is only collected at every k-th sample, so its list of values
+            holds one entry per k ticks. Metrics not listed keep their
+            interval (default 1).
+        """
+        if names is None:
+            names = self.metric_registry.keys()
+        self.metric_fcns = self._metric_fcns(names)
+        if intervals:
+            self.metric_intervals.update(intervals)
+
     def rmse_links(self, graph=None, time_step=None, new_reqs=None):
         """
         Calculate RMSE over _all_ links
@@ -152,27 +240,9 @@ class LinkBalancerSim(Simulation):
         if not graph:
             graph = self.graph
 
-        # First, find total capacity and util of entire network
-        used_total = 0.0
-        cap_total = 0.0
-        pairs = []
-        for src, dst, attrs in graph.edges(data=True):
-            assert 'capacity' in attrs and 'used' in attrs
-            cap = attrs['capacity']
-            used = attrs['used']
-            pairs.append((cap, used))
-            cap_total += cap
-            used_total += used
-
-        values = []  # values to be used in metric computation
-        for pair in pairs:
-            capacity, used = pair
-            opt_used = (used_total / cap_total) * capacity
-            # Use the absolute difference
-            # Not scaled by capacity.
-            values.append(abs(used - opt_used) ** 2)
-
-        return sqrt(sum(values))
+        # Running totals kept by the link table as links are allocated and
+        # freed, so a sample does not visit every link
+        return self.table_of(graph).link_sums('links').imbalance()
 
     def server_utilization(self, server, graph=None):
         """ Return the raw server link capacity and utilization """
@@ -200,30 +270,40 @@ class LinkBalancerSim(Simulation):
         if not graph:
             graph = self.graph
 
-        # Assuming a proportional spread of those requests, find optimal.
-        cap_total = 0.0  # total capacity of all server links
-        used_total = 0.0
-        pairs = []  # list of (capacity, used) pairs
-        for s in self.servers:
-            (used, capacity) = self.server_utilization(s, graph)
-            pairs.append((capacity, used))
-            cap_total += capacity
-            used_total += used
+        table = self.table_of(graph)
+        sums = table.sums.get('servers')
+        if sums is None:
+            sums = table.link_sums('servers', [table.ids[link] for link in
+                                               self._server_links(graph)])
+        return sums.imbalance()
 
-        values = []  # values to be used in metric computation
-        for pair in pairs:
-            capacity, used = pair
-            opt_used = (used_total / cap_total) * capacity
-            # Use the absolute difference
-            # Not scaled by capacity.
-            values.append(abs(used - opt_used) ** 2)
-
-        return sqrt(sum(values))
+    def table_of(self, graph):
+        """
+        Return the LinkTable of graph: the table of the simulation or of the
+        controller owning graph, or else a new table of graph
+        """
+        for allocator in [self] + self.ctrls:
+            if allocator.graph is graph:
+                return allocator.link_table()
+        return LinkTable(graph)
+
+    def _server_links(self, graph):
+        """Return the link (server, switch) of each server, in order"""
+        links = []
+        for s in self.servers:
+            neighbor_sw = graph.neighbors(s)
+            if len(neighbor_sw) != 1:
+                raise NotImplementedError("Single server links only")
+            links.append((s, neighbor_sw[0]))
+        return links
 
 
-    def sync_ctrls(self, ctrls=None):
+    def sync_ctrls(self, ctrls=None, now=None, scheduler=None):
         """
-        Sync every ctrl with every other ctrl:
+        Run a sync round of the ctrls at time now. The scheduler (default:
+        self.sync_scheduler, all-to-all) decides which ctrls push their state
+        to which, see sim.sync. All-to-all syncs every ctrl with every other
+        ctrl:
 
         Order of syncing does not matter, as long as the sets of links goverend
         by controllers is disjoint OR as long as links which belong to multiple
@@ -235,18 +315,219 @@ class LinkBalancerSim(Simulation):
         """
         if not ctrls:
             ctrls = self.ctrls
-        for pairs in product(ctrls, ctrls):
-            a, b = pairs
-            if (a == b):
+        if scheduler is None:
+            scheduler = self.sync_scheduler
+        scheduler.sync(ctrls, now)
+
+    def _begin_run(self, staleness=0, sync=None):
+        """Reset the per-run state shared by run and run_events"""
+        self.last_sync = 0
+        if sync is None:
+            sync = self.sync_scheduler
+        elif isinstance(sync, dict):
+            sync = sync_scheduler(**sync)
+        elif not isinstance(sync, SyncScheduler):
+            sync = sync_scheduler(sync)
+        self.run_sync = sync
+        sync.reset(self.ctrls)
+        # Keep a queue of stale link states representing graph state from
+        # earlier in the simulation
+        if self.stale_states is not None:
+            self.stale_states.close()
+            self.stale_states = None
+        if staleness > 0:
+            self.stale_states = LinkHistory(self.link_table())
+
+    def _handle_arrival(self, arr_time, sw, util, duration, sync_period,
+                        staleness):
+        """
+        Process a single request arrival: free expired flows, let every
+        controller learn its (possibly stale) state, sync if due and let the
+        controller governing sw place the request.
+        """
+        trace("[%s] [%s] [%s] [%s] [%s]", "run", arr_time, sw, util, duration)
+
+        self._refresh_ctrls(arr_time, sync_period, staleness)
+
+        # Allocate resrouces
+        ctrl = self.sw_to_ctrl[sw]
+        path = ctrl.handle_request(sw, util, duration, arr_time)
+        if len(path) > 0:
+            self.allocate_resources(path, util, arr_time, duration)
+        else:
+            pass
+            #TODO log the fact that no path could be allocated to
+            #handle this request
+
+        # Queue up old versions of the sim.graph until we've passed
+        # [staleness] timesteps
+        if staleness > 0:
+            self.stale_states.record()
+
+    def _handle_batch(self, batch, sync_period, staleness):
+        """
+        Process the arrivals of a tick, a list of requests in order of
+        arrival, against a single state refresh ("poll once per tick"):
+        expired flows are freed, controllers learn their state and sync if
+        due once, at the time of the first arrival. Each controller then
+        places its requests in order, seeing only its own allocations of the
+        batch, and the chosen paths are allocated in order of arrival. Stale
+        states are recorded once per batch.
+        """
+        trace("[%s] [%s] [%s]", "run batch", batch[0][0], len(batch))
+
+        self._refresh_ctrls(batch[0][0], sync_period, staleness)
+
+        paths = [self.sw_to_ctrl[sw].handle_request(sw, util, duration,
+                                                    arr_time)
+                 for arr_time, sw, util, duration in batch]
+
+        for (arr_time, sw, util, duration), path in zip(batch, paths):
+            if len(path) > 0:
+                self.allocate_resources(path, util, arr_time, duration)
+
+        if staleness > 0:
+            self.stale_states.record()
+
+    def _refresh_ctrls(self, arr_time, sync_period, staleness):
+        """
+        Free the flows expired at arr_time, let every controller learn its
+        (possibly stale) state and sync the controllers if due
+        """
+        # Free all resources that ended before or at arr_time
+        self.free_resources(arr_time)
+        if trace.enabled:
+            trace("Freed! %s", self.graph.edges(data=True))
+        # Let every controller learn its state from the topology
+        # Controllers only compare the links changed by the source of the
+        # state they poll, see update_my_state
+        stale_used = None
+        source = self.link_table()
+        if staleness > 0:
+            source = self.stale_states
+            if staleness < arr_time:
+                stale_used = self.stale_states.pop()
+            else:
+                stale_used = self.stale_states.oldest()
+
+        for ctrl in self.ctrls:
+            ctrl.free_resources(arr_time)
+            ctrl.update_my_state(self.graph, stale_used, source)
+
+        # Check if sync is necessary
+        time_elapsed_since_sync = arr_time - self.last_sync
+        if ((sync_period != None) and time_elapsed_since_sync >= sync_period):
+            self.sync_ctrls(now=arr_time, scheduler=self.run_sync)
+            trace("[%s] %s", arr_time, "Synced all ctrls")
+            if sync_period > 0:
+                self.last_sync = arr_time - (time_elapsed_since_sync % sync_period)
+
+    def _new_metrics(self, metrics=None, metric_intervals=None,
+                     metrics_writer=None, samples=None):
+        """
+        Set up the metrics of a run: metrics (names) and metric_intervals
+        override select_metrics for this run only.
+
+        Return a dict of metric names to empty lists of samples, except for
+        simulation_trace which collects into a SimulationTrace, sized for
+        samples samples if known. Samples are streamed to metrics_writer, if
+        given.
+        """
+        if metrics is None:
+            fcns = self.metric_fcns
+        else:
+            fcns = self._metric_fcns(metrics)
+        intervals = dict(self.metric_intervals)
+        if metric_intervals:
+            intervals.update(metric_intervals)
+        self.run_metrics = [(fcn, max(1, int(intervals.get(fcn.__name__, 1))))
+                            for fcn in fcns]
+        self.sample_count = 0
+
+        all_metrics = {}
+        for fcn in fcns:
+            all_metrics[fcn.__name__] = []
+        if 'simulation_trace' in all_metrics:
+            if metrics_writer is not None:
+                # The writer never leaves more than a chunk pending
+                samples = min(samples or metrics_writer.chunk,
+                              metrics_writer.chunk) + 1
+            all_metrics['simulation_trace'] = self.new_trace(samples)
+        self.metrics_writer = metrics_writer
+        if metrics_writer is not None:
+            metrics_writer.attach(all_metrics)
+        return all_metrics
+
+    def _expected_samples(self, workload, step_size):
+        """
+        Return the number of samples of a run of workload: one per tick
+        until the last flow expires. None if workload is not a Workload.
+        """
+        if not isinstance(workload, Workload):
+            return None
+        if len(workload.times) == 0:
+            return 1
+        end = (workload.times + workload.durations).max()
+        return int(ceil(end / float(step_size))) + 2
+
+    def _end_metrics(self, all_metrics):
+        """Write any samples still pending to the metrics writer"""
+        if self.metrics_writer is not None:
+            self.metrics_writer.write()
+            self.metrics_writer = None
+        return all_metrics
+
+    def _collect_metrics(self, all_metrics, time_now, new_reqs):
+        """
+        Append the value at time_now of every metric due at this sample to
+        all_metrics
+        """
+        for fcn, interval in self.run_metrics:
+            if self.sample_count % interval == 0:
+                all_metrics[fcn.__name__].append(fcn(self.graph,
+                                                     time_step=time_now,
+                                                     new_reqs=new_reqs))
+        self.sample_count += 1
+        if self.metrics_writer is not None:
+            self.metrics_writer.sampled()
+
+    def _repeat_metrics(self, all_metrics, time_now):
+        """
+        Append the previous value of every metric again for time_now. Only
+        valid when the simulation state did not change since the last sample.
+        Samples which carry their own timestamp are re-stamped. Metrics not
+        sampled at every tick are recomputed, as their previous value may
+        predate the last change.
+        """
+        for fcn, interval in self.run_metrics:
+            if self.sample_count % interval != 0:
+                continue
+            values = all_metrics[fcn.__name__]
+            if interval > 1:
+                values.append(fcn(self.graph, time_step=time_now,
+                                  new_reqs=[]))
+                continue
+            if isinstance(values, SimulationTrace):
+                values.repeat(time_now)
                 continue
-            a.sync_toward(b)
+            value = values[-1]
+            if isinstance(value, dict) and 'time' in value:
+                value = OrderedDict(value)
+                value['time'] = time_now
+            values.append(value)
+        self.sample_count += 1
+        if self.metrics_writer is not None:
+            self.metrics_writer.sampled()
 
     def run(self, workload, sync_period=0, step_size=1, ignore_remaining=False,
-            show_graph=False, staleness=0):
+            show_graph=False, staleness=0, metrics_writer=None, metrics=None,
+            metric_intervals=None, sync=None, batch=False):
         """
         Run the full simulation with new workload definition
 
         workload: new workload format. see unit_workload in workload.py
+            A Workload or any iterable of requests, read through a
+            WorkloadCursor and left unmodified
         sync_period: after how much time do we sync all ctrls
             sync_period of 0 means "Sync between every flow arrival"
         step_size: amount of time to step forward on each iteration of
@@ -255,102 +536,79 @@ class LinkBalancerSim(Simulation):
         staleness: Amount of time the NOS lags behind the physical network
             a version of self.graph from (arr_time - stalenes) will be
             presented to each controller 
+        metrics_writer: MetricsWriter to stream the metrics to as they are
+            collected. The returned metrics then only hold samples not yet
+            written, i.e. none.
+        metrics: names of the metrics to collect in this run (default: as
+            chosen by select_metrics)
+        metric_intervals: dict of metric name to sampling interval for this
+            run, see select_metrics
+        sync: SyncScheduler, sync topology name or dict of arguments of
+            sim.sync.sync_scheduler, deciding which ctrls push state to which
+            in a sync, for this run only (default: self.sync_scheduler)
+        batch: process the arrivals of each tick as one batch against a
+            single state refresh, see _handle_batch
         """
-        all_metrics = {}
-        for fcn in self.metric_fcns:
-            all_metrics[fcn.__name__] = []
+        all_metrics = self._new_metrics(
+            metrics, metric_intervals, metrics_writer,
+            self._expected_samples(workload, step_size))
 
         time_now = 0
         arr_time = 0
-        last_sync = 0
-        debugcounter = 0
-        # Keep a queue of stale graphs representing graph state from earlier in
-        # the simulation
-        stalegraphs = []
-        stalegraphs.append(self.graph.copy())
+        self._begin_run(staleness, sync)
 
         # Store positions so each run step is displayed consistently.
         # pos is a dict from node names to (x, y) pairs in [0, 1].
         pos = nx.spring_layout(self.graph)
 
         # Step forward through time until our workload is exhausted
-        while (len(workload) > 0):
-            arr_time, sw, util, duration = workload[0]
+        requests = WorkloadCursor(workload)
+        while not requests.exhausted():
+            arr_time = requests.peek()[0]
             new_reqs = []
 
-            while (arr_time <= time_now and len(workload) > 0):
-                arr_time, sw, util, duration = workload.pop(0)
-
-                funname = sys._getframe().f_code.co_name
-                logging.debug("[%s] [%s] [%s] [%s] [%s]", funname, str(arr_time),
-                             str(sw), str(util), str(duration))
-                #logging.debug("[%s]", str(self.graph.edges(data=True)))
+            if batch and arr_time <= time_now:
+                reqs = [requests.advance()]
+                while (not requests.exhausted() and
+                       requests.peek()[0] <= time_now):
+                    reqs.append(requests.advance())
+                self._handle_batch(reqs, sync_period, staleness)
+                new_reqs = [list(req[1:]) for req in reqs]
+                if requests.exhausted():
+                    del new_reqs[-1]
+                    arr_time = time_now
+                    self.free_resources(arr_time)
+                else:
+                    arr_time = requests.peek()[0]
 
+            while (arr_time <= time_now and not requests.exhausted()):
+                arr_time, sw, util, duration = requests.advance()
 
-                # Free all resources that ended before or at arr_time
-                self.free_resources(arr_time)
-                logging.debug("Freed! " + str(self.graph.edges(data=True)))
-                # Let every controller learn its state from the topology
-                if staleness > 0: 
-                    if staleness < arr_time:
-                        stalegraph = stalegraphs.pop(0)
-                    else:
-                        stalegraph = stalegraphs[0]
+                self._handle_arrival(arr_time, sw, util, duration,
+                                     sync_period, staleness)
 
-                for ctrl in self.ctrls:
-                    ctrl.free_resources(arr_time)
-                    if staleness > 0: 
-                        ctrl.update_my_state(stalegraph)
-                    else:
-                        ctrl.update_my_state(self.graph)
-
-                # Check if sync is necessary
-                time_elapsed_since_sync = arr_time - last_sync
-                if ((sync_period != None) and time_elapsed_since_sync >= sync_period):
-                    self.sync_ctrls()
-                    logging.debug("[%s] %s", str(arr_time), "Synced all ctrls")
-                    if sync_period > 0:
-                        last_sync = arr_time - (time_elapsed_since_sync % sync_period)
-
-
-                # Allocate resrouces
-                ctrl = self.sw_to_ctrl[sw]
-                path = ctrl.handle_request(sw, util, duration, arr_time)
-                if len(path) > 0: 
-                    self.allocate_resources(path, util, arr_time, duration)
-                else:
-                    pass
-                    #TODO log the fact that no path could be allocated to
-                    #handle this request
-
-                if len(workload) > 0:
-                    arr_time = workload[0][0]
+                if not requests.exhausted():
+                    arr_time = requests.peek()[0]
                     new_reqs.append([sw, util, duration])
-                    # Queue up old versions of the sim.graph until we've passed 
-                    # [staeleness] timesteps
-                    if staleness > 0:
-                        stalegraphs.append(self.graph.copy())
                 else:
                     arr_time=time_now
                     self.free_resources(arr_time)
 
             # We can now collect metrics and advance to the next timestep
-            for fcn in self.metric_fcns:
-                all_metrics[fcn.__name__].append(fcn(self.graph,
-                                                     time_step=time_now,
-                                                     new_reqs=new_reqs))
+            self._collect_metrics(all_metrics, time_now, new_reqs)
 
                 #log_graph_status(self.graph, pos, time_now)
             if show_graph:
                 show_graph_status(self.graph, pos)
                 raw_input("At time %s. Press enter to continue." % time_now)
 
-            logging.debug(self.graph.edges(data=True))
+            if trace.enabled:
+                trace("%s", self.graph.edges(data=True))
 
             time_now += step_size
             
         if (ignore_remaining):
-            return all_metrics
+            return self._end_metrics(all_metrics)
 
         # Progress and free any remaining active flows
         while len(self.active_flows) > 0:
@@ -359,53 +617,195 @@ class LinkBalancerSim(Simulation):
             for ctrl in self.ctrls:
                 # We can probably get rid of this loop, since no controller
                 # makes any decision here.
-                ctrl.update_my_state(self.graph)
-            for fcn in self.metric_fcns:
-                all_metrics[fcn.__name__].append(fcn(self.graph,
-                                                     time_step=time_now,
-                                                     new_reqs=None))
+                ctrl.update_my_state(self.graph,
+                                     source=self.link_table())
+            self._collect_metrics(all_metrics, time_now, None)
             time_now += step_size
 
-        return all_metrics
+        return self._end_metrics(all_metrics)
+
+    def run_events(self, workload, sync_period=0, step_size=1,
+                   ignore_remaining=False, show_graph=False, staleness=0,
+                   metrics_writer=None, metrics=None, metric_intervals=None,
+                   sync=None, batch=False):
+        """
+        Discrete-event variant of run: produces the same metrics for the same
+        workload, but only does work for ticks in which something happens.
+
+        A single priority queue holds request arrivals, metric samples and
+        (once the workload is exhausted) flow expirations. Ticks without any
+        event repeat the previous sample instead of recomputing it, so the
+        cost scales with the number of events rather than with the simulated
+        duration. As in run, flows of the physical network are freed at the
+        next arrival and controllers only sync on arrivals.
+
+        Arguments are the same as for run. The workload is not modified.
+        """
+        all_metrics = self._new_metrics(
+            metrics, metric_intervals, metrics_writer,
+            self._expected_samples(workload, step_size))
+
+        self._begin_run(staleness, sync)
+        pos = nx.spring_layout(self.graph)
+
+        events = []
+        seq = count()
+        requests = WorkloadCursor(workload)
+        # next_tick: index of the first tick without collected metrics
+        # sample_tick: tick of the last scheduled metric sample
+        # new_reqs: requests which arrived since the last sample
+        state = {'next_tick': 0, 'sample_tick': None, 'new_reqs': []}
+
+        def push_next_arrival():
+            req = requests.advance()
+            if req is None:
+                return False
+            heapq.heappush(events, (req[0], ARRIVAL, next(seq), req))
+            return True
+
+        def fill_idle(upto):
+            """Collect metrics for every tick before tick upto"""
+            while state['next_tick'] < upto:
+                time_now = state['next_tick'] * step_size
+                if self.sample_count == 0:
+                    self._collect_metrics(all_metrics, time_now, [])
+                else:
+                    self._repeat_metrics(all_metrics, time_now)
+                state['next_tick'] += 1
+
+        def sample(tick, new_reqs):
+            time_now = tick * step_size
+            self._collect_metrics(all_metrics, time_now, new_reqs)
+            if show_graph:
+                show_graph_status(self.graph, pos)
+                raw_input("At time %s. Press enter to continue." % time_now)
+            state['next_tick'] = tick + 1
+
+        push_next_arrival()
+        while len(events) > 0:
+            when, kind, _, payload = heapq.heappop(events)
+            if kind == ARRIVAL:
+                arr_time, sw, util, duration = payload
+                tick = max(state['next_tick'], _tick_of(arr_time, step_size))
+                fill_idle(tick)
+                if state['sample_tick'] != tick:
+                    heapq.heappush(events, (tick * step_size, SAMPLE,
+                                            next(seq), tick))
+                    state['sample_tick'] = tick
+                    state['new_reqs'] = []
+
+                if batch:
+                    # The arrivals of the same tick, see run
+                    reqs = [payload]
+                    while (not requests.exhausted() and
+                           _tick_of(requests.peek()[0], step_size) <= tick):
+                        reqs.append(requests.advance())
+                    self._handle_batch(reqs, sync_period, staleness)
+                    for arr_time, sw, util, duration in reqs[:-1]:
+                        state['new_reqs'].append([sw, util, duration])
+                    arr_time, sw, util, duration = reqs[-1]
+                else:
+                    self._handle_arrival(arr_time, sw, util, duration,
+                                         sync_period, staleness)
+
+                if push_next_arrival():
+                    state['new_reqs'].append([sw, util, duration])
+                else:
+                    self.free_resources(tick * step_size)
+            elif kind == SAMPLE:
+                sample(payload, state['new_reqs'])
+            elif kind == EXPIRY:
+                if len(self.active_flows) == 0:
+                    break
+                tick = _tick_of(when, step_size)
+                if tick < state['next_tick']:
+                    # Already freed on an earlier drain tick
+                    continue
+                fill_idle(tick)
+                self.free_resources(tick * step_size)
+                for ctrl in self.ctrls:
+                    ctrl.update_my_state(self.graph,
+                                         source=self.link_table())
+                sample(tick, None)
+
+            if (len(events) == 0 and len(self.active_flows) > 0 and
+                    not ignore_remaining):
+                # The workload is exhausted, drain the remaining flows. As in
+                # run, the first drain tick always refreshes the controllers.
+                heapq.heappush(events, (state['next_tick'] * step_size,
+                                        EXPIRY, next(seq), None))
+                for flow in self.active_flows:
+                    heapq.heappush(events, (flow[0], EXPIRY, next(seq), None))
+
+        return self._end_metrics(all_metrics)
 
     def run_and_trace(self, name, workload, old=False, sync_period=0,
                       step_size=1, ignore_remaining=False, show_graph=False,
-                      staleness=0):
+                      staleness=0, event_driven=False, metrics_chunk=1000,
+                      return_metrics=True, metrics=None,
+                      metric_intervals=None, sync=None, batch=False):
         """
         Run and produce a log of the simulation for each timestep
         Convert an old format workload to new format if old=TRUE
+        Use the discrete-event engine (run_events) if event_driven=True
         
         Dump the metrics, workload, and (if old-format) the converted
-        new-format workload to JSON as files
+        new-format workload to JSON as files. The new-format workload is also
+        written in the binary workload format (see write_binary_workload), to
+        the .bin file next to its JSON log. Metrics are streamed to the
+        .metrics file in chunks of metrics_chunk samples while the simulation
+        runs (see MetricsWriter).
+
+        metrics and metric_intervals select the metrics collected, sync the
+        sync scheduler and batch the processing of arrivals, see run.
+
+        Returns the metrics read back from the file (see read_metrics), or
+        None if return_metrics is False, which skips rereading them.
         """
+        if event_driven:
+            run = self.run_events
+        else:
+            run = self.run
+
         filename = 'logs/' + name 
         dir = os.path.dirname(filename)
+        # Runs of a sweep may create the directory concurrently
         try:
-                os.stat(dir)
-        except:
-                os.mkdir(dir)
-
-        f = open(filename + '.workload', 'w')
-        print >>f, json.dumps(workload,sort_keys=True, indent=4)
-        f.close()
+            os.makedirs(dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
 
         if (old):
+            f = open(filename + '.workload', 'w')
+            print >>f, json.dumps(workload,sort_keys=True, indent=4)
+            f.close()
             # log the converted old_to_new network graph
             workload = old_to_new(workload) 
-            f = open(filename + '.newworkload', 'w')
+            workloadfile = filename + '.newworkload'
+        else:
+            workloadfile = filename + '.workload'
+        binfile = workloadfile + '.bin'
+        write_binary_workload(workload, binfile)
+        if isinstance(workload, (list, tuple)):
+            f = open(workloadfile, 'w')
             print >>f, json.dumps(workload,sort_keys=True, indent=4)
             f.close()
-            metrics = self.run(workload, sync_period, step_size,
-                               ignore_remaining, show_graph=show_graph,
-                               staleness=staleness)
         else:
-            metrics = self.run(workload, sync_period, step_size,
-                               ignore_remaining, show_graph=show_graph,
-                               staleness=staleness)
+            binary_to_json_workload(binfile, workloadfile)
+            if not isinstance(workload, Workload):
+                # Writing consumed a one-shot iterable, replay it from the file
+                workload = Workload.load(binfile)
 
-        f = open(filename + '.metrics', 'w')
-        print >>f, json.dumps(metrics, sort_keys=True, indent=4)
-        f.close()
+        writer = MetricsWriter(filename + '.metrics', metrics_chunk)
+        try:
+            run(workload, sync_period, step_size, ignore_remaining,
+                show_graph=show_graph, staleness=staleness,
+                metrics_writer=writer, metrics=metrics,
+                metric_intervals=metric_intervals, sync=sync, batch=batch)
+        finally:
+            # Keep the samples collected so far, even if the run failed
+            writer.close()
 
         if show_graph:
             # log the network graph if not already drawn
@@ -416,39 +816,60 @@ class LinkBalancerSim(Simulation):
                 plt.savefig(filename + ".pdf")
                 plt.close()
 
-        return metrics
+        if return_metrics:
+            return read_metrics(filename + '.metrics')
 
     def state_distances(self, graph, time_step, new_reqs):
         """ Calcuate the pairwise euclidean distance between Physical network
-        and each NIB in the simulation. Assumes a maximum of two NIBs
-        (controllers)
-        """
-        # Euclidean distance between: two NIB replicas, NIB replica 0 and phys
-        # network, and NIB replica 1 and phys network
-        if len(self.ctrls) != 2:
-            return None
+        and each NIB in the simulation.
 
-        c0 = [v['used'] for (s,d,v) in (self.ctrls[0].graph.edges(data=True))]
-        c1 = [v['used'] for (s,d,v) in (self.ctrls[1].graph.edges(data=True))]
-        pn = [v['used'] for (s,d,v) in (self.graph.edges(data=True))]
-
-        d_c0_c1 = sqrt(sum([(v1-v2)**2 for (v1,v2) in zip(c0,c1)]))
-        d_c0_pn = sqrt(sum([(v1-v2)**2 for (v1,v2) in zip(c0,pn)]))
-        d_c1_pn = sqrt(sum([(v1-v2)**2 for (v1,v2) in zip(c1,pn)]))
-
-        return (d_c0_c1, d_c0_pn, d_c1_pn)
+        Returns the distances between every pair of NIB replicas (controllers
+        c0, c1, ...) and the physical network pn, ordered as in
+        itertools.combinations([c0, c1, ..., pn], 2). For two controllers
+        these are (c0-c1, c0-pn, c1-pn).
+        """
+        tables = ([ctrl.link_table() for ctrl in self.ctrls] +
+                  [self.link_table()])
+        divergence = self.divergence
+        if divergence is None or not divergence.valid_for(tables):
+            if divergence is not None:
+                divergence.close()
+            divergence = LinkDivergence(tables)
+            self.divergence = divergence
+        return divergence.distances()
+
+    def new_trace(self, samples=None):
+        """
+        Return an empty SimulationTrace over the links, servers, switches and
+        controllers of the simulation, with room for samples samples
+        """
+        table = self.link_table()
+        self.trace_links = list(table.links)
+        self.trace_servers = self._server_links(self.graph)
+        self.trace_switch_ids = dict((sw, i) for i, sw in
+                                     enumerate(self.switches))
+        return SimulationTrace(
+            self.trace_links, table.capacity[table.ids_for(self.trace_links)],
+            self.servers,
+            table.capacity[table.ids_for(self.trace_servers)],
+            self.switches, [ctrl.name for ctrl in self.ctrls], rows=samples)
 
     def simulation_trace(self, graph, time_step, new_reqs):
-        result = OrderedDict([
-         ("time", time_step),
-         #("new_reqs", new_reqs),
-         ("servers",  map(lambda(x): (x, self.server_utilization(x)), self.servers)),
-         ("ingress",  sum_grouped_by(lambda(flow): (flow[1][-1], flow[2]), self.active_flows)),
-         ("pn_view", [(v['used']/v['capacity'], s, d) for (s,d,v) in (self.graph.edges(data=True))]),
-         ("pn_view_raw", [(v['used'], s, d) for (s,d,v) in (self.graph.edges(data=True))])
-         ]
-        )
-        # distributed NIB state
+        """
+        Return a sample of the simulation state for SimulationTrace.append:
+        the utilization of server links, demand by ingress switch and the
+        utilization of every link in the physical network and each NIB.
+        """
+        if self.trace_links is None:
+            raise Exception("simulation_trace sampled before new_trace; "
+                            "collect it through run or run_events")
+        table = self.link_table()
+        ingress = np.zeros(len(self.switches))
+        for flow in self.active_flows:
+            ingress[self.trace_switch_ids[flow[1][-1]]] += flow[2]
+        views = []
         for ctrl in self.ctrls:
-            result['%s_view'%(ctrl.name)] = [(v['used']/v['capacity'], s, d) for (s,d,v) in (ctrl.graph.edges(data=True))]
-        return result
+            view = ctrl.link_table()
+            views.append(view.used[view.ids_for(self.trace_links)])
+        return (time_step, table.used[table.ids_for(self.trace_servers)],
+                ingress, table.used[table.ids_for(self.trace_links)], views)
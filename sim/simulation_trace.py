@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+try:
+    # OrderedDict for python>=2.7
+    from collections import OrderedDict
+except:
+    try:
+        # OrderedDict for python=2.6
+        from ordereddict import OrderedDict
+    except:
+        # OrderedDict backport for python<2.7
+        from lib.ordered_dict import OrderedDict
+
+import numpy as np
+
+class SimulationTrace(object):
+    """
+    Columnar record of the simulation state at each metric sample.
+
+    Names appear once, in the header: links (as (src, dst) pairs) and their
+    capacity, servers and the capacity of their links, ingress switches and
+    the names of the NIB views (controllers). Each sample is one row of the
+    columns:
+
+        time:          (samples)
+        servers:       (samples x servers) utilization of each server link
+        ingress:       (samples x switches) demand of the active flows by
+                       ingress switch
+        pn_view_raw:   (samples x links) utilization of each link in the
+                       physical network
+        <name>_view_raw: (samples x links) utilization of each link as seen
+                       by the NIB of controller name
+
+    Columns are preallocated for the expected number of samples and grow by
+    doubling beyond it. Indexing or iterating
+    yields the samples in the former per-sample layout (an OrderedDict with
+    time, servers, ingress, pn_view, pn_view_raw and <name>_view), built on
+    demand.
+    """
+
+    # Rows allocated up front if the number of samples is not known
+    initial_rows = 16
+
+    def __init__(self, links, capacity, servers, server_capacity, switches,
+                 views, dtype=np.float64, rows=None):
+        """
+        links: list of (src, dst) pairs
+        capacity: capacity of each link
+        servers: list of server names
+        server_capacity: capacity of the link of each server
+        switches: list of ingress switch names
+        views: list of NIB view names
+        dtype: numpy type of the utilization columns
+        rows: number of samples expected, allocated up front (default:
+            initial_rows)
+        """
+        self.links = [tuple(link) for link in links]
+        self.capacity = np.asarray(capacity, dtype=float)
+        self.servers = list(servers)
+        self.server_capacity = np.asarray(server_capacity, dtype=float)
+        self.switches = list(switches)
+        self.views = list(views)
+        self.rows = 0
+
+        shapes = [('time', (), float),
+                  ('servers', (len(self.servers),), dtype),
+                  ('ingress', (len(self.switches),), dtype),
+                  ('pn_view_raw', (len(self.links),), dtype)]
+        shapes.extend([('%s_view_raw' % name, (len(self.links),), dtype)
+                       for name in self.views])
+        if rows is None:
+            rows = self.initial_rows
+        rows = max(1, rows)
+        self.data = OrderedDict((name, np.zeros((rows,) + shape,
+                                                dtype=coltype))
+                                for name, shape, coltype in shapes)
+
+    def _grow(self):
+        """Double the number of allocated rows"""
+        for name, column in self.data.items():
+            grown = np.zeros((2 * len(column),) + column.shape[1:],
+                             dtype=column.dtype)
+            grown[:len(column)] = column
+            self.data[name] = grown
+
+    def append(self, sample):
+        """
+        Append a sample (time, servers, ingress, pn_view_raw, views), where
+        views is a list of rows, one per NIB view
+        """
+        (time, servers, ingress, pn, views) = sample
+        if self.rows == len(self.data['time']):
+            self._grow()
+        row = self.rows
+        self.data['time'][row] = time
+        self.data['servers'][row] = servers
+        self.data['ingress'][row] = ingress
+        self.data['pn_view_raw'][row] = pn
+        for name, view in zip(self.views, views):
+            self.data['%s_view_raw' % name][row] = view
+        self.rows += 1
+
+    def repeat(self, time):
+        """Append a copy of the last sample, taken at time"""
+        if self.rows == len(self.data['time']):
+            self._grow()
+        for column in self.data.values():
+            column[self.rows] = column[self.rows - 1]
+        self.data['time'][self.rows] = time
+        self.rows += 1
+
+    def column(self, name):
+        """Return the column name, one entry per sample"""
+        return self.data[name][:self.rows]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.rows
+        if not 0 <= i < self.rows:
+            raise IndexError(i)
+        time = self.data['time'][i].item()
+        servers = self.data['servers'][i].tolist()
+        capacity = self.server_capacity.tolist()
+        ingress = self.data['ingress'][i].tolist()
+        result = OrderedDict([
+         ("time", int(time) if time.is_integer() else time),
+         ("servers", [(s, (used, cap)) for s, used, cap in
+                      zip(self.servers, servers, capacity)]),
+         ("ingress", dict((sw, value) for sw, value in
+                          zip(self.switches, ingress) if value != 0)),
+         ("pn_view", self._view(self.data['pn_view_raw'][i], True)),
+         ("pn_view_raw", self._view(self.data['pn_view_raw'][i], False))
+         ]
+        )
+        for name in self.views:
+            result['%s_view' % name] = self._view(
+                self.data['%s_view_raw' % name][i], True)
+        return result
+
+    def __iter__(self):
+        for i in xrange(self.rows):
+            yield self[i]
+
+    def __eq__(self, other):
+        if not isinstance(other, SimulationTrace):
+            return NotImplemented
+        return (self.links == other.links and self.servers == other.servers
+                and self.switches == other.switches
+                and self.views == other.views
+                and np.array_equal(self.capacity, other.capacity)
+                and np.array_equal(self.server_capacity,
+                                   other.server_capacity)
+                and self.rows == other.rows
+                and all(np.array_equal(self.column(name), other.column(name))
+                        for name in self.data))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __repr__(self):
+        return "SimulationTrace(%d samples, %d links, %d views)" % (
+            self.rows, len(self.links), len(self.views))
+
+    def _view(self, used, fraction):
+        """Return a row of link utilization as [(value, src, dst), ...]"""
+        if fraction:
+            used = used / self.capacity
+        return [(value, s, d) for value, (s, d) in
+                zip(used.tolist(), self.links)]
+
+    def discard(self, rows):
+        """Drop the first rows samples, e.g. after they have been written"""
+        rows = min(rows, self.rows)
+        for column in self.data.values():
+            column[:self.rows - rows] = column[rows:self.rows]
+        self.rows -= rows
+
+    def header(self):
+        """Return the names and capacities of the trace as a JSON object"""
+        return OrderedDict([
+            ('links', [list(link) for link in self.links]),
+            ('capacity', self.capacity.tolist()),
+            ('servers', self.servers),
+            ('server_capacity', self.server_capacity.tolist()),
+            ('switches', self.switches),
+            ('views', self.views)])
+
+    def to_json(self, rows=None, header=True):
+        """
+        Return the trace as a dict of JSON-serializable header and columns.
+        Only the first rows samples are included if rows is given, and the
+        header is left out if header is False.
+        """
+        if rows is None:
+            rows = self.rows
+        columns = OrderedDict((name, self.column(name)[:rows].tolist())
+                              for name in self.data)
+        if not header:
+            return OrderedDict([('columns', columns)])
+        return OrderedDict([('header', self.header()), ('columns', columns)])
+
+    @classmethod
+    def from_json(cls, obj):
+        """Return the trace represented by obj, as returned by to_json"""
+        header = obj['header']
+        columns = obj['columns']
+        rows = len(columns['time'])
+        trace = cls(header['links'], header['capacity'], header['servers'],
+                    header['server_capacity'], header['switches'],
+                    header['views'], rows=rows)
+        for name, column in trace.data.items():
+            if rows > 0:
+                column[:rows] = columns[name]
+        trace.rows = rows
+        return trace
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import errno
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+
+# Read-only data of a sweep by key, e.g. workloads replayed by many jobs.
+# Jobs refer to it by key instead of carrying it, see share.
+_shared = {}
+
+def share(key, value):
+    """
+    Make value available to the jobs of later sweeps as shared_value(key).
+    Worker processes are forked when run_sweep starts, so they inherit the
+    shared values without copying or pickling them.
+    """
+    _shared[key] = value
+
+def is_shared(key):
+    """Return True if a value is shared under key"""
+    return key in _shared
+
+def shared_value(key):
+    """Return the value shared under key, see share"""
+    return _shared[key]
+
+def config_hash(config):
+    """
+    Return a hex digest identifying config, a JSON-serializable description
+    of everything that determines the results of a job. Equal configs have
+    equal hashes regardless of dict ordering.
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()
+
+def file_hash(filename):
+    """Return a hex digest of the contents of filename, e.g. to identify an
+    input file in the config of a job"""
+    digest = hashlib.sha1()
+    f = open(filename, 'rb')
+    try:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+class SweepCache(object):
+    """
+    Record of the jobs of a sweep whose results are complete, so that running
+    the sweep again skips them and an interrupted sweep resumes with the jobs
+    it did not finish.
+
+    Each job must have a 'name', under which its outputs are stored, and a
+    'config', see config_hash. A finished job leaves a marker <name>.done in
+    directory with the hash of its config. A job is cached if the marker
+    matches its current config and all of its outputs exist; a job whose
+    config changed is run again.
+    """
+
+    def __init__(self, directory, outputs=('.metrics',), force=False):
+        """
+        directory: where the outputs and markers of jobs are stored
+        outputs: suffixes of the files a job writes, as directory/<name><suffix>
+        force: run all jobs, replacing their cached results
+        """
+        self.directory = directory
+        self.outputs = outputs
+        self.force = force
+        # Created here, before any worker process writes to it
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _path(self, job, suffix):
+        return os.path.join(self.directory, job['name'] + suffix)
+
+    def is_done(self, job):
+        """Return True if the results of job are cached"""
+        if self.force:
+            return False
+        try:
+            f = open(self._path(job, '.done'), 'r')
+            done = json.load(f)
+            f.close()
+        except (IOError, ValueError):
+            return False
+        if done.get('hash') != config_hash(job['config']):
+            return False
+        return all(os.path.exists(self._path(job, suffix))
+                   for suffix in self.outputs)
+
+    def start(self, job):
+        """Forget the cached results of job, before its outputs are replaced"""
+        try:
+            os.remove(self._path(job, '.done'))
+        except OSError:
+            pass
+
+    def finish(self, job):
+        """Record that the outputs of job are complete"""
+        marker = self._path(job, '.done')
+        # Rename the complete marker into place, so that a marker is never
+        # read half written
+        f = open(marker + '.tmp', 'w')
+        json.dump({'hash': config_hash(job['config']), 'config': job['config']},
+                  f, sort_keys=True, indent=4)
+        f.close()
+        os.rename(marker + '.tmp', marker)
+
+
+def _run_job(args):
+    """Run a single sweep job, recording it in the cache if there is one.
+    Module-level so that multiprocessing can pickle it."""
+    fcn, job, cache = args
+    if cache is None:
+        return fcn(job)
+    cache.start(job)
+    result = fcn(job)
+    cache.finish(job)
+    return result
+
+def run_sweep(jobs, fcn, processes=None, cache=None):
+    """
+    Run fcn(job) for every job, each independent of the others.
+
+    jobs: list of job descriptions. They are pickled to reach the worker
+        processes, so large read-only inputs should be passed by key, see
+        share.
+    fcn: module-level function running a single job
+    processes: number of worker processes running jobs in parallel (serial
+        in this process if None or 1)
+    cache: SweepCache skipping the jobs whose results are cached and
+        recording the jobs that finish, or None to run all jobs
+    returns: list of the results of fcn, in the order of jobs, with None
+        for jobs skipped as cached
+    """
+    results = [None] * len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        if cache is not None and cache.is_done(job):
+            logging.info("Skipping %s, results are cached", job['name'])
+        else:
+            pending.append(i)
+    args = [(fcn, jobs[i], cache) for i in pending]
+
+    if not processes or processes <= 1:
+        done = map(_run_job, args)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            # map_async with a timeout keeps the sweep interruptible with Ctrl-C
+            done = pool.map_async(_run_job, args,
+                                  chunksize=1).get(365 * 24 * 3600)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    for i, result in zip(pending, done):
+        results[i] = result
+    return results
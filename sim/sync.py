@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+from itertools import product
+import random
+
+# Sync topologies of sync_scheduler
+SYNC_TOPOLOGIES = ('all', 'ring', 'tree', 'gossip', 'pairwise')
+
+class SyncScheduler(object):
+    """
+    Decides which controllers push their state toward which others in a sync
+    round of a LinkBalancerSim, see LinkBalancerSim.sync_ctrls. Subclasses
+    define the pushes of a round.
+
+    A push from src to dst is src.sync_toward(dst), which only carries the
+    links of src's own domain. If relay is True, src also forwards the state
+    of other domains it has learned, with src.relay_toward(dst, links), when
+    it is newer than what dst knows. The version of each domain's state is the
+    round in which its controller pushed it, so forwarded state never
+    replaces newer state.
+    """
+
+    relay = False
+
+    def __init__(self):
+        self.reset([])
+
+    def reset(self, ctrls):
+        """Forget all state of previous rounds, e.g. at the start of a run"""
+        self.round = 0
+        # Round of the newest state of each origin controller known to each
+        # controller, by (ctrl, origin)
+        self.known = {}
+
+    def pushes(self, ctrls, now):
+        """Return the (src, dst) pairs pushed in a round at time now, in order"""
+        raise NotImplementedError("SyncScheduler does not implement pushes")
+
+    def sync(self, ctrls, now=None):
+        """Run a sync round among ctrls at time now (None if unknown)"""
+        self.round += 1
+        for src, dst in self.pushes(ctrls, now):
+            self.push(ctrls, src, dst)
+
+    def push(self, ctrls, src, dst):
+        """Push the state of src, and if relay what it learned, toward dst"""
+        src.sync_toward(dst)
+        if not self.relay:
+            return
+        self.known[(dst, src)] = self.round
+        for origin in ctrls:
+            if origin is src or origin is dst or not origin.mylinks:
+                continue
+            version = self.known.get((src, origin), 0)
+            if version > self.known.get((dst, origin), 0):
+                src.relay_toward(dst, origin.mylinks)
+                self.known[(dst, origin)] = version
+
+
+class AllToAllSync(SyncScheduler):
+    """Every controller pushes toward every other controller"""
+
+    def pushes(self, ctrls, now):
+        return [(a, b) for a, b in product(ctrls, ctrls) if a != b]
+
+
+class RingSync(SyncScheduler):
+    """
+    Every controller pushes toward the next one in a ring, forwarding what it
+    learned from its predecessors. A domain's state reaches all controllers
+    after at most len(ctrls) - 1 rounds.
+    """
+
+    relay = True
+
+    def pushes(self, ctrls, now):
+        if len(ctrls) < 2:
+            return []
+        return [(ctrls[i], ctrls[(i + 1) % len(ctrls)])
+                for i in range(len(ctrls))]
+
+
+class TreeSync(SyncScheduler):
+    """
+    Hierarchical aggregation over a tree of the given fanout, rooted at the
+    first controller: state is first aggregated from the leaves up to the
+    root, then disseminated back down, so every controller learns the state
+    of every domain in each round with 2 * (len(ctrls) - 1) pushes.
+    """
+
+    relay = True
+
+    def __init__(self, fanout=2):
+        super(TreeSync, self).__init__()
+        assert fanout > 0
+        self.fanout = fanout
+
+    def pushes(self, ctrls, now):
+        parent = lambda i: (i - 1) // self.fanout
+        up = [(ctrls[i], ctrls[parent(i)])
+              for i in reversed(range(1, len(ctrls)))]
+        down = [(ctrls[parent(i)], ctrls[i]) for i in range(1, len(ctrls))]
+        return up + down
+
+
+class GossipSync(SyncScheduler):
+    """
+    Randomized gossip: every controller pushes toward fanout peers chosen
+    uniformly at random in each round, forwarding what it learned. The peers
+    are drawn from a random.Random(seed), reseeded by reset.
+    """
+
+    relay = True
+
+    def __init__(self, fanout=1, seed=None):
+        self.fanout = fanout
+        self.seed = seed
+        super(GossipSync, self).__init__()
+
+    def reset(self, ctrls):
+        super(GossipSync, self).reset(ctrls)
+        self.random = random.Random(self.seed)
+
+    def pushes(self, ctrls, now):
+        pushes = []
+        for src in ctrls:
+            peers = [ctrl for ctrl in ctrls if ctrl is not src]
+            for dst in self.random.sample(peers, min(self.fanout, len(peers))):
+                pushes.append((src, dst))
+        return pushes
+
+
+class PairwiseSync(SyncScheduler):
+    """
+    All-to-all pushes, each pair with a sync period of its own: a controller
+    pushes toward another once at least the period of the pair has elapsed
+    since their last push (or since time 0). Pairs are only considered in
+    sync rounds, so periods are effectively rounded up to the sync period of
+    the run.
+
+    periods: dict of (src name, dst name) to sync period. A period of None
+    means the pair never syncs.
+    default: period of the pairs not in periods
+    """
+
+    def __init__(self, periods=None, default=0):
+        self.periods = dict(periods or {})
+        self.default = default
+        super(PairwiseSync, self).__init__()
+
+    def reset(self, ctrls):
+        super(PairwiseSync, self).reset(ctrls)
+        # Time of the last push of each pair, by (src, dst)
+        self.last = {}
+
+    def pushes(self, ctrls, now):
+        pushes = []
+        for a, b in product(ctrls, ctrls):
+            if a == b:
+                continue
+            period = self.periods.get((a.name, b.name), self.default)
+            if period is None:
+                continue
+            if now is not None:
+                if now - self.last.get((a, b), 0) < period:
+                    continue
+                self.last[(a, b)] = now
+            pushes.append((a, b))
+        return pushes
+
+
+def sync_scheduler(topology='all', fanout=None, seed=None, periods=None,
+                   default_period=0):
+    """
+    Return a new SyncScheduler for a topology of SYNC_TOPOLOGIES
+
+    fanout: children per node of 'tree' (default 2), peers per controller
+        and round of 'gossip' (default 1)
+    seed: seed of 'gossip'
+    periods, default_period: sync periods of 'pairwise', see PairwiseSync
+    """
+    if topology == 'all':
+        return AllToAllSync()
+    elif topology == 'ring':
+        return RingSync()
+    elif topology == 'tree':
+        return TreeSync(fanout or 2)
+    elif topology == 'gossip':
+        return GossipSync(fanout or 1, seed)
+    elif topology == 'pairwise':
+        return PairwiseSync(periods, default_period)
+    raise Exception("Unknown sync topology %s, choose from %s" %
+                    (topology, ", ".join(SYNC_TOPOLOGIES)))
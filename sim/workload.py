@@ -5,11 +5,156 @@
 
 import json
 import logging
-from math import floor, pi, sin
-from random import choice, randint, random
+from math import pi
+import multiprocessing
+import os
 import random
 import unittest
 
+import numpy as np
+
+# Binary workload files start with WORKLOAD_MAGIC, followed by a single line
+# JSON header holding the switch name table and the number of records, padded
+# to a multiple of 8 bytes. The fixed-width records follow the header.
+WORKLOAD_MAGIC = 'SDNCTRLSIM WORKLOAD 1\n'
+WORKLOAD_RECORD = np.dtype([('time', '<f8'), ('switch', '<u4'),
+                            ('size', '<f8'), ('duration', '<f8')])
+
+class WorkloadCursor(object):
+    """
+    Read-only cursor over a new-style workload: any iterable of
+    (time of arrival, arriving at switch, size, duration) requests, e.g. a
+    Workload, a list, a generator or a file reader. The workload itself is never modified,
+    so a single in-memory workload can be replayed by many simulation runs.
+    """
+
+    def __init__(self, workload):
+        self.requests = iter(workload)
+        self.advance()
+
+    def peek(self):
+        """Return the current request, or None if the workload is exhausted"""
+        return self.current
+
+    def advance(self):
+        """Move to the next request and return the previous current one"""
+        previous = getattr(self, 'current', None)
+        self.current = next(self.requests, None)
+        return previous
+
+    def exhausted(self):
+        return self.current is None
+
+
+class Workload(object):
+    """
+    Columnar new-style workload: parallel numpy arrays holding the arrival
+    time, switch index, size and duration of each request, and the table of
+    switch names the indices refer to. Requests are ordered by arrival time.
+
+    A Workload can be used wherever a list of
+    (time of arrival, arriving at switch, size, duration) tuples is expected:
+    iterating it yields such tuples, and it can be replayed any number of
+    times. Slices (by position, or by time with window) share the arrays of
+    the original workload.
+    """
+
+    # Number of requests converted to tuples at once while iterating
+    chunksize = 65536
+
+    def __init__(self, switches, times, switch_ids, sizes, durations):
+        self.switches = list(switches)
+        self.times = np.asarray(times, dtype=float)
+        self.switch_ids = np.asarray(switch_ids, dtype=np.uint32)
+        self.sizes = np.asarray(sizes)
+        self.durations = np.asarray(durations)
+        assert (len(self.times) == len(self.switch_ids) == len(self.sizes)
+                == len(self.durations))
+
+    @classmethod
+    def from_tuples(cls, workload):
+        """
+        Build a Workload from any iterable of
+        (time of arrival, arriving at switch, size, duration) requests
+        """
+        switches = []
+        index = {}
+        times = []
+        switch_ids = []
+        sizes = []
+        durations = []
+        for time, sw, size, duration in workload:
+            if sw not in index:
+                index[sw] = len(switches)
+                switches.append(sw)
+            times.append(time)
+            switch_ids.append(index[sw])
+            sizes.append(size)
+            durations.append(duration)
+        return cls(switches, times, switch_ids, sizes, durations)
+
+    @classmethod
+    def from_records(cls, switches, records):
+        """Build a Workload on an array of WORKLOAD_RECORDs without copying"""
+        return cls(switches, records['time'], records['switch'],
+                   records['size'], records['duration'])
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a workload file of any format. Binary workload files are
+        memory-mapped (see load_binary_workload), JSON ones are decoded.
+        """
+        if is_binary_workload(filename):
+            return cls.from_records(*load_binary_workload(filename))
+        return cls.from_tuples(read_workload(filename))
+
+    def records(self):
+        """Return the requests as an array of WORKLOAD_RECORDs"""
+        records = np.empty(len(self), dtype=WORKLOAD_RECORD)
+        records['time'] = self.times
+        records['switch'] = self.switch_ids
+        records['size'] = self.sizes
+        records['duration'] = self.durations
+        return records
+
+    def to_tuples(self):
+        """Return the requests as a list of (time, switch, size, duration)"""
+        return list(self)
+
+    def window(self, start, end=None):
+        """Return the requests arriving at or after start and before end"""
+        first = np.searchsorted(self.times, start, side='left')
+        if end is None:
+            return self[first:]
+        return self[first:np.searchsorted(self.times, end, side='left')]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Workload(self.switches, self.times[index],
+                            self.switch_ids[index], self.sizes[index],
+                            self.durations[index])
+        return (self.times[index].item(),
+                self.switches[self.switch_ids[index]],
+                self.sizes[index].item(), self.durations[index].item())
+
+    def __iter__(self):
+        switches = self.switches
+        for start in xrange(0, len(self), self.chunksize):
+            chunk = self[start:start + self.chunksize]
+            for req in zip(chunk.times.tolist(),
+                           [switches[i] for i in chunk.switch_ids.tolist()],
+                           chunk.sizes.tolist(), chunk.durations.tolist()):
+                yield req
+
+    def __repr__(self):
+        return '<Workload: %d requests at %d switches>' % (len(self),
+                                                            len(self.switches))
+
+
 def unit_workload(sw, size, duration, numreqs):
     """
     Return workload description with unit demands and unit length.
@@ -30,75 +175,378 @@ def unit_workload(sw, size, duration, numreqs):
 
     return workload
 
-def expo_workload(switches, period, timesteps, interarrival_alpha, duration_shape, filename='expo.workload'):
+def expo_workload(switches, period, timesteps, interarrival_alpha, duration_shape, filename='expo.workload', stream=False, offsets=None, seed=None, processes=None, columnar=False):
     """ Exponentially distributed inter-arrival times with weibull duration distribution
 
+    The workload is read from filename if that file exists and was generated
+    with the same arguments (recorded in its header, see write_workload).
+    Otherwise it is generated by expo_arrays and written to filename,
+    replacing a file generated with other arguments. Files without a header
+    (as written by earlier versions) are only read if seed is None.
+
     sw: list of switch names
     max_demand: link utilization (unitless)
     duration: time until flow terminates (unitless)
     timesteps: number of simulation timesteps until last arrival occurs
     numreq: number of requests
+    stream: if the workload file exists, return a generator reading it
+        incrementally (see read_workload) instead of a list
+    offsets: per-switch phase offsets of the arrival rate, see expo_arrays
+    seed: seed of the generated workload, see expo_arrays. If None, a file
+        generated with any seed is read, otherwise a fresh seed is picked and
+        recorded in the header of the file.
+    processes: number of processes generating switches in parallel
+    columnar: return a Workload instead of a list
     returns: workload structure
         (time of arrival, arriving at switch, size, duration)
     """
+    if seed is not None:
+        seed = workload_seed(seed)
+    args = {'switches': switches, 'period': period, 'timesteps': timesteps,
+            'interarrival_alpha': interarrival_alpha,
+            'duration_shape': duration_shape, 'offsets': offsets,
+            'seed': seed}
+    # Compare arguments as they read back from the header
+    args = json.loads(json.dumps(args))
+
+    if os.path.exists(filename):
+        header = read_workload_header(filename)
+        if header is None:
+            if seed is not None:
+                raise ValueError("Workload file %s records no seed, remove it "
+                                 "to generate a workload with seed %d" %
+                                 (filename, seed))
+            generated = args
+        else:
+            generated = header.get('args', {})
+            if seed is None:
+                args['seed'] = generated.get('seed')
+        if generated == args:
+            if columnar:
+                logging.info("Loading workload from file: %s", filename)
+                return Workload.load(filename)
+            if stream:
+                logging.info("Streaming workload from file: %s", filename)
+                return read_workload(filename)
+
+            workload = list(read_workload(filename))
+            logging.info("Read workload from file: %s", filename)
+
+            return workload
+        logging.info("Workload file %s was generated with other arguments, "
+                     "regenerating it", filename)
+
+    args['seed'] = workload_seed(seed)
+    workload = Workload(switches, *expo_arrays(
+        len(switches), period, timesteps, interarrival_alpha,
+        duration_shape, offsets, args['seed'], processes))
+
+    write_workload(workload, filename,
+                   header={'generator': 'expo_workload', 'args': args})
+    logging.info("Created workload and wrote to file: %s", filename)
+
+    if columnar:
+        return workload
+    return workload.to_tuples()
+
+def workload_seed(seed=None):
+    """
+    Return an integer base seed for the workload generators.
+
+    seed: an integer is returned as is, a numpy.random.RandomState or
+        random.Random draws the seed. None picks a fresh seed, which is logged
+        so that the workload can be reproduced.
+    """
+    if seed is None:
+        seed = np.random.RandomState().randint(2 ** 31)
+        logging.warning("No workload seed given, using seed %d", seed)
+    elif isinstance(seed, np.random.RandomState):
+        seed = seed.randint(2 ** 31)
+    elif isinstance(seed, random.Random):
+        seed = seed.randint(0, 2 ** 31 - 1)
+    return int(seed)
+
+def switch_random_state(seed, index):
+    """
+    Return the random substream of switch number index for base seed seed.
+    Substreams of different switches are independent, so the requests of
+    each switch can be generated separately (e.g. in different processes).
+    """
+    return np.random.RandomState([seed, index])
+
+def expo_switch_arrays(seed, index, period, offset, timesteps,
+                       interarrival_alpha, duration_shape, batchsize=1 << 20):
+    """
+    Generate the requests of switch number index of expo_arrays from its own
+    random substream. Arrival times in [0, timesteps) are generated by
+    thinning a homogeneous Poisson process running at the maximum rate.
+
+    returns: (times, durations) numpy arrays sorted by arrival time
+    """
+    rng = switch_random_state(seed, index)
+    max_rate = interarrival_alpha / 3.0 + interarrival_alpha
+    batches = []
+    start = 0.0
+    while start < timesteps:
+        times = start + np.cumsum(rng.exponential(1.0 / max_rate, batchsize))
+        start = times[-1]
+        times = times[times < timesteps]
+        rate = (interarrival_alpha / 3.0 +
+                interarrival_alpha * wave(times, period, offset, 10) / 10)
+        batches.append(times[rng.uniform(size=len(times)) * max_rate < rate])
+    times = np.concatenate(batches)
+    # numpy's weibull has scale 1, duration_shape is its shape parameter
+    durations = np.floor(rng.weibull(duration_shape, len(times)) + 1).astype(int)
+    return (times, durations)
+
+def _expo_switch_arrays(args):
+    """Unpack the arguments of expo_switch_arrays for multiprocessing"""
+    return expo_switch_arrays(*args)
+
+def expo_arrays(numswitches, period, timesteps, interarrival_alpha,
+                duration_shape, offsets=None, seed=None, processes=None):
+    """
+    Columnar version of the expo_workload generator.
+
+    Arrivals at each switch form a Poisson process whose rate follows a wave
+    between interarrival_alpha/3 and 4*interarrival_alpha/3 with the given
+    period. Durations are 1 + weibull distributed with shape duration_shape
+    (scale 1), truncated to integers, and sizes are 1.
+
+    numswitches: number of switches
+    offsets: phase offset of each switch's rate (same units as period).
+        By default the phases are spread evenly: with two switches the first
+        is offset by period/2 and the second is not offset.
+    seed: base seed, see workload_seed. Each switch draws from its own
+        substream, see switch_random_state, so for a given seed the result
+        does not depend on processes.
+    processes: number of processes generating switches in parallel
+    returns: (times, switch indices, sizes, durations) numpy arrays sorted by
+        arrival time
+    """
+    if offsets is None:
+        offsets = [period * ((numswitches - 1 - i) % numswitches) /
+                   float(numswitches) for i in range(numswitches)]
+    assert len(offsets) == numswitches
+    seed = workload_seed(seed)
+
+    jobs = [(seed, i, period, offsets[i], timesteps, interarrival_alpha,
+             duration_shape) for i in range(numswitches)]
+    if processes and processes > 1:
+        pool = multiprocessing.Pool(processes)
+        streams = pool.map(_expo_switch_arrays, jobs)
+        pool.close()
+        pool.join()
+    else:
+        streams = map(_expo_switch_arrays, jobs)
+
+    times = np.concatenate([t for (t, d) in streams])
+    durations = np.concatenate([d for (t, d) in streams])
+    switch_ids = np.concatenate([np.repeat(np.uint32(i), len(t))
+                                 for i, (t, d) in enumerate(streams)])
+
+    # Merge the per-switch streams by arrival time
+    order = np.argsort(times, kind='mergesort')
+    sizes = np.ones(len(times), dtype=int)
+    return (times[order], switch_ids[order], sizes, durations[order])
+
+def write_workload(workload, filename, header=None):
+    """
+    Write a new-style workload to a file, one JSON-encoded request per line,
+    such that it can be read back incrementally by read_workload
+
+    header: dict written as the first line, e.g. describing how the workload
+        was generated, see read_workload_header
+    """
+    f = open(filename, 'w')
+    if header is not None:
+        print >>f, json.dumps(header, sort_keys=True)
+    for req in workload:
+        print >>f, json.dumps(list(req))
+    f.close()
+
+def read_workload(filename):
+    """
+    Generator over the requests of a workload file written by write_workload.
+    Requests are read and yielded one line at a time as
+    (time of arrival, arriving at switch, size, duration) tuples, so a trace
+    of any size can be simulated without loading it into memory.
+
+    Files holding a single indented JSON list (as written by earlier versions
+    of expo_workload) are still accepted, but are decoded as a whole. Binary
+    workload files are read through read_binary_workload. A header line
+    written by write_workload is skipped.
+    """
+    if is_binary_workload(filename):
+        for req in read_binary_workload(filename):
+            yield req
+        return
+
+    f = open(filename, 'r')
     try:
-        f = open(filename, 'r')
-        workload = json.loads("".join(f.readlines()).strip())
+        line = f.readline()
+        if line.strip() == '[':
+            f.seek(0)
+            for req in json.load(f):
+                yield tuple(req)
+            return
+        if line.startswith('{'):
+            line = f.readline()
+        while line:
+            if line.strip():
+                yield tuple(json.loads(line))
+            line = f.readline()
+    finally:
         f.close()
-        logging.info("Read workload from file: %s", filename)
-        
-        return workload
 
-    except:
-        workload = []
-        for i, switch in enumerate(switches):
-            time = 0
-            while time < timesteps:
-                if i == 0:
-                    #time += random.expovariate(interarrival_alpha + (interarrival_alpha/2 * (time / timesteps)))
-                    time += random.expovariate(interarrival_alpha/3 +
-                                               (3* interarrival_alpha *
-                                                (wave(time,period,period/2,10)/10)/3)
-                                               )
-                    duration = int((random.weibullvariate(1, duration_shape)+1))
-#                   print 10 + 10* (i*1.0/100)
-                elif i == 1:
-                    #time += random.expovariate(interarrival_alpha + interarrival_alpha/2 * (1 - (time / timesteps)))
-                    time += random.expovariate(interarrival_alpha/3 +
-                                               (3*interarrival_alpha *
-                                                (wave(time,period,0,10)/10)/3)
-                                               )
-#                    print 10 + 10* (1-(i*1.0/100))
-                    duration = int((random.weibullvariate(1, duration_shape)+1))
-                else:
-                    assert False
-                    time += random.expovariate(interarrival_alpha)
-                # random.weibullvariate(alpha, beta)
-                # alpha is the scale parameter and beta is shape.
-                size = 1
-                workload.append((time, switch, size, duration))
-            
-        workload = sorted(workload, key=lambda req: req[0]) 
-
-        f = open(filename, 'w')
-        print >>f, json.dumps(workload,sort_keys=True, indent=4)
+def read_workload_header(filename):
+    """
+    Return the header dict of a workload file written by write_workload, or
+    None if it has none
+    """
+    f = open(filename, 'r')
+    line = f.readline()
+    f.close()
+    if not line.startswith('{'):
+        return None
+    return json.loads(line)
+
+def is_binary_workload(filename):
+    """Return True if filename holds a workload written by write_binary_workload"""
+    f = open(filename, 'rb')
+    magic = f.read(len(WORKLOAD_MAGIC))
+    f.close()
+    return magic == WORKLOAD_MAGIC
+
+def write_binary_workload(workload, filename, chunksize=65536):
+    """
+    Write a new-style workload to a file in the compact binary format:
+    switch names are interned into a table in the file header, each request is
+    stored as a fixed-width WORKLOAD_RECORD (float64 time, uint32 switch id,
+    float64 size, float64 duration).
+
+    workload: a Workload, or any iterable of (time, switch, size, duration)
+        requests
+    chunksize: number of requests converted to records at once
+    """
+    if isinstance(workload, Workload):
+        switches = workload.switches
+        chunks = [workload.records()]
+    else:
+        switches, chunks = _binary_chunks(workload, chunksize)
+
+    header = json.dumps({'switches': switches,
+                         'count': sum([len(c) for c in chunks])})
+    padding = -(len(WORKLOAD_MAGIC) + len(header) + 1) % 8
+    f = open(filename, 'wb')
+    f.write(WORKLOAD_MAGIC)
+    f.write(header + ' ' * padding + '\n')
+    for chunk in chunks:
+        chunk.tofile(f)
+    f.close()
+
+def _binary_chunks(workload, chunksize):
+    """
+    Intern the switch names of an iterable of requests and convert them to
+    arrays of at most chunksize WORKLOAD_RECORDs
+
+    returns: (switches, list of record arrays)
+    """
+    switches = []
+    switch_ids = {}
+    chunks = []
+    chunk = []
+    for time, sw, size, duration in workload:
+        if sw not in switch_ids:
+            switch_ids[sw] = len(switches)
+            switches.append(sw)
+        chunk.append((time, switch_ids[sw], size, duration))
+        if len(chunk) == chunksize:
+            chunks.append(np.array(chunk, dtype=WORKLOAD_RECORD))
+            chunk = []
+    if len(chunk) > 0:
+        chunks.append(np.array(chunk, dtype=WORKLOAD_RECORD))
+    return (switches, chunks)
+
+def load_binary_workload(filename):
+    """
+    Map a binary workload file into memory without copying it.
+
+    returns: (switches, records) where switches is the list of switch names
+        indexed by the records' switch ids and records is a read-only
+        numpy.memmap of WORKLOAD_RECORDs. Processes mapping the same file
+        share its pages.
+    """
+    f = open(filename, 'rb')
+    magic = f.read(len(WORKLOAD_MAGIC))
+    if magic != WORKLOAD_MAGIC:
         f.close()
-        logging.info("Created workload and wrote to file: %s", filename)
+        raise ValueError("Not a binary workload file: %s" % filename)
+    header = json.loads(f.readline())
+    offset = f.tell()
+    f.close()
 
-        return workload
+    if header['count'] == 0:
+        records = np.zeros(0, dtype=WORKLOAD_RECORD)
+    else:
+        records = np.memmap(filename, dtype=WORKLOAD_RECORD, mode='r',
+                            offset=offset, shape=(header['count'],))
+    return (header['switches'], records)
+
+def read_binary_workload(filename, chunksize=65536):
+    """
+    Generator over the requests of a binary workload file, yielding
+    (time of arrival, arriving at switch, size, duration) tuples. Records are
+    decoded chunksize at a time from the memory-mapped file.
+    """
+    workload = Workload.from_records(*load_binary_workload(filename))
+    workload.chunksize = chunksize
+    for req in workload:
+        yield req
 
-def random_int_workload(sw, size, duration, numreqs):
+def json_to_binary_workload(src, dst):
+    """
+    Convert a workload file in JSON format (indented or one request per line)
+    to the binary format
+    """
+    write_binary_workload(read_workload(src), dst)
+
+def binary_to_json_workload(src, dst, lines=False):
+    """
+    Convert a binary workload file to the indented JSON format, or to the
+    line-oriented format of write_workload if lines=True. Integral sizes and
+    durations are written as integers, as in workloads created by this module.
+    """
+    def as_number(value):
+        if value.is_integer():
+            return int(value)
+        return value
+
+    workload = ((time, sw, as_number(size), as_number(duration))
+                for (time, sw, size, duration) in read_binary_workload(src))
+    if lines:
+        write_workload(workload, dst)
+    else:
+        f = open(dst, 'w')
+        print >>f, json.dumps(list(workload), sort_keys=True, indent=4)
+        f.close()
+
+def random_int_workload(sw, size, duration, numreqs, seed=None):
     """
     Return workload description with random demands and lengths.
+    Use Workload.from_tuples for a columnar workload.
+
+    seed: seed of the random choices, see workload_seed
     """
+    rng = random.Random(workload_seed(seed))
     workload = []
     minutil = 10
     maxutil = 10
     mindur = 1
     maxdur = 1
     for t in range(numreqs):
-        requests = (t, choice(sw), randint(minutil, maxutil),
-                    randint(mindur, maxdur))
+        requests = (t, rng.choice(sw), rng.randint(minutil, maxutil),
+                    rng.randint(mindur, maxdur))
         workload.append(requests)
     return workload
 
@@ -132,32 +580,87 @@ def generic_workload(switch_workload_fcns, size, duration, timesteps):
         # Each second-level list element is a tuple of:
         #   (switch, size, duration)
     """
+    requests = generic_arrays(switch_workload_fcns, size, duration, timesteps,
+                              strictly_increasing_time=False)
+    # Within a timestep, requests are ordered by switch: count them, and
+    # repeat one (switch, size, duration) tuple per switch
+    switches = requests.switches
+    counts = np.bincount(requests.times.astype(int) * len(switches) +
+                         requests.switch_ids,
+                         minlength=timesteps * len(switches))
+    counts = counts.reshape((timesteps, len(switches))).tolist()
+    switch_requests = [(sw, size, duration) for sw in switches]
     workload = []
-    switches = sorted(switch_workload_fcns.keys())
-    for t in range(timesteps):
-        requests = []
-        for sw in switches:
-            total_demand = switch_workload_fcns[sw](t)
-            # Approximate desired demand based on size
-            num_requests = int(floor(total_demand / float(size)))
-            for req in range(num_requests):
-                requests.append((sw, size, duration))
-        workload.append(requests)
+    for row in counts:
+        step = []
+        for request, num_requests in zip(switch_requests, row):
+            step.extend([request] * num_requests)
+        workload.append(step)
     return workload
 
 
+def demand_counts(switch_workload_fcns, size, timesteps):
+    """
+    Evaluate the workload function of every switch on all timesteps at once.
+    Workload functions are called with a numpy array of timesteps and must
+    return an array (or a constant) of demands, as sawtooth and wave do.
+
+    returns: (switches, counts) where switches is the sorted list of switch
+        names and counts is a (timesteps x switches) array of the number of
+        requests arriving at each switch in each timestep
+    """
+    switches = sorted(switch_workload_fcns.keys())
+    t = np.arange(timesteps)
+    counts = np.zeros((timesteps, len(switches)), dtype=int)
+    for i, sw in enumerate(switches):
+        total_demand = np.asarray(switch_workload_fcns[sw](t), dtype=float)
+        # Approximate desired demand based on size
+        counts[:, i] = np.maximum(np.floor(total_demand / float(size)), 0)
+    return (switches, counts)
+
+
+def generic_arrays(switch_workload_fcns, size, duration, timesteps,
+                   strictly_increasing_time=True):
+    """
+    Columnar, timestamped version of generic_workload: the same requests as
+    old_to_new(generic_workload(...)), built without the old-style lists.
+
+    returns: a Workload whose switch table is the sorted list of switch names
+    """
+    switches, counts = demand_counts(switch_workload_fcns, size, timesteps)
+    per_step = counts.sum(axis=1)
+    total = per_step.sum()
+    steps = np.repeat(np.arange(timesteps), per_step)
+    switch_ids = np.repeat(np.tile(np.arange(len(switches), dtype=np.uint32),
+                                   timesteps), counts.ravel())
+    if strictly_increasing_time:
+        # As in old_to_new, the j-th of the n requests of timestep i arrives
+        # at i + (j + 1) * 0.5 / n
+        j = np.arange(total) - np.repeat(np.cumsum(per_step) - per_step,
+                                         per_step)
+        times = steps + ((j + 1) * 0.5) / per_step[steps]
+    else:
+        times = steps.astype(float)
+    return Workload(switches, times, switch_ids, np.repeat(size, total),
+                    np.repeat(duration, total))
+
+
 def sawtooth(t, period, offset, max_demand, y_shift=0):
     """Sawtooth: 0 to full to 0 with specified period
+
+    t may be a single timestep, for which a float is returned, or a numpy
+    array of timesteps.
     
     y_shift: percentage of the max_demand to shift the entire workload up the
     y-axis. E.g., With max_demand = 60 and y_shift 1/2 will shift the wave up
     so that it oscillates between 90 and 30 demand units, instead of 60 and 0
     """
     phase = (t + offset) % float(period)
-    if phase < period / 2.0:
-        return phase / float(period / 2.0) * max_demand + (y_shift * max_demand)
-    else:
-        return (period - phase) / float(period / 2.0) * max_demand + (y_shift * max_demand)
+    ramp = np.where(phase < period / 2.0, phase, period - phase)
+    demand = ramp / float(period / 2.0) * max_demand + (y_shift * max_demand)
+    if np.isscalar(t):
+        return float(demand)
+    return demand
 
 
 def wave(t, period, offset, max_demand, y_shift=0):
@@ -168,14 +671,19 @@ def wave(t, period, offset, max_demand, y_shift=0):
     equal to an inverted cosine.
 
     Offset is in the same units as period.
+    t may be a single timestep, for which a float is returned, or a numpy
+    array of timesteps.
     y_shift: percentage of the max_demand to shift the entire workload up the
     y-axis. E.g., With max_demand = 60 and y_shift 1/2 will shift the wave up
     so that it oscillates between 90 and 30 demand units, instead of 60 and 0
     """
     phase_unitless = (t + offset - (period / 4.0)) % float(period)
     phase_radians = phase_unitless / float(period) * (2.0 * pi)
-    raw_val = (sin(phase_radians) + 1.0) / 2.0
-    return (raw_val * max_demand) + (y_shift * max_demand)
+    raw_val = (np.sin(phase_radians) + 1.0) / 2.0
+    demand = (raw_val * max_demand) + (y_shift * max_demand)
+    if np.isscalar(t):
+        return float(demand)
+    return demand
 
 
 
@@ -209,6 +717,19 @@ def dual_offset_workload(switches, period, offset, max_demand, size,
     }
     return generic_workload(switch_workload_fcns, size, duration, timesteps)
 
+def dual_offset_arrays(switches, period, offset, max_demand, size,
+                       duration, timesteps, workload_fcn, y_shift=0):
+    """
+    Columnar, timestamped version of dual_offset_workload, see generic_arrays.
+    Arguments are the same as for dual_offset_workload.
+    """
+    assert len(switches) == 2
+    switch_workload_fcns = {
+        switches[0]: lambda t: workload_fcn(t, period, 0, max_demand, y_shift),
+        switches[1]: lambda t: workload_fcn(t, period, offset, max_demand, y_shift)
+    }
+    return generic_arrays(switch_workload_fcns, size, duration, timesteps)
+
 def old_to_new(workload, strictly_increasing_time=True):
     """ 
     Convert the old-style 2-level-lists of requests to list of timestamped
@@ -73,6 +73,44 @@ class TestController(unittest.TestCase):
 
         self.assertEqual(ctrlview, simview)
 
+    def test_update_ctrl_state_from_changes(self):
+        """Ensure that polling only changed links gives the full poll state"""
+        ctrls = two_ctrls()
+        sim = LinkBalancerSim(two_switch_topo(), ctrls)
+        a, b = ctrls
+        source = sim.link_table()
+
+        def assert_polled(ctrl, used):
+            for u, v in ctrl.mylinks:
+                self.assertEqual(ctrl.graph[u][v]['used'], used[(u, v)])
+
+        sim.graph['s1']['sw1']['used'] = 10.0
+        a.update_my_state(sim.graph, source=source)
+        assert_polled(a, {('s1', 'sw1'): 10.0, ('sw1', 'sw2'): 0.0,
+                          ('sw2', 'sw1'): 0.0})
+
+        # Changes of the physical network, and of the controller's own view
+        sim.graph['sw1']['sw2']['used'] = 20.0
+        sim.graph['s2']['sw2']['used'] = 30.0
+        a.graph['sw2']['sw1']['used'] = 5.0
+        a.graph['s2']['sw2']['used'] = 40.0
+        a.update_my_state(sim.graph, source=source)
+        assert_polled(a, {('s1', 'sw1'): 10.0, ('sw1', 'sw2'): 20.0,
+                          ('sw2', 'sw1'): 0.0})
+        # Links outside of the domain are not polled
+        self.assertEqual(a.graph['s2']['sw2']['used'], 40.0)
+
+        # Stale states publish the links changed as they advance
+        history = LinkHistory(source)
+        sim.graph['s1']['sw1']['used'] = 50.0
+        history.record()
+        a.update_my_state(sim.graph, history.pop(), history)
+        assert_polled(a, {('s1', 'sw1'): 10.0, ('sw1', 'sw2'): 20.0,
+                          ('sw2', 'sw1'): 0.0})
+        a.update_my_state(sim.graph, history.oldest(), history)
+        assert_polled(a, {('s1', 'sw1'): 50.0, ('sw1', 'sw2'): 20.0,
+                          ('sw2', 'sw1'): 0.0})
+
     def test_two_ctrl_unit_sync(self):
         """Reported link utils of two synced controllers are identical
 
@@ -149,6 +187,60 @@ class TestController(unittest.TestCase):
         self.assertEqual(listb2, listb3)
 
 
+    def check_delta_sync(self, make_ctrls):
+        """Assert that syncing only changed links gives the state of pushing
+        all links, in every link attribute of every controller
+
+        Links pushed by a sync are changed afterwards by their owner as well
+        as by the receiving controller, which must be overwritten again.
+        """
+        delta = make_ctrls()
+        full = make_ctrls()
+        sim = LinkBalancerSim(two_switch_topo(), delta)
+        LinkBalancerSim(two_switch_topo(), full)
+
+        def sync():
+            sim.sync_ctrls()
+            for src, dst in [(full[0], full[1]), (full[1], full[0])]:
+                src.sync_toward(dst, specificedges=src.mylinks)
+
+        sync()
+        requests = [(0, 'sw1', 30), (1, 'sw2', 50), (0, 'sw1', 80),
+                    (1, 'sw2', 20), (1, 'sw2', 70)]
+        for time, (i, sw, util) in enumerate(requests):
+            for ctrls in (delta, full):
+                ctrls[i].free_resources(time)
+                ctrls[i].handle_request(sw, util, 2, time)
+            sync()
+            for d, f in zip(delta, full):
+                for u, v in f.graph.edges():
+                    self.assertEqual(d.graph[u][v], f.graph[u][v])
+
+    def test_delta_sync_matches_full_sync(self):
+        """Assert that delta syncs match full syncs, including the links
+        written by the receiving controller"""
+        self.check_delta_sync(two_ctrls)
+
+    def test_separate_state_delta_sync_matches_full_sync(self):
+        """Assert that delta syncs of 'sync_learned' match full syncs"""
+        self.check_delta_sync(lambda: two_separate_state_ctrls(0.5))
+
+    def test_drop_sync_state_keeps_other_syncs(self):
+        """Assert that dropping the sync state toward one controller keeps
+        the (equal, empty) change sets of other syncs"""
+        ctrls = two_ctrls()
+        sim = LinkBalancerSim(two_switch_topo(), ctrls)
+        a, b = ctrls
+        b.sync_toward(a)
+        a.sync_toward(b)
+        a.drop_sync_state(b)
+
+        # Written by a in b's domain: b's next delta sync must overwrite it
+        a.graph['s2']['sw2']['used'] = 99.0
+        b.sync_toward(a)
+        self.assertEqual(a.graph['s2']['sw2']['used'],
+                         b.graph['s2']['sw2']['used'])
+
     def test_sync_preserves_intradomain_link_state(self):
         """Ensure that the 'mylinks' of a controller are not modified during sync.
 
@@ -237,6 +329,48 @@ class TestController(unittest.TestCase):
         path_after = b.handle_request('sw2', 1, 1, 1)
         self.assertEqual(path_after, ['s2', 'sw2'])
 
+    def test_batched_path_metrics(self):
+        """Assert that find_best_path rates paths like compute_path_metric,
+        breaking ties by path length and then by order"""
+        ctrl = LinkBalancerCtrl(sw=['sw1'], srv=['s1', 's2', 's3'])
+        LinkBalancerSim(three_switch_triangle_topo(), [ctrl])
+        paths = [['s3', 'sw3', 'sw2', 'sw1'], ['s2', 'sw2', 'sw1'],
+                 ['s1', 'sw1']]
+        g = ctrl.graph
+
+        # All links idle: equal metrics, the shortest path wins
+        self.assertEqual(ctrl.find_best_path(paths, 'sw1', 10, 1, 0),
+                         (['s1', 'sw1'], 0.1))
+
+        # s1's link is oversubscribed, the last rated link of s3's path
+        # (sw3, sw2) is the worst of its prefix
+        g['s1']['sw1']['used'] = 95.0
+        g['sw3']['sw2']['used'] = 30.0
+        g['sw2']['sw1']['used'] = 45.0
+        g['s2']['sw2']['used'] = 20.0
+        for util in [0, 10]:
+            expected = [ctrl.compute_path_metric('sw1', path, util, 0)
+                        for path in paths]
+            metrics, lengths = ctrl.compute_path_metrics('sw1', paths, util, 0)
+            self.assertEqual(metrics.tolist(), [m for m, l in expected])
+            self.assertEqual(lengths.tolist(), [l for m, l in expected])
+        self.assertEqual(ctrl.find_best_path(paths, 'sw1', 10, 1, 0),
+                         (['s2', 'sw2', 'sw1'], 0.3))
+        # Every path is rated 1 when its first link would be oversubscribed,
+        # s1's path is the shortest
+        g['s2']['sw2']['used'] = 95.0
+        g['s3']['sw3']['used'] = 95.0
+        self.assertEqual(ctrl.find_best_path(paths, 'sw1', 10, 1, 0),
+                         (['s1', 'sw1'], 1.0))
+        # Equal metrics and lengths: the first path wins
+        g['s1']['sw1']['used'] = 20.0
+        g['s2']['sw2']['used'] = 20.0
+        one, two = ['s1', 'sw1'], ['s2', 'sw2']
+        self.assertEqual(ctrl.find_best_path([one, two], 'sw1', 10, 1, 0),
+                         (one, 0.3))
+        self.assertEqual(ctrl.find_best_path([two, one], 'sw1', 10, 1, 0),
+                         (two, 0.3))
+
     def test_instantiate_greedy_controller(self):
         """
         Basic sanity checks for controller instantiation
@@ -269,6 +403,37 @@ class TestController(unittest.TestCase):
         self.assertEqual(paths, ctrl.get_srv_paths('sw1'))
         self.assertEqual(localpaths, ctrl.get_srv_paths('sw1', local=True))
 
+    def test_srv_paths_cached_until_topology_changes(self):
+        """Assert server paths are cached per ingress switch and recomputed
+        only after the topology changed"""
+        ctrls = two_ctrls()
+        LinkBalancerSim(two_switch_topo(), ctrls)
+        a, b = ctrls
+
+        paths = a.get_srv_paths('sw1')
+        self.assertEqual(paths, [['s1', 'sw1'], ['s2', 'sw2', 'sw1']])
+        self.assertTrue(a.get_srv_paths('sw1') is paths)
+        self.assertEqual(a.get_srv_paths('sw1', local=True), [['s1', 'sw1']])
+        self.assertEqual(a.get_srv_paths('sw2'), [['s1', 'sw1', 'sw2'],
+                                                  ['s2', 'sw2']])
+
+        # Compiled path batches are kept only for the cached lists
+        a.get_path_batch(paths, 'sw1')
+        a.get_path_batch(list(paths), 'sw1')
+        a.get_path_batch(paths)
+        self.assertEqual(a.path_batches.keys(), [('sw1', False)])
+        self.assertTrue(a.path_batches[('sw1', False)][0] is paths)
+
+        # A direct link from s2 to sw1 shortens the path from s2
+        a.graph.add_edge('s2', 'sw1', capacity=100, used=0.0)
+        self.assertTrue(a.get_srv_paths('sw1') is paths)
+        a.invalidate_srv_paths()
+        self.assertEqual(a.get_srv_paths('sw1'), [['s1', 'sw1'], ['s2', 'sw1']])
+
+        # Replacing the graph drops the cache as well
+        a.set_graph(two_switch_topo())
+        self.assertEqual(a.get_srv_paths('sw1'), paths)
+
     def test_greedy_handle_request_with_limit(self, mylimit=1):
         """Assert that a greedy controller's handle_request method will handle
         all requests inside of its own domain with greedylimit 1"""
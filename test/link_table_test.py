@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.controller import LinkBalancerCtrl
+from sim.link_table import *
+
+###############################################################################
+
+class TestLinkTable(unittest.TestCase):
+    """Unit tests for the integer-indexed link table of a graph"""
+
+    def setUp(self):
+        self.graph = two_switch_topo()
+        self.table = LinkTable(self.graph)
+
+    def test_table_mirrors_graph(self):
+        """Assert that the table holds the used and capacity of each link"""
+        self.assertEqual(len(self.table.links), 4)
+        for i, (u, v) in enumerate(self.table.links):
+            self.assertEqual(self.table.used[i], self.graph[u][v]['used'])
+            self.assertEqual(self.table.capacity[i],
+                             self.graph[u][v]['capacity'])
+            # Successor and predecessor views share the attributes
+            self.assertTrue(self.graph.pred[v][u] is self.graph[u][v])
+
+    def test_path_links(self):
+        """Assert that paths compile to the ids of their links"""
+        links = self.table.path_links(['s2', 'sw2', 'sw1'])
+        self.assertEqual([self.table.links[i] for i in links],
+                         [('s2', 'sw2'), ('sw2', 'sw1')])
+        self.assertTrue(self.table.path_links(['s2', 'sw2', 'sw1']) is links)
+        self.assertRaises(KeyError, self.table.path_links, ['s1', 'sw2'])
+
+    def test_writes_are_mirrored(self):
+        """Assert that edge attribute writes update the table and vice versa"""
+        self.graph['s1']['sw1']['used'] = 10.0
+        i = self.table.ids[('s1', 'sw1')]
+        self.assertEqual(self.table.used[i], 10.0)
+
+        links = self.table.path_links(['s2', 'sw2', 'sw1'])
+        self.table.set_used(links, self.table.used[links] + 5)
+        self.assertEqual(self.graph['s2']['sw2']['used'], 5.0)
+        self.assertEqual(self.graph['sw2']['sw1']['used'], 5.0)
+        self.assertEqual(self.graph['s1']['sw1']['used'], 10.0)
+
+    def test_dict_writes_are_mirrored(self):
+        """Assert that every way of writing edge attributes updates the table"""
+        i = self.table.ids[('s1', 'sw1')]
+        self.graph.add_edge('s1', 'sw1', used=10.0, capacity=50)
+        self.assertEqual(self.table.used[i], 10.0)
+        self.assertEqual(self.table.capacity[i], 50)
+        self.assertTrue(self.graph.pred['sw1']['s1'] is self.table.attrs[i])
+
+        attrs = self.graph['s1']['sw1']
+        attrs.update({'used': 20.0}, mylink=True)
+        self.assertEqual(self.table.used[i], 20.0)
+        self.assertEqual(attrs['mylink'], True)
+        self.assertEqual(attrs.setdefault('used', 30.0), 20.0)
+        del attrs['mylink']
+        self.assertEqual(attrs.pop('timestamp', None), None)
+
+        sums = self.table.link_sums('links')
+        self.graph.add_edges_from([('s1', 'sw1', {'used': 0.0})])
+        self.assertEqual(self.table.used[i], 0.0)
+        self.assertEqual(sums.used, self.table.used.sum())
+
+        for remove in [lambda: attrs.__delitem__('used'),
+                       lambda: attrs.pop('capacity'), attrs.popitem,
+                       attrs.clear]:
+            self.assertRaises(Exception, remove)
+        self.assertEqual(attrs, {'used': 0.0, 'capacity': 50})
+
+    def test_copies_are_independent(self):
+        """Assert that graph copies get tables of their own"""
+        self.graph['s1']['sw1']['used'] = 10.0
+        copy = self.graph.copy()
+        self.assertEqual(type(copy['s1']['sw1']), dict)
+        self.assertEqual(copy['s1']['sw1']['used'], 10.0)
+
+        copytable = LinkTable(copy)
+        self.assertFalse(copytable is self.table)
+        copy['s1']['sw1']['used'] = 20.0
+        self.assertEqual(self.graph['s1']['sw1']['used'], 10.0)
+        self.assertEqual(self.table.used[self.table.ids[('s1', 'sw1')]], 10.0)
+
+    def test_link_sums(self):
+        """Assert that running totals follow allocations and writes"""
+        def direct(links):
+            used = self.table.used[links]
+            capacity = self.table.capacity[links]
+            share = used.sum() / capacity.sum()
+            return np.sqrt(((used - share * capacity) ** 2).sum())
+
+        all_links = range(len(self.table.links))
+        servers = [self.table.ids[('s1', 'sw1')], self.table.ids[('s2', 'sw2')]]
+        sums = self.table.link_sums('links')
+        srv_sums = self.table.link_sums('servers', servers)
+        self.assertTrue(self.table.link_sums('links') is sums)
+        self.assertEqual(sums.imbalance(), 0.0)
+
+        links = self.table.path_links(['s2', 'sw2', 'sw1'])
+        self.table.set_used(links, self.table.used[links] + 3)
+        self.graph['s1']['sw1']['used'] = 1
+        self.assertEqual(srv_sums.imbalance(), np.sqrt(2.0))
+        self.assertAlmostEqual(sums.imbalance(), direct(all_links))
+
+        # Fractional values take the floating point path
+        self.table.set_used(links, self.table.used[links] + 0.1)
+        self.graph['sw1']['sw2']['capacity'] = 50
+        self.assertAlmostEqual(sums.imbalance(), direct(all_links))
+        self.assertAlmostEqual(srv_sums.imbalance(), direct(servers))
+        self.table.set_used(links, self.table.used[links] - 3.1)
+        self.graph['s1']['sw1']['used'] = 0
+        self.graph['sw1']['sw2']['capacity'] = 1001
+        self.assertEqual(sums.imbalance(), 0.0)
+
+    def test_divergence_close(self):
+        """Assert that closing a LinkDivergence keeps the (equal, empty)
+        dirty sets of other users"""
+        other = LinkTable(self.graph.copy())
+        mine = set()
+        self.table.dirty_sets.append(mine)
+        divergence = LinkDivergence([self.table, other])
+        self.assertEqual(divergence.distances(), (0.0,))
+        divergence.close()
+        self.assertEqual(len(self.table.dirty_sets), 1)
+        self.assertTrue(self.table.dirty_sets[0] is mine)
+        self.assertEqual(other.dirty_sets, [])
+
+    def test_link_history(self):
+        """Assert that a LinkHistory replays states like a queue of copies"""
+        def used(graph):
+            return [graph[u][v]['used'] for u, v in self.table.links]
+
+        mine = set()
+        self.table.dirty_sets.append(mine)
+        history = LinkHistory(self.table)
+        copies = [self.graph.copy()]
+        links = self.table.path_links(['s2', 'sw2', 'sw1'])
+        for step in range(4):
+            self.table.set_used(links, self.table.used[links] + 1)
+            self.graph['s1']['sw1']['used'] = step
+            history.record()
+            copies.append(self.graph.copy())
+            if step % 2 == 1:
+                self.assertEqual(history.pop().tolist(),
+                                 used(copies.pop(0)))
+            self.assertEqual(len(history), len(copies))
+            self.assertEqual(history.oldest().tolist(), used(copies[0]))
+
+        while len(copies) > 0:
+            self.assertEqual(history.pop().tolist(), used(copies.pop(0)))
+        self.assertRaises(IndexError, history.oldest)
+        mine.clear()
+        history.close()
+        self.assertEqual(len(self.table.dirty_sets), 1)
+        self.assertTrue(self.table.dirty_sets[0] is mine)
+
+    def test_owned_link_table(self):
+        """Assert that the owner of a graph keeps its table until the graph
+        is replaced or its topology changes"""
+        ctrl = LinkBalancerCtrl(sw=['sw1'], srv=['s1', 's2'],
+                                graph=self.graph)
+        table = ctrl.link_table()
+        self.assertTrue(ctrl.link_table() is table)
+        self.assertEqual(len(table.links), 4)
+
+        self.graph.add_edge('s1', 'sw2', capacity=100, used=0.0)
+        ctrl.invalidate_srv_paths()
+        newtable = ctrl.link_table()
+        self.assertFalse(newtable is table)
+        self.assertEqual(len(newtable.links), 5)
+        self.assertEqual(len(newtable.path_links(['s1', 'sw2'])), 1)
+
+        ctrl.set_graph(two_switch_topo())
+        self.assertFalse(ctrl.link_table() is newtable)
+        self.assertTrue(ctrl.link_table().graph is ctrl.graph)
+
+
+if __name__ == '__main__':
+    unittest.main()
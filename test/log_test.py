@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import logging
+import os
+import sys
+import unittest
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.log import *
+from sim.workload import unit_workload
+from sim.simulation import *
+
+###############################################################################
+
+class RecordingHandler(logging.Handler):
+    """Keep the messages of all handled records"""
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class Unprintable(object):
+    """Fails the test if a trace formats it"""
+    def __str__(self):
+        raise AssertionError("formatted a disabled trace")
+
+
+class TestTracing(unittest.TestCase):
+    """Unit tests for the per-subsystem debug traces"""
+
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.trace = getTracer('simulation')
+        self.trace.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.trace.logger.removeHandler(self.handler)
+        setTracing('all', False)
+
+    def test_disabled_by_default(self):
+        """Assert that traces are neither formatted nor emitted when off"""
+        self.assertFalse(self.trace.enabled)
+        self.trace("%s", Unprintable())
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        sim.run(unit_workload(sw=['sw1', 'sw2'], size=1, duration=2,
+                              numreqs=4))
+        self.assertEqual(self.handler.messages, [])
+
+    def test_enable_subsystem(self):
+        """Assert that only enabled subsystems emit their traces"""
+        setTracing(['simulation'])
+        self.assertFalse(getTracer('controller').enabled)
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        sim.run(unit_workload(sw=['sw1', 'sw2'], size=1, duration=2,
+                              numreqs=4))
+        self.assertTrue("[run] [0] [sw1] [1] [2]" in self.handler.messages)
+
+        setTracing(['simulation'], False)
+        self.trace("%s", Unprintable())
+        self.assertRaises(Exception, setTracing, ['nosuchsubsystem'])
+        setTracing('all')
+        for subsystem in TRACE_SUBSYSTEMS:
+            self.assertTrue(getTracer(subsystem).enabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
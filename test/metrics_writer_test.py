@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.metrics_writer import MetricsWriter, read_metrics
+from sim.simulation import LinkBalancerSim
+from sim.workload import unit_workload
+
+###############################################################################
+
+class TestMetricsWriter(unittest.TestCase):
+    """Unit tests for streaming metrics to a file"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'test.metrics')
+        self.workload = unit_workload(sw=['sw1', 'sw2'], size=1,
+                                      duration=3, numreqs=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_sim(self, engine='run', **kwargs):
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        return getattr(sim, engine)(self.workload, sync_period=2, **kwargs)
+
+    def assertMetricsEqual(self, metrics, expected):
+        self.assertEqual(sorted(metrics.keys()), sorted(expected.keys()))
+        self.assertEqual(metrics['simulation_trace'],
+                         expected['simulation_trace'])
+        for name in ['rmse_links', 'rmse_servers']:
+            self.assertEqual(metrics[name], expected[name])
+        self.assertEqual(metrics['state_distances'],
+                         [list(d) for d in expected['state_distances']])
+
+    def test_streamed_metrics_match(self):
+        """Assert that metrics written in chunks read back unchanged"""
+        for engine in ['run', 'run_events']:
+            expected = self.run_sim(engine)
+            writer = MetricsWriter(self.filename, chunk=3)
+            remaining = self.run_sim(engine, metrics_writer=writer)
+            writer.close()
+            self.assertEqual(remaining['rmse_links'], [])
+            self.assertEqual(len(remaining['simulation_trace']), 0)
+            # One line per chunk
+            lines = open(self.filename).readlines()
+            self.assertEqual(len(lines), -(-len(expected['rmse_links']) // 3))
+            self.assertMetricsEqual(read_metrics(self.filename), expected)
+
+            # The JSON form of the trace, as used by the plot scripts
+            raw = read_metrics(self.filename, traces=False)
+            self.assertEqual(raw['simulation_trace'],
+                             json.loads(json.dumps(
+                                 expected['simulation_trace'].to_json())))
+
+    def test_truncated_file(self):
+        """Assert that the complete chunks of a killed run can be read"""
+        writer = MetricsWriter(self.filename, chunk=2)
+        self.run_sim(metrics_writer=writer)
+        writer.close()
+        lines = open(self.filename).readlines()
+        f = open(self.filename, 'w')
+        f.write(''.join(lines[:2]) + lines[2][:20])
+        f.close()
+        metrics = read_metrics(self.filename)
+        self.assertEqual(len(metrics['rmse_links']), 4)
+        self.assertEqual(len(metrics['simulation_trace']), 4)
+
+        # Killed while writing the first chunk, or before
+        for contents in [lines[0][:20], '']:
+            f = open(self.filename, 'w')
+            f.write(contents)
+            f.close()
+            self.assertEqual(read_metrics(self.filename), {})
+
+    def test_single_document(self):
+        """Assert that metrics in the former single JSON format are read"""
+        f = open(self.filename, 'w')
+        print >>f, json.dumps({'rmse_links': [0.0, 1.0]}, indent=4)
+        f.close()
+        self.assertEqual(read_metrics(self.filename), {'rmse_links': [0.0, 1.0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
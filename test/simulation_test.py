@@ -4,11 +4,15 @@
 # Brandon Heller <brandonh@stanford.edu>
 
 
+from itertools import combinations
+import json
+from math import sqrt
 import os
 import sys
 import unittest
 
 import networkx as nx
+import numpy as np
 
 from test_helper import *
 
@@ -19,6 +23,7 @@ if __name__ == '__main__':
 from sim.workload import *
 from sim.controller import *
 from sim.simulation import *
+from sim.resource_allocator import FlowCalendar
 
 ###############################################################################
 
@@ -306,6 +311,226 @@ class TestTwoSwitch(unittest.TestCase):
             self.assertAlmostEqual(0.0, rmse_sums[0])
             self.assertAlmostEqual(0.0, rmse_sums[-1])
 
+    def test_event_engine_matches_tick_loop(self):
+        """Assert that run_events yields the same metrics as run"""
+        sparse = [(t * 7.5, ['sw1', 'sw2'][t % 2], 1 + t % 3, 1 + t % 4)
+                  for t in range(20)]
+        wave_workload = old_to_new(dual_offset_workload(
+            switches=['sw1', 'sw2'], period=8, offset=4.0, max_demand=8,
+            size=1, duration=2, timesteps=16, workload_fcn=wave))
+        for workload in [sparse, wave_workload]:
+            for sync_period in [0, 4, None]:
+                for ignore_remaining in [True, False]:
+                    sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+                    expected = sim.run(list(workload),
+                                       sync_period=sync_period,
+                                       ignore_remaining=ignore_remaining)
+                    sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+                    metrics = sim.run_events(workload,
+                                             sync_period=sync_period,
+                                             ignore_remaining=ignore_remaining)
+                    self.assertEqual(metrics, expected)
+
+    def test_flow_calendar(self):
+        """Assert that a FlowCalendar expires flows in order of whenfree"""
+        calendar = FlowCalendar(width=2)
+        links = np.array([0, 1])
+        for whenfree in [5.5, 1, 3, 5, 100, 3]:
+            calendar.push(whenfree, ['s1', 'sw1'], whenfree, links)
+        self.assertEqual(len(calendar), 6)
+        self.assertEqual(calendar.next_expiry(), 1)
+        self.assertEqual([f[0] for f in calendar.expire(0.5)], [])
+        self.assertEqual([f[0] for f in calendar.expire(3)], [1, 3, 3])
+        self.assertEqual([f[0] for f in calendar.expire(5.2)], [5])
+        self.assertEqual(len(calendar), 2)
+        self.assertEqual(calendar.next_expiry(), 5.5)
+        self.assertEqual(sorted(f[0] for f in calendar), [5.5, 100])
+        self.assertEqual([f[0] for f in calendar.expire(1000)], [5.5, 100])
+        self.assertEqual(calendar.next_expiry(), None)
+
+    def test_flow_calendar_sparse(self):
+        """Assert that a FlowCalendar jumps over the empty buckets between
+        far apart expiries"""
+        # 10**12 buckets of width 0.001 between the first and last flow
+        calendar = FlowCalendar(width=0.001)
+        links = np.array([0, 1])
+        for whenfree in [1e9, 0.5, 2e6, 0.5005, 1e9]:
+            calendar.push(whenfree, ['s1', 'sw1'], whenfree, links)
+        self.assertEqual([f[0] for f in calendar.expire(0.5)], [0.5])
+        self.assertEqual(calendar.next_expiry(), 0.5005)
+        self.assertEqual([f[0] for f in calendar.expire(1e6)], [0.5005])
+        self.assertEqual(calendar.next_expiry(), 2e6)
+        self.assertEqual([f[0] for f in calendar.expire(1e9)],
+                         [2e6, 1e9, 1e9])
+        self.assertEqual(len(calendar), 0)
+        self.assertEqual(calendar.next_expiry(), None)
+        calendar.push(3, ['s1', 'sw1'], 3, links)
+        self.assertEqual(calendar.next_expiry(), 3)
+
+    def test_expiry_width(self):
+        """Assert that flows kept in a calendar queue give the same results"""
+        sparse = [(t * 0.75, ['sw1', 'sw2'][t % 2], 1 + t % 3, 0.5 + t % 4)
+                  for t in range(40)]
+        for engine in ['run', 'run_events']:
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            expected = getattr(sim, engine)(sparse, sync_period=2)
+            for width in [0.25, 1, 8]:
+                sim = LinkBalancerSim(two_switch_topo(), two_ctrls(),
+                                      expiry_width=width)
+                metrics = getattr(sim, engine)(sparse, sync_period=2)
+                self.assertEqual(metrics, expected)
+                self.assertEqual(len(sim.active_flows), 0)
+
+    def test_batch_arrivals(self):
+        """Assert that batches of arrivals are processed once per tick"""
+        # With one arrival per tick, a batch is a single request
+        sparse = [(t * 1.5, ['sw1', 'sw2'][t % 2], 1 + t % 3, 1 + t % 4)
+                  for t in range(20)]
+        for staleness in [0, 2]:
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            expected = sim.run(sparse, staleness=staleness)
+            for engine in ['run', 'run_events']:
+                sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+                metrics = getattr(sim, engine)(sparse, staleness=staleness,
+                                               batch=True)
+                self.assertEqual(metrics, expected)
+
+        # Both engines agree on batches of many arrivals
+        wave_workload = old_to_new(dual_offset_workload(
+            switches=['sw1', 'sw2'], period=8, offset=4.0, max_demand=8,
+            size=1, duration=2, timesteps=16, workload_fcn=wave))
+        for sync_period in [0, 4, None]:
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            expected = sim.run(wave_workload, sync_period=sync_period,
+                               batch=True)
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            metrics = sim.run_events(wave_workload, sync_period=sync_period,
+                                     batch=True)
+            self.assertEqual(metrics, expected)
+
+        # Requests of a batch see the placements of the earlier requests of
+        # their controller
+        ctrls = [LinkBalancerCtrl(['sw1'], ['s1', 's2'])]
+        sim = LinkBalancerSim(two_switch_topo(), ctrls)
+        sim.run([(0, 'sw1', 10, 5), (0, 'sw1', 10, 5)], batch=True,
+                ignore_remaining=True)
+        self.assertEqual(sim.graph['s1']['sw1']['used'], 10.0)
+        self.assertEqual(sim.graph['s2']['sw2']['used'], 10.0)
+
+    def test_run_leaves_workload_intact(self):
+        """Assert that run reads but never modifies its workload"""
+        workload = unit_workload(sw=['sw1', 'sw2'], size=1,
+                                 duration=2, numreqs=10)
+        original = list(workload)
+        results = []
+        for replay in [workload, workload, iter(workload)]:
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            results.append(sim.run(replay))
+        self.assertEqual(workload, original)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+    def test_run_columnar_workload(self):
+        """Assert that a Workload simulates like the equivalent tuples"""
+        workload = unit_workload(sw=['sw1', 'sw2'], size=1,
+                                 duration=2, numreqs=10)
+        results = []
+        for replay in [workload, Workload.from_tuples(workload)]:
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            results.append(sim.run(replay))
+        self.assertEqual(results[0], results[1])
+
+    def test_run_and_trace_logs(self):
+        """Assert that run_and_trace logs workloads as JSON, and the
+        new-format workload in the binary format as well"""
+        def load(filename):
+            return json.load(open('logs/' + filename))
+
+        old = dual_offset_workload(switches=['sw1', 'sw2'], period=4,
+                                   offset=2, max_demand=2, size=1,
+                                   duration=1, timesteps=8,
+                                   workload_fcn=sawtooth)
+        new = [list(req) for req in old_to_new(old)]
+        myname = sys._getframe().f_code.co_name
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        sim.run_and_trace(myname + '_old', old, old=True)
+        self.assertEqual(load(myname + '_old.workload'),
+                         json.loads(json.dumps(old)))
+        self.assertEqual(load(myname + '_old.newworkload'), new)
+        self.assertEqual(
+            Workload.load('logs/' + myname + '_old.newworkload.bin').to_tuples(),
+            [tuple(req) for req in new])
+
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        sim.run_and_trace(myname + '_new', Workload.from_tuples(new))
+        self.assertEqual(load(myname + '_new.workload'), new)
+
+    def test_select_metrics(self):
+        """Assert that runs collect only the selected metrics"""
+        workload = unit_workload(sw=['sw1', 'sw2'], size=1,
+                                 duration=3, numreqs=10)
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        full = sim.run(workload)
+
+        for engine in ['run', 'run_events']:
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            metrics = getattr(sim, engine)(workload, metrics=['rmse_servers'])
+            self.assertEqual(metrics, {'rmse_servers': full['rmse_servers']})
+
+            sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+            sim.select_metrics(['rmse_links', 'state_distances'],
+                               intervals={'state_distances': 3})
+            metrics = getattr(sim, engine)(workload)
+            self.assertEqual(metrics['rmse_links'], full['rmse_links'])
+            self.assertEqual(metrics['state_distances'],
+                             full['state_distances'][::3])
+
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        metrics = sim.run(workload, metric_intervals={'simulation_trace': 4})
+        self.assertEqual(list(metrics['simulation_trace']),
+                         list(full['simulation_trace'])[::4])
+        self.assertRaises(Exception, sim.run, workload, metrics=['nonsense'])
+
+    def test_state_distances_n_ctrls(self):
+        """Assert distances between all NIBs and the physical network"""
+        def expected(sim):
+            graphs = [ctrl.graph for ctrl in sim.ctrls] + [sim.graph]
+            return tuple(sqrt(sum((a[u][v]['used'] - b[u][v]['used']) ** 2
+                                  for u, v in sim.graph.edges()))
+                         for a, b in combinations(graphs, 2))
+
+        workload = unit_workload(sw=['sw1', 'sw2', 'sw3'], size=1,
+                                 duration=3, numreqs=10)
+        sim = LinkBalancerSim(three_switch_triangle_topo(),
+                              strictly_local_ctrls(3))
+        metrics = sim.run(workload, sync_period=2)
+        self.assertTrue(all(len(d) == 6 for d in metrics['state_distances']))
+        self.assertEqual(sim.state_distances(None, None, None), expected(sim))
+
+        sim.ctrls[1].graph['sw2']['sw3']['used'] = 7
+        sim.graph['s1']['sw1']['used'] = 2.5
+        self.assertEqual(sim.state_distances(None, None, None), expected(sim))
+        for graph in [ctrl.graph for ctrl in sim.ctrls] + [sim.graph]:
+            for u, v in graph.edges():
+                graph[u][v]['used'] = 0.0
+        self.assertEqual(sim.state_distances(None, None, None), (0.0,) * 6)
+
+    def test_state_distances_stale_drain(self):
+        """Assert that state distances stay exact when stale polls switch to
+        the current state while the remaining flows drain"""
+        workload = old_to_new(dual_offset_workload(['sw1', 'sw2'], 8, 4.0, 20,
+                                                   1, 3, 24, sawtooth))
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        metrics = sim.run(workload, sync_period=3, staleness=1,
+                          ignore_remaining=False)
+        distances = metrics['state_distances']
+        self.assertEqual(len(distances), 28)
+        # Values of the reference implementation comparing graph copies
+        expected = [(sqrt(1250), 5.0, 35.0), (sqrt(1450), 15.0, 35.0)]
+        for got, want in zip(distances[25:27], expected):
+            for a, b in zip(got, want):
+                self.assertAlmostEqual(a, b)
+
 
 if __name__ == '__main__':
     unittest.main()
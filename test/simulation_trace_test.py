@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import json
+import os
+import sys
+import unittest
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.simulation import LinkBalancerSim
+from sim.simulation_trace import SimulationTrace
+from sim.workload import Workload, unit_workload
+
+###############################################################################
+
+class TestSimulationTrace(unittest.TestCase):
+    """Unit tests for the columnar simulation trace"""
+
+    def setUp(self):
+        self.trace = self.new_trace(SimulationTrace)
+
+    def new_trace(self, cls):
+        return cls([('s1', 'sw1'), ('sw1', 's1')], [100, 50], ['s1'], [100],
+                   ['sw1'], ['c0'])
+
+    def test_append_and_repeat(self):
+        """Assert that samples are stored as rows and grow the columns"""
+        class SmallTrace(SimulationTrace):
+            initial_rows = 2
+        self.trace = self.new_trace(SmallTrace)
+        self.trace.append((0, [1.0], [1.0], [1.0, 10.0], [[0.0, 5.0]]))
+        self.trace.repeat(1)
+        self.trace.append((2, [2.0], [0.0], [2.0, 20.0], [[2.0, 20.0]]))
+        self.assertEqual(len(self.trace), 3)
+        self.assertEqual(self.trace.column('time').tolist(), [0.0, 1.0, 2.0])
+        self.assertEqual(self.trace.column('pn_view_raw').tolist(),
+                         [[1.0, 10.0], [1.0, 10.0], [2.0, 20.0]])
+        self.assertEqual(self.trace.column('c0_view_raw').shape, (3, 2))
+
+    def test_rows(self):
+        """Assert that rows read back in the per-sample layout"""
+        self.trace.append((0, [1.0], [2.0], [1.0, 10.0], [[0.0, 5.0]]))
+        self.trace.append((1, [0.0], [0.0], [0.0, 0.0], [[0.0, 0.0]]))
+        row = self.trace[0]
+        self.assertEqual(row.keys(), ['time', 'servers', 'ingress', 'pn_view',
+                                      'pn_view_raw', 'c0_view'])
+        self.assertEqual(row['time'], 0)
+        self.assertEqual(row['servers'], [('s1', (1.0, 100))])
+        self.assertEqual(row['ingress'], {'sw1': 2.0})
+        self.assertEqual(row['pn_view'], [(0.01, 's1', 'sw1'),
+                                          (0.2, 'sw1', 's1')])
+        self.assertEqual(row['c0_view'], [(0.0, 's1', 'sw1'),
+                                          (0.1, 'sw1', 's1')])
+        self.assertEqual(self.trace[-1]['ingress'], {})
+        self.assertEqual(len(list(self.trace)), 2)
+        self.assertRaises(IndexError, self.trace.__getitem__, 2)
+
+    def test_json_roundtrip(self):
+        """Assert that the JSON form names links once and reads back"""
+        self.trace.append((0, [1.0], [2.0], [1.0, 10.0], [[0.0, 5.0]]))
+        obj = json.loads(json.dumps(self.trace.to_json()))
+        self.assertEqual(obj['header']['links'], [['s1', 'sw1'], ['sw1', 's1']])
+        self.assertEqual(obj['columns']['pn_view_raw'], [[1.0, 10.0]])
+        self.assertEqual(SimulationTrace.from_json(obj), self.trace)
+
+    def test_simulation(self):
+        """Assert that a simulation traces the state of every sample"""
+        workload = unit_workload(sw=['sw1', 'sw2'], size=1,
+                                 duration=2, numreqs=4)
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        metrics = sim.run(workload)
+        trace = metrics['simulation_trace']
+        self.assertEqual(len(trace), len(metrics['rmse_servers']))
+        self.assertEqual(trace.views, ['c0', 'c1'])
+        # Every flow is freed by the end of the run
+        self.assertEqual(trace[-1]['ingress'], {})
+        self.assertEqual(trace.column('pn_view_raw')[-1].sum(), 0.0)
+        self.assertEqual(trace.column('ingress')[0].sum(), 1.0)
+
+    def test_preallocated_rows(self):
+        """Assert that runs size the trace for their samples up front, and
+        that sampling requires a trace"""
+        workload = Workload.from_tuples(unit_workload(
+            sw=['sw1', 'sw2'], size=1, duration=2, numreqs=4))
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        self.assertRaises(Exception, sim.simulation_trace, sim.graph, 0, [])
+        trace = sim.run(workload)['simulation_trace']
+        rows = sim._expected_samples(workload, 1)
+        self.assertEqual(len(trace.data['time']), rows)
+        self.assertTrue(len(trace) <= rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.simulation import LinkBalancerSim
+from sim.sweep import *
+from sim.workload import Workload, unit_workload
+
+def simulate(job):
+    """Run the shared workload with a sync period, for TestSweep"""
+    sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+    return sim.run(shared_value(job['workload']),
+                   sync_period=job['sync_period'],
+                   metrics=['rmse_servers'])['rmse_servers']
+
+def write_output(job):
+    """Write the output of a cached job, failing if job['fail'], for
+    TestSweep"""
+    if job.get('fail'):
+        raise ValueError(job['name'])
+    f = open(os.path.join(job['dir'], job['name'] + '.metrics'), 'w')
+    f.write(str(job['config']))
+    f.close()
+    return job['name']
+
+###############################################################################
+
+class TestSweep(unittest.TestCase):
+    """Unit tests for running sweep jobs in parallel and caching them"""
+
+    def test_parallel_matches_serial(self):
+        """Assert that parallel sweeps return the serial results in order"""
+        share(('unit', 10), Workload.from_tuples(
+            unit_workload(sw=['sw1', 'sw2'], size=1, duration=3, numreqs=10)))
+        self.assertTrue(is_shared(('unit', 10)))
+        jobs = [{'workload': ('unit', 10), 'sync_period': period}
+                for period in [0, 1, 2, 4, None]]
+        serial = run_sweep(jobs, simulate)
+        self.assertEqual(len(serial), 5)
+        self.assertEqual(run_sweep(jobs, simulate, processes=3), serial)
+
+    def test_cached_jobs_skipped(self):
+        """Assert that finished jobs are skipped and unfinished ones resumed"""
+        dir = tempfile.mkdtemp()
+        try:
+            cache = SweepCache(dir)
+            jobs = [{'name': 'job%d' % i, 'dir': dir, 'config': {'i': i}}
+                    for i in range(4)]
+            # An interrupted sweep: job2 fails after job0 and job1 finished
+            jobs[2]['fail'] = True
+            self.assertRaises(ValueError, run_sweep, jobs, write_output,
+                              cache=cache)
+            self.assertEqual([cache.is_done(job) for job in jobs],
+                             [True, True, False, False])
+
+            del jobs[2]['fail']
+            self.assertEqual(run_sweep(jobs, write_output, cache=cache),
+                             [None, None, 'job2', 'job3'])
+            self.assertEqual(run_sweep(jobs, write_output, cache=cache,
+                                       processes=2), [None] * 4)
+
+            # A changed config, a missing output or force reruns the job
+            jobs[0]['config'] = {'i': 0, 'seed': 1}
+            os.remove(os.path.join(dir, 'job1.metrics'))
+            self.assertEqual(run_sweep(jobs, write_output, cache=cache),
+                             ['job0', 'job1', None, None])
+            self.assertEqual(run_sweep(jobs, write_output,
+                                       cache=SweepCache(dir, force=True)),
+                             ['job0', 'job1', 'job2', 'job3'])
+        finally:
+            shutil.rmtree(dir)
+
+    def test_config_hash(self):
+        """Assert that config hashes ignore ordering but not values"""
+        a = {'sync_period': 1.0, 'workload': {'name': 'expo', 'seed': 0}}
+        b = {'workload': {'seed': 0, 'name': 'expo'}, 'sync_period': 1.0}
+        self.assertEqual(config_hash(a), config_hash(b))
+        b['workload']['seed'] = 1
+        self.assertNotEqual(config_hash(a), config_hash(b))
+
+    def test_file_hash(self):
+        """Assert that file hashes follow the contents of a file"""
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, 'expo.workload')
+            hashes = []
+            for contents in ['[0.5, "sw1", 1, 2]\n', '[0.5, "sw2", 1, 2]\n']:
+                f = open(filename, 'w')
+                f.write(contents)
+                f.close()
+                hashes.append(file_hash(filename))
+            self.assertNotEqual(hashes[0], hashes[1])
+            self.assertEqual(file_hash(filename), hashes[1])
+        finally:
+            shutil.rmtree(dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
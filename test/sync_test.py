@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import os
+import sys
+import unittest
+
+import networkx as nx
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.workload import *
+from sim.controller import *
+from sim.simulation import *
+from sim.sync import *
+
+
+def chain_topo(n):
+    """Return n switches in a chain, each with a server s<i> attached"""
+    graph = nx.DiGraph()
+    switches = ['sw%d' % i for i in range(1, n + 1)]
+    graph.add_nodes_from(switches, type='switch')
+    graph.add_nodes_from(['s%d' % i for i in range(1, n + 1)], type='server')
+    for i in range(1, n + 1):
+        graph.add_edge('s%d' % i, 'sw%d' % i, capacity=100, used=0.0)
+    for a, b in zip(switches[:-1], switches[1:]):
+        graph.add_edge(a, b, capacity=1000, used=0.0)
+        graph.add_edge(b, a, capacity=1000, used=0.0)
+    return graph
+
+
+class TestSyncSchedulers(unittest.TestCase):
+    """Unit tests for the sync topologies of sim.sync"""
+
+    def setUp(self):
+        self.ctrls = strictly_local_ctrls(4)
+        self.sim = LinkBalancerSim(chain_topo(4), self.ctrls)
+        # Give every domain a distinct state on its server link
+        for i, ctrl in enumerate(self.ctrls):
+            ctrl.graph['s%d' % (i + 1)]['sw%d' % (i + 1)]['used'] = 10.0 * (i + 1)
+
+    def knows(self, ctrl, origin):
+        """Return True if ctrl holds the state of the server link of origin"""
+        i = self.ctrls.index(origin) + 1
+        link = ('s%d' % i, 'sw%d' % i)
+        return ctrl.graph[link[0]][link[1]]['used'] == 10.0 * i
+
+    def knows_all(self):
+        return all(self.knows(c, o) for c in self.ctrls for o in self.ctrls)
+
+    def test_all_to_all(self):
+        """Assert that all-to-all syncs every controller in one round"""
+        self.sim.sync_ctrls()
+        self.assertTrue(self.knows_all())
+
+    def test_tree(self):
+        """Assert that a tree round aggregates and disseminates all state"""
+        scheduler = sync_scheduler('tree', fanout=2)
+        self.assertEqual(len(scheduler.pushes(self.ctrls, 0)), 6)
+        self.sim.sync_ctrls(scheduler=scheduler)
+        self.assertTrue(self.knows_all())
+
+    def test_ring(self):
+        """Assert that state travels around the ring, one hop per push"""
+        scheduler = sync_scheduler('ring')
+        a, b, c, d = self.ctrls
+        self.sim.sync_ctrls(scheduler=scheduler)
+        self.assertTrue(self.knows(d, a) and self.knows(d, b))
+        self.assertTrue(self.knows(a, b) and self.knows(a, c))
+        self.assertFalse(self.knows(b, c))
+        self.sim.sync_ctrls(scheduler=scheduler)
+        self.sim.sync_ctrls(scheduler=scheduler)
+        self.assertTrue(self.knows_all())
+
+        # Newer state of a domain is forwarded along the ring
+        a.graph['s1']['sw1']['used'] = 50.0
+        self.sim.sync_ctrls(scheduler=scheduler)
+        for ctrl in self.ctrls:
+            self.assertEqual(ctrl.graph['s1']['sw1']['used'], 50.0)
+
+    def test_ring_relays_sync_learned(self):
+        """Assert that separate state controllers relay the state they
+        learned, not their own contributions to foreign links"""
+        ctrls = [SeparateStateLinkBalancerCtrl(alpha=0.5, sw=['sw%d' % i],
+                                               srv=['s%d' % i])
+                 for i in range(1, 4)]
+        sim = LinkBalancerSim(three_switch_triangle_topo(), ctrls)
+        a, b, c = ctrls
+        a.graph['s1']['sw1']['used'] = 40.0
+        scheduler = sync_scheduler('ring')
+        for i in range(3):
+            sim.sync_ctrls(scheduler=scheduler)
+        for ctrl in (b, c):
+            self.assertEqual(ctrl.graph['s1']['sw1']['sync_learned'], 40.0)
+            self.assertEqual(ctrl.graph['s1']['sw1']['used'], 0.0)
+
+    def test_gossip(self):
+        """Assert that gossip picks fanout distinct peers, reproducibly"""
+        scheduler = sync_scheduler('gossip', fanout=2, seed=3)
+        pushes = scheduler.pushes(self.ctrls, 0)
+        self.assertEqual(len(pushes), 8)
+        for src in self.ctrls:
+            peers = [dst for s, dst in pushes if s is src]
+            self.assertEqual(len(set(peers)), 2)
+            self.assertFalse(src in peers)
+        scheduler.reset(self.ctrls)
+        self.assertEqual(scheduler.pushes(self.ctrls, 0), pushes)
+
+        self.sim.sync_ctrls(scheduler=sync_scheduler('gossip', fanout=3))
+        self.assertTrue(self.knows_all())
+
+    def test_pairwise(self):
+        """Assert that each pair syncs at its own period"""
+        a, b, c, d = self.ctrls
+        scheduler = sync_scheduler('pairwise', periods={('c0', 'c1'): 4,
+                                                        ('c2', 'c3'): 2},
+                                   default_period=None)
+        self.assertEqual(scheduler.pushes(self.ctrls, 1), [])
+        self.assertEqual(scheduler.pushes(self.ctrls, 2), [(c, d)])
+        self.assertEqual(scheduler.pushes(self.ctrls, 3), [])
+        self.assertEqual(scheduler.pushes(self.ctrls, 4), [(a, b), (c, d)])
+
+    def test_run_with_sync_topology(self):
+        """Assert that runs use the chosen sync topology"""
+        workload = unit_workload(sw=['sw1', 'sw2'], size=1,
+                                 duration=3, numreqs=10)
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        full = sim.run(workload)
+        # With two controllers, a ring is all-to-all
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        self.assertEqual(sim.run(workload, sync='ring'), full)
+        sim = LinkBalancerSim(two_switch_topo(), two_ctrls())
+        self.assertEqual(sim.run_events(workload,
+                                        sync={'topology': 'tree'}), full)
+        self.assertRaises(Exception, sim.run, workload, sync='nonsense')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+#
+# Dan Levin <dlevin@net.t-labs.tu-berlin.de>
+# Brandon Heller <brandonh@stanford.edu>
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from test_helper import *
+
+if __name__ == '__main__':
+    # set up include path for direct test invocation during development
+    sys.path.append(os.path.dirname(__file__) + "/..")
+
+from sim.workload import *
+
+###############################################################################
+
+class WorkloadFileTest(unittest.TestCase):
+    """Unit tests for reading and writing workload files"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.workload = [(0.25, 'sw1', 1, 2), (0.5, 'sw2', 1, 1),
+                         (1.125, 'sw1', 3, 2.5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_streaming_roundtrip(self):
+        """Assert that read_workload yields what write_workload wrote"""
+        filename = os.path.join(self.dir, 'test.workload')
+        write_workload(iter(self.workload), filename)
+        requests = read_workload(filename)
+        self.assertEqual(next(requests), self.workload[0])
+        self.assertEqual(list(requests), self.workload[1:])
+
+    def test_read_indented_json(self):
+        """Assert that workloads in indented JSON format are still read"""
+        filename = os.path.join(self.dir, 'test.workload')
+        f = open(filename, 'w')
+        print >>f, json.dumps(self.workload, sort_keys=True, indent=4)
+        f.close()
+        self.assertEqual(list(read_workload(filename)), self.workload)
+
+    def test_binary_roundtrip(self):
+        """Assert that a binary workload maps back to the written requests"""
+        filename = os.path.join(self.dir, 'test.binworkload')
+        write_binary_workload(iter(self.workload), filename)
+        self.assertTrue(is_binary_workload(filename))
+
+        switches, records = load_binary_workload(filename)
+        self.assertEqual(len(records), len(self.workload))
+        self.assertEqual(sorted(switches), ['sw1', 'sw2'])
+        self.assertEqual(list(records['time']), [0.25, 0.5, 1.125])
+        self.assertEqual(list(read_workload(filename)), self.workload)
+
+    def test_binary_json_conversion(self):
+        """Assert that converting to binary and back preserves a workload"""
+        src = os.path.join(self.dir, 'src.workload')
+        binary = os.path.join(self.dir, 'test.binworkload')
+        dst = os.path.join(self.dir, 'dst.workload')
+        f = open(src, 'w')
+        print >>f, json.dumps(self.workload, sort_keys=True, indent=4)
+        f.close()
+
+        json_to_binary_workload(src, binary)
+        binary_to_json_workload(binary, dst)
+        self.assertEqual(open(src).read(), open(dst).read())
+
+
+class ExpoWorkloadTest(unittest.TestCase):
+    """Unit tests for the exponential inter-arrival workload generator"""
+
+    def test_expo_arrays(self):
+        """Assert that requests of any number of switches are merged by time"""
+        timesteps = 64
+        times, switch_ids, sizes, durations = expo_arrays(
+            numswitches=3, period=16, timesteps=timesteps,
+            interarrival_alpha=10, duration_shape=0.5, seed=1)
+        self.assertTrue(len(times) > 0)
+        self.assertTrue((times[1:] >= times[:-1]).all())
+        self.assertTrue(((times >= 0) & (times < timesteps)).all())
+        self.assertEqual(sorted(set(switch_ids)), [0, 1, 2])
+        self.assertTrue((sizes == 1).all())
+        self.assertTrue((durations >= 1).all())
+
+    def test_expo_rate_follows_wave(self):
+        """Assert that a switch sees more arrivals at its rate's peak"""
+        period = 16
+        times, switch_ids, sizes, durations = expo_arrays(
+            numswitches=1, period=period, timesteps=period * 64,
+            interarrival_alpha=10, duration_shape=0.5, seed=1)
+        phase = times % period
+        peak = ((phase >= period / 4.0) & (phase < period * 3 / 4.0)).sum()
+        self.assertTrue(peak > 0.6 * len(times))
+
+    def test_expo_seed_reproducible(self):
+        """Assert that a seed determines the workload, even when parallel"""
+        args = dict(numswitches=2, period=16, timesteps=64,
+                    interarrival_alpha=10, duration_shape=0.5)
+        one = expo_arrays(seed=7, **args)
+        two = expo_arrays(seed=7, processes=2, **args)
+        other = expo_arrays(seed=8, **args)
+        for a, b in zip(one, two):
+            self.assertEqual(a.tolist(), b.tolist())
+        self.assertNotEqual(one[0].tolist(), other[0].tolist())
+
+        # A switch's requests only depend on the seed and its own index
+        times, durations = expo_switch_arrays(7, 1, 16, 0, 64, 10, 0.5)
+        self.assertEqual(one[0][one[1] == 1].tolist(), times.tolist())
+
+    def test_expo_workload_file(self):
+        """Assert that expo_workload regenerates the same seeded workload,
+        and that unreadable workload files are reported"""
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, 'expo.workload')
+            args = dict(switches=['sw1', 'sw2'], period=16, timesteps=64,
+                        interarrival_alpha=10, duration_shape=0.5, seed=3,
+                        filename=filename)
+            created = expo_workload(**args)
+            self.assertEqual(list(read_workload(filename)), created)
+            self.assertEqual(read_workload_header(filename)['args']['seed'], 3)
+            os.remove(filename)
+            self.assertEqual(expo_workload(**args), created)
+
+            f = open(filename, 'w')
+            f.write('[0.5, "sw1"')
+            f.close()
+            self.assertRaises(ValueError, expo_workload, **args)
+        finally:
+            shutil.rmtree(dir)
+
+    def test_expo_workload_file_seed(self):
+        """Assert that expo_workload only reads a file generated with the
+        requested seed, and records the seed it picks"""
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, 'expo.workload')
+            args = dict(switches=['sw1', 'sw2'], period=16, timesteps=64,
+                        interarrival_alpha=10, duration_shape=0.5,
+                        filename=filename)
+            three = expo_workload(seed=3, **args)
+            four = expo_workload(seed=4, **args)
+            self.assertNotEqual(four, three)
+            self.assertEqual(read_workload_header(filename)['args']['seed'], 4)
+            # Any seed will do
+            self.assertEqual(expo_workload(**args), four)
+            self.assertEqual(expo_workload(seed=3, **args), three)
+
+            os.remove(filename)
+            picked = expo_workload(**args)
+            seed = read_workload_header(filename)['args']['seed']
+            os.remove(filename)
+            self.assertEqual(expo_workload(seed=seed, **args), picked)
+
+            # Files of earlier versions record no seed
+            write_workload(three, filename)
+            self.assertEqual(expo_workload(**args), three)
+            self.assertRaises(ValueError, expo_workload, seed=3, **args)
+        finally:
+            shutil.rmtree(dir)
+
+    def test_random_int_workload_seed(self):
+        """Assert that a seeded random_int_workload is reproducible"""
+        one = random_int_workload(['sw1', 'sw2'], 1, 1, 20, seed=5)
+        two = random_int_workload(['sw1', 'sw2'], 1, 1, 20, seed=5)
+        self.assertEqual(one, two)
+
+
+class ColumnarWorkloadTest(unittest.TestCase):
+    """Unit tests for the columnar Workload container"""
+
+    def setUp(self):
+        self.requests = [(0.25, 'sw1', 1, 2), (0.5, 'sw2', 1, 1),
+                         (1.125, 'sw1', 3, 2.5), (2.0, 'sw3', 1, 1)]
+        self.workload = Workload.from_tuples(self.requests)
+
+    def test_tuples_roundtrip(self):
+        """Assert that converting from and to tuples is lossless"""
+        self.assertEqual(len(self.workload), 4)
+        self.assertEqual(self.workload.switches, ['sw1', 'sw2', 'sw3'])
+        self.assertEqual(self.workload.switch_ids.tolist(), [0, 1, 0, 2])
+        self.assertEqual(self.workload.to_tuples(), self.requests)
+        # Iteration can be repeated
+        self.assertEqual(list(self.workload), self.requests)
+        self.assertEqual(self.workload[2], self.requests[2])
+
+    def test_slicing(self):
+        """Assert that positional and time window slices select requests"""
+        self.assertEqual(self.workload[1:3].to_tuples(), self.requests[1:3])
+        self.assertEqual(self.workload.window(0.5, 2.0).to_tuples(),
+                         self.requests[1:3])
+        self.assertEqual(self.workload.window(1).to_tuples(),
+                         self.requests[2:])
+        self.assertEqual(len(self.workload.window(3, 4)), 0)
+
+    def test_binary_file(self):
+        """Assert that a Workload is written and memory-mapped as records"""
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, 'columnar.workload')
+            write_binary_workload(self.workload, filename)
+            loaded = Workload.load(filename)
+            self.assertEqual(loaded.to_tuples(), self.requests)
+            self.assertEqual(list(read_workload(filename)), self.requests)
+        finally:
+            shutil.rmtree(dir)
+
+
+class GenericWorkloadTest(unittest.TestCase):
+    """Unit tests for the vectorized deterministic workload generators"""
+
+    def test_demand_counts(self):
+        """Assert that workload functions are evaluated on all timesteps"""
+        switches, counts = demand_counts({'sw2': lambda t: 2 * t,
+                                          'sw1': lambda t: 3}, 2, 4)
+        self.assertEqual(switches, ['sw1', 'sw2'])
+        self.assertEqual(counts.tolist(), [[1, 0], [1, 1], [1, 2], [1, 3]])
+
+    def test_dual_offset_arrays(self):
+        """Assert that the columnar workload matches the converted old one"""
+        for fcn in [sawtooth, wave]:
+            args = dict(switches=['sw1', 'sw2'], period=16, offset=8,
+                        max_demand=5, size=1, duration=2, timesteps=64,
+                        workload_fcn=fcn, y_shift=(1.0/3))
+            expected = old_to_new(dual_offset_workload(**args))
+            self.assertEqual(dual_offset_arrays(**args).to_tuples(), expected)
+
+    def test_generic_workload(self):
+        """Assert that the old-style lists hold the requests of each timestep,
+        and that workload functions return floats for single timesteps"""
+        workload = generic_workload({'sw2': lambda t: 2 * t,
+                                     'sw1': lambda t: 3}, 2, 1, 4)
+        self.assertEqual(workload, [[('sw1', 2, 1)],
+                                    [('sw1', 2, 1), ('sw2', 2, 1)],
+                                    [('sw1', 2, 1)] + [('sw2', 2, 1)] * 2,
+                                    [('sw1', 2, 1)] + [('sw2', 2, 1)] * 3])
+        for fcn in [sawtooth, wave]:
+            self.assertEqual(type(fcn(3, 8, 2, 5)), float)
+            self.assertEqual(fcn(3, 8, 2, 5), fcn(np.arange(4), 8, 2, 5)[3])
+
+
+if __name__ == '__main__':
+    unittest.main()